@@ -0,0 +1,607 @@
+# analytics_store.py
+
+import argparse
+import atexit
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single worker process is assumed
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Event partitions and rollup tables live under this directory
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", os.path.join(BASE_DIR, "analytics"))
+
+# Buffered events are written once this many accumulate or this many seconds pass
+ANALYTICS_FLUSH_EVENTS = int(os.getenv("ANALYTICS_FLUSH_EVENTS", 200))
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", 30))
+
+# Events kept for retry while writes fail; the oldest are dropped beyond this
+ANALYTICS_MAX_BUFFER_EVENTS = int(os.getenv("ANALYTICS_MAX_BUFFER_EVENTS", 50000))
+
+# Hourly rollup rows older than this are dropped; daily rollups are kept
+HOURLY_RETENTION_DAYS = int(os.getenv("ANALYTICS_HOURLY_RETENTION_DAYS", 90))
+
+EVENT_SCHEMA = pa.schema([
+    ("event_time", pa.timestamp("us", tz="UTC")),
+    ("user_id", pa.string()),
+    ("ailment", pa.string()),
+    ("drink", pa.string()),
+    ("sustainability_score", pa.float64()),
+    ("weather_adjusted", pa.bool_())
+])
+
+# Directory mtimes younger than this are not trusted to skip a partition
+MTIME_SETTLE_NS = 2 * 10 ** 9
+
+# Rollup grain: one row per time bucket and dimension combination
+ROLLUP_KEYS = ["bucket", "ailment", "drink", "weather_adjusted"]
+GRANULARITIES = {"hourly": "hour", "daily": "day"}
+
+DIMENSIONS = ("ailment", "drink")
+
+class AnalyticsStore:
+    """
+    Cross-user recommendation events in partitioned Parquet, with hourly and
+    daily rollups for dashboards.
+
+    Events are buffered and written as one file per day partition
+    (events/date=YYYY-MM-DD/). After each write, new event files are
+    folded into the rollup tables; a manifest of processed files per
+    partition makes this incremental and safe to re-run after a crash, and
+    past days are compacted into one file each once a day. Several processes
+    may share the directory: rollup updates are serialized with a file lock.
+    Queries read only the rollups, which stay small however many events arrive.
+    """
+
+    def __init__(self, root=ANALYTICS_DIR, flush_events=ANALYTICS_FLUSH_EVENTS,
+                 flush_seconds=ANALYTICS_FLUSH_SECONDS):
+        self.root = root
+        self.events_dir = os.path.join(root, "events")
+        self.rollups_dir = os.path.join(root, "rollups")
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flusher = None
+        self._rollup_cache = {}
+        self._listeners = []
+        # Partition directory mtimes this process has seen fully rolled up
+        self._listed = {}
+        self._compacted_on = None
+
+    # Ingestion
+
+    def record(self, user_id, recommendation, timestamp=None):
+        """Buffer one recommendation event; never raises into the caller's request."""
+        try:
+            event = {
+                "event_time": timestamp or datetime.now(timezone.utc),
+                "user_id": str(user_id),
+                "ailment": str(recommendation.get("ailment", "")),
+                "drink": str(recommendation.get("drink", "")),
+                "sustainability_score": float(recommendation.get("sustainability_score") or 0.0),
+                "weather_adjusted": bool(recommendation.get("weather_adjusted", False))
+            }
+        except (TypeError, ValueError) as e:
+            print(f"Skipping analytics event: {e}")
+            return
+        with self._lock:
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.flush_events
+            if self._flusher is None and self.flush_seconds > 0:
+                self._flusher = threading.Thread(target=self._flush_periodically, name="analytics-flush", daemon=True)
+                self._flusher.start()
+        if full:
+            self.flush()
+
+    def add_listener(self, callback):
+        """Call `callback(events)` with each batch of events after it is written."""
+        self._listeners.append(callback)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered events and fold them into the rollups.
+
+        Events that could not be written are buffered again for the next flush
+        (up to ANALYTICS_MAX_BUFFER_EVENTS); listeners only see written events.
+
+        Returns:
+            int: Number of events written.
+        """
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        if not events:
+            return 0
+        try:
+            self.write_events(events)
+        except (OSError, pa.ArrowException) as e:
+            print(f"Analytics flush error: {e}")
+            with self._lock:
+                self._buffer[:0] = events
+                dropped = len(self._buffer) - ANALYTICS_MAX_BUFFER_EVENTS
+                if dropped > 0:
+                    del self._buffer[:dropped]
+                    print(f"Dropped the {dropped} oldest unwritten analytics events")
+            return 0
+        try:
+            self.refresh_rollups()
+            # Past days stop receiving live events, so their files are merged once a day
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            if self._compacted_on != today:
+                self.compact(today)
+                self._compacted_on = today
+        except (OSError, pa.ArrowException) as e:
+            # The written files are folded in by the next refresh
+            print(f"Analytics rollup error: {e}")
+        self.notify_listeners(events)
+        return len(events)
+
+    def notify_listeners(self, events):
+        """Pass a batch of written events to every listener; a failing listener is logged."""
+        for callback in self._listeners:
+            try:
+                callback(events)
+            except Exception as e:
+                print(f"Analytics listener error: {e}")
+
+    def write_events(self, events):
+        """Write events as one Parquet file per day partition, all or none."""
+        table = pa.Table.from_pylist(events, schema=EVENT_SCHEMA)
+        days = pc.floor_temporal(table["event_time"], unit="day")
+        parts = []
+        try:
+            for day in pc.unique(days).to_pylist():
+                part = table.filter(pc.equal(days, pa.scalar(day, type=days.type)))
+                directory = os.path.join(self.events_dir, f"date={day:%Y-%m-%d}")
+                os.makedirs(directory, exist_ok=True)
+                name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{uuid.uuid4().hex[:8]}.parquet"
+                path = os.path.join(directory, name)
+                pq.write_table(part, f"{path}.{os.getpid()}.tmp")
+                parts.append(path)
+        except BaseException:
+            for path in parts:
+                os.remove(f"{path}.{os.getpid()}.tmp")
+            raise
+        for path in parts:
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def event_keys(self):
+        """(user_id, event_time) of every stored event, for de-duplicating imports."""
+        keys = set()
+        for name in self._event_files():
+            table = pq.ParquetFile(os.path.join(self.events_dir, name)).read(columns=["user_id", "event_time"])
+            keys.update(zip(table["user_id"].to_pylist(), table["event_time"].to_pylist()))
+        return keys
+
+    # Rollups
+
+    def _locked(self):
+        return _FileLock(os.path.join(self.root, ".rollup.lock"))
+
+    def _manifest_path(self, partition):
+        return os.path.join(self.rollups_dir, "processed", f"{partition}.json")
+
+    def _read_manifest(self, partition):
+        """The partition directory mtime last listed and the files already rolled up."""
+        try:
+            with open(self._manifest_path(partition), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            return manifest["mtime_ns"], set(manifest["files"])
+        except FileNotFoundError:
+            return None, set()
+
+    def _write_manifest(self, partition, mtime_ns, files):
+        path = self._manifest_path(partition)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"mtime_ns": mtime_ns, "files": sorted(files)}, f)
+        os.replace(tmp_path, path)
+
+    def _migrate_manifest(self):
+        """Split the single manifest of earlier versions into per-partition ones."""
+        legacy = os.path.join(self.rollups_dir, "processed.json")
+        if not os.path.exists(legacy):
+            return
+        with open(legacy, 'r', encoding='utf-8') as f:
+            by_partition = {}
+            for name in json.load(f):
+                by_partition.setdefault(os.path.dirname(name), set()).add(os.path.basename(name))
+        for partition, files in by_partition.items():
+            self._write_manifest(partition, None, files)
+        os.remove(legacy)
+
+    def _partitions(self):
+        try:
+            return sorted(entry.name for entry in os.scandir(self.events_dir)
+                          if entry.is_dir() and entry.name.startswith("date="))
+        except FileNotFoundError:
+            return []
+
+    def _partition_files(self, partition):
+        return sorted(name for name in os.listdir(os.path.join(self.events_dir, partition))
+                      if name.endswith(".parquet"))
+
+    def _event_files(self):
+        return [os.path.join(partition, name)
+                for partition in self._partitions() for name in self._partition_files(partition)]
+
+    def refresh_rollups(self):
+        """
+        Fold event files not yet in their partition's manifest into the rollup tables.
+
+        Partitions whose directory has not changed since they were last listed
+        are skipped, so a refresh costs the same however many days are stored.
+
+        Returns:
+            int: Number of event files processed.
+        """
+        os.makedirs(self.rollups_dir, exist_ok=True)
+        with self._locked():
+            self._migrate_manifest()
+            updates = {}
+            new_files = []
+            now_ns = time.time_ns()
+            for partition in self._partitions():
+                mtime_ns = os.stat(os.path.join(self.events_dir, partition)).st_mtime_ns
+                if self._listed.get(partition) == mtime_ns:
+                    continue
+                # A file added within the filesystem's timestamp granularity of
+                # this listing may not move the mtime; re-list until it settles
+                if now_ns - mtime_ns < MTIME_SETTLE_NS:
+                    mtime_ns = None
+                listed_mtime, processed = self._read_manifest(partition)
+                if mtime_ns is None or listed_mtime != mtime_ns:
+                    names = self._partition_files(partition)
+                    fresh = [name for name in names if name not in processed]
+                    new_files.extend(os.path.join(partition, name) for name in fresh)
+                    files = (processed & set(names)) | set(fresh)
+                    if files != processed or listed_mtime != mtime_ns:
+                        updates[partition] = (mtime_ns, files)
+                if mtime_ns is not None:
+                    self._listed[partition] = mtime_ns
+            if new_files:
+                events = pa.concat_tables(
+                    [pq.ParquetFile(os.path.join(self.events_dir, name)).read() for name in new_files]
+                )
+                for granularity in GRANULARITIES:
+                    self._merge_rollup(granularity, _aggregate(events, GRANULARITIES[granularity]))
+            for partition, (mtime_ns, files) in updates.items():
+                self._write_manifest(partition, mtime_ns, files)
+        return len(new_files)
+
+    def rebuild_rollups(self):
+        """Recompute every rollup from all event files."""
+        with self._locked():
+            for granularity in GRANULARITIES:
+                path = self._rollup_path(granularity)
+                if os.path.exists(path):
+                    os.remove(path)
+            shutil.rmtree(os.path.join(self.rollups_dir, "processed"), ignore_errors=True)
+            legacy = os.path.join(self.rollups_dir, "processed.json")
+            if os.path.exists(legacy):
+                os.remove(legacy)
+            self._listed.clear()
+        return self.refresh_rollups()
+
+    def _rollup_path(self, granularity):
+        return os.path.join(self.rollups_dir, f"{granularity}.parquet")
+
+    def _merge_rollup(self, granularity, delta):
+        path = self._rollup_path(granularity)
+        if os.path.exists(path):
+            delta = pa.concat_tables([pq.read_table(path), delta])
+        merged = delta.group_by(ROLLUP_KEYS).aggregate([("events", "sum"), ("sustainability_sum", "sum")])
+        merged = merged.rename_columns([
+            "events" if name == "events_sum" else "sustainability_sum" if name == "sustainability_sum_sum" else name
+            for name in merged.column_names
+        ])
+        if granularity == "hourly":
+            cutoff = datetime.now(timezone.utc) - timedelta(days=HOURLY_RETENTION_DAYS)
+            merged = merged.filter(pc.greater_equal(merged["bucket"], pa.scalar(cutoff, type=merged["bucket"].type)))
+        _write_atomic(merged.sort_by([("bucket", "ascending")]), path)
+
+    def compact(self, before=None):
+        """
+        Merge each event partition older than `before` (default: today) into one file.
+
+        Returns:
+            int: Number of partitions compacted.
+        """
+        before = before or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        compacted = 0
+        with self._locked():
+            self._migrate_manifest()
+            for partition in self._partitions():
+                if partition.split("=", 1)[1] >= before:
+                    continue
+                names = self._partition_files(partition)
+                _, processed = self._read_manifest(partition)
+                # Only fully rolled-up partitions, so the rollups never count an event twice
+                if len(names) < 2 or not set(names) <= processed:
+                    continue
+                table = pa.concat_tables(
+                    [pq.ParquetFile(os.path.join(self.events_dir, partition, n)).read() for n in names]
+                )
+                merged_name = f"compacted-{uuid.uuid4().hex[:8]}.parquet"
+                _write_atomic(table, os.path.join(self.events_dir, partition, merged_name))
+                # The directory changes below, so the next refresh lists it once more
+                self._write_manifest(partition, None, {merged_name})
+                for name in names:
+                    os.remove(os.path.join(self.events_dir, partition, name))
+                compacted += 1
+        return compacted
+
+    # Queries
+
+    def rollup(self, granularity="daily", start=None, end=None):
+        """
+        Get rollup rows as a DataFrame with columns bucket, ailment, drink,
+        weather_adjusted, events and sustainability_sum.
+
+        The table is re-read only when its file changes.
+        """
+        path = self._rollup_path(granularity)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return pd.DataFrame(columns=ROLLUP_KEYS + ["events", "sustainability_sum"])
+        cached = self._rollup_cache.get(granularity)
+        if cached is None or cached[0] != mtime:
+            cached = self._rollup_cache[granularity] = (mtime, pq.read_table(path).to_pandas())
+        df = cached[1]
+        if start is not None:
+            df = df[df["bucket"] >= _utc(start)]
+        if end is not None:
+            df = df[df["bucket"] < _utc(end)]
+        return df
+
+    def summary(self, start=None, end=None):
+        """Total events, weather-adjusted share (%) and average sustainability score."""
+        df = self.rollup("daily", start, end)
+        events = int(df["events"].sum())
+        if not events:
+            return {"total_recommendations": 0, "weather_adjusted_percent": 0.0, "avg_sustainability": 0.0}
+        return {
+            "total_recommendations": events,
+            "weather_adjusted_percent": float(df.loc[df["weather_adjusted"], "events"].sum() / events * 100),
+            "avg_sustainability": float(df["sustainability_sum"].sum() / events)
+        }
+
+    def top(self, dimension, start=None, end=None, limit=10):
+        """Most frequent ailments or drinks, as a DataFrame of (dimension, events)."""
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"dimension must be one of {DIMENSIONS}")
+        df = self.rollup("daily", start, end)
+        return (df.groupby(dimension, as_index=False)["events"].sum()
+                  .nlargest(limit, "events").reset_index(drop=True))
+
+    def trend(self, start=None, end=None, granularity="daily"):
+        """
+        Events, weather-adjusted share (%) and average sustainability per bucket.
+        """
+        df = self.rollup(granularity, start, end)
+        df = df.assign(weather_events=df["events"].where(df["weather_adjusted"], 0))
+        trend = df.groupby("bucket", as_index=False)[["events", "sustainability_sum", "weather_events"]].sum()
+        trend["avg_sustainability"] = trend["sustainability_sum"] / trend["events"]
+        trend["weather_adjusted_percent"] = trend["weather_events"] / trend["events"] * 100
+        return trend[["bucket", "events", "avg_sustainability", "weather_adjusted_percent"]]
+
+def _aggregate(events, unit):
+    bucketed = events.append_column("bucket", pc.floor_temporal(events["event_time"], unit=unit))
+    delta = bucketed.group_by(ROLLUP_KEYS).aggregate([("user_id", "count"), ("sustainability_score", "sum")])
+    return delta.rename_columns([
+        "events" if name == "user_id_count" else "sustainability_sum" if name == "sustainability_score_sum" else name
+        for name in delta.column_names
+    ]).select(ROLLUP_KEYS + ["events", "sustainability_sum"])
+
+def _utc(moment):
+    moment = pd.Timestamp(moment)
+    return moment.tz_localize("UTC") if moment.tzinfo is None else moment.tz_convert("UTC")
+
+def _write_atomic(table, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+
+class _FileLock:
+    """Exclusive advisory lock on a file, held for the duration of a with block."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """
+    The process-wide analytics store, flushed at exit.
+
+    The drink similarity index listens from the start, so every event written
+    by this process reaches it.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from drink_similarity import index_events
+
+                store = AnalyticsStore()
+                store.add_listener(index_events)
+                atexit.register(store.flush)
+                _store = store
+    return _store
+
+def record_recommendation(user_id, recommendation, timestamp=None):
+    get_store().record(user_id, recommendation, timestamp)
+
+def generate_global_visualizations(days=30, store=None):
+    """Charts of every user's recommendations over the last `days` days, or None if there are none."""
+    import plotly.express as px
+
+    store = store or get_store()
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    summary = store.summary(start)
+    if not summary["total_recommendations"]:
+        return None
+    trend = store.trend(start)
+    return {
+        'summary': summary,
+        'top_ailments': px.bar(store.top("ailment", start), x='ailment', y='events', title='Top Ailments'),
+        'top_drinks': px.bar(store.top("drink", start), x='drink', y='events', title='Top Drinks'),
+        'sustainability_trend': px.line(trend, x='bucket', y='avg_sustainability', title='Average Sustainability Score'),
+        'weather_share': px.line(trend, x='bucket', y='weather_adjusted_percent', title='Weather-Adjusted Recommendations (%)')
+    }
+
+def _profile_time(timestamp):
+    """A profile's naive local ISO timestamp as a UTC datetime."""
+    moment = datetime.fromisoformat(timestamp)
+    return moment.astimezone(timezone.utc) if moment.tzinfo is None else moment
+
+def _rollup_events(user_id, day, rollup):
+    """
+    Events standing in for a profile's daily rollup of older history.
+
+    A rollup keeps ailment and drink counts separately, so ailments are
+    paired with drinks in order; per-ailment and per-drink totals, the
+    weather-adjusted count and the sustainability sum match the rolled-up
+    entries. Events get distinct times from the day's midnight onwards.
+    """
+    count = rollup.get("count", 0)
+    if not count:
+        return []
+    ailments = [name for name, n in sorted(rollup.get("ailments", {}).items()) for _ in range(n)]
+    drinks = [name for name, n in sorted(rollup.get("drinks", {}).items()) for _ in range(n)]
+    midnight = _profile_time(day)
+    score = float(rollup.get("sustainability_sum") or 0.0) / count
+    weather_adjusted = rollup.get("weather_adjusted", 0)
+    return [
+        {
+            "event_time": midnight + timedelta(microseconds=i),
+            "user_id": user_id,
+            "ailment": str(ailments[i]) if i < len(ailments) else "",
+            "drink": str(drinks[i]) if i < len(drinks) else "",
+            "sustainability_score": score,
+            "weather_adjusted": i < weather_adjusted
+        }
+        for i in range(count)
+    ]
+
+def backfill_profiles(profile_dir="user_profiles", store=None):
+    """
+    Ingest every saved user profile, e.g. once after upgrading: its raw
+    history and the daily rollups its older history was folded into.
+
+    Events already in the store, whether recorded live or by an earlier
+    backfill, are skipped, so the backfill can be re-run safely. Raw entries
+    are matched by (user_id, timestamp); a rollup day only gets stand-in
+    events for entries the store has no event for on that day. Added events
+    are passed to the store's listeners like flushed ones.
+
+    Returns:
+        int: Number of events added.
+    """
+    store = store or get_store()
+    store.flush()
+    stored = {}
+    for user_id, event_time in store.event_keys():
+        stored.setdefault(user_id, set()).add(event_time)
+
+    events = []
+    for path in glob.glob(os.path.join(profile_dir, "*.json")):
+        user_id = os.path.splitext(os.path.basename(path))[0]
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {path}: {e}")
+            continue
+        user_times = stored.get(user_id, set())
+        raw = []
+        for entry in data.get("history", []):
+            raw.append({
+                "event_time": _profile_time(entry["timestamp"]),
+                "user_id": user_id,
+                "ailment": str(entry.get("ailment", "")),
+                "drink": str(entry.get("drink", "")),
+                "sustainability_score": float(entry.get("sustainability_score") or 0.0),
+                "weather_adjusted": bool(entry.get("weather_adjusted", False))
+            })
+        raw_times = {event["event_time"] for event in raw}
+
+        # Stored events that are not raw entries stand for rolled-up ones, per local day
+        covered = {}
+        for event_time in user_times - raw_times:
+            day = event_time.astimezone().date().isoformat()
+            covered[day] = covered.get(day, 0) + 1
+        for day, rollup in sorted(data.get("daily_rollups", {}).items()):
+            missing = rollup.get("count", 0) - covered.get(day, 0)
+            if missing > 0:
+                events.extend(_rollup_events(user_id, day, rollup)[-missing:])
+        events.extend(event for event in raw if event["event_time"] not in user_times)
+    if events:
+        store.write_events(events)
+        store.refresh_rollups()
+        # The drink similarity index learns of events through the listeners
+        store.notify_listeners(events)
+    return len(events)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cross-user analytics store tools")
+    parser.add_argument("--backfill", metavar="PROFILE_DIR", help="ingest saved user profile histories")
+    parser.add_argument("--refresh", action="store_true", help="fold new event files into the rollups")
+    parser.add_argument("--rebuild", action="store_true", help="recompute rollups from every event file")
+    parser.add_argument("--compact", action="store_true", help="merge small event files of past days")
+    parser.add_argument("--days", type=int, default=30, help="period shown by the summary")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.backfill:
+        print(f"Ingested {backfill_profiles(args.backfill, store)} events")
+    if args.rebuild:
+        print(f"Rebuilt rollups from {store.rebuild_rollups()} event files")
+    elif args.refresh:
+        print(f"Processed {store.refresh_rollups()} event files")
+    if args.compact:
+        print(f"Compacted {store.compact()} partitions")
+
+    start = datetime.now(timezone.utc) - timedelta(days=args.days)
+    began = time.perf_counter()
+    summary = store.summary(start)
+    top_ailments = store.top("ailment", start, limit=5)
+    elapsed = (time.perf_counter() - began) * 1000
+    print(json.dumps(summary, indent=2))
+    print(top_ailments.to_string(index=False))
+    print(f"Queried in {elapsed:.1f} ms")
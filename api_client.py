@@ -0,0 +1,148 @@
+# api_client.py
+
+import json
+import os
+import threading
+import requests
+from messages import templated_message
+
+# Base URL of a running api_server.py
+API_URL = os.getenv("SIPSYNC_API_URL", "http://127.0.0.1:8080").rstrip("/")
+API_TIMEOUT = float(os.getenv("SIPSYNC_API_TIMEOUT", 30))
+
+_local = threading.local()
+
+def _session():
+    """One keep-alive session per thread; requests sessions are not thread-safe."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        _local.session = session
+    return session
+
+def _post(path, payload, stream=False):
+    response = _session().post(f"{API_URL}{path}", json=payload, timeout=API_TIMEOUT, stream=stream)
+    response.raise_for_status()
+    return response if stream else response.json()
+
+def generate_response(user_input, drink_type="tea", latitude=None, longitude=None, language="en",
+                      dietary_restrictions=None):
+    """
+    Generate a personalized (and optionally translated) recommendation via the API.
+    """
+    try:
+        return _post("/v1/recommendations", {
+            "user_input": user_input,
+            "drink_type": drink_type,
+            "latitude": latitude,
+            "longitude": longitude,
+            "language": language,
+            "dietary_restrictions": dietary_restrictions or []
+        })
+    except Exception as e:
+        print(f"Recommendation API error: {e}")
+        return {
+            "status": "error",
+            "message": "The recommendation service is unavailable. Please try again.",
+            "ailment": user_input
+        }
+
+def resolve_recommendation(user_input, drink_type="tea", latitude=None, longitude=None, dietary_restrictions=None):
+    """
+    Resolve a recommendation without its personalized message via the API.
+    """
+    try:
+        return _post("/v1/recommendations/resolve", {
+            "user_input": user_input,
+            "drink_type": drink_type,
+            "latitude": latitude,
+            "longitude": longitude,
+            "dietary_restrictions": dietary_restrictions or []
+        })
+    except Exception as e:
+        print(f"Recommendation API error: {e}")
+        return {
+            "status": "error",
+            "message": "The recommendation service is unavailable. Please try again.",
+            "ailment": user_input
+        }
+
+def stream_personalized_message(recommendation):
+    """
+    Stream the personalized message from the API, mirroring backend.stream_personalized_message.
+    """
+    if recommendation.get("status") != "success":
+        return
+    if "personalized_message" in recommendation:
+        yield recommendation["personalized_message"]
+        return
+
+    chunks = []
+    personalized_message = None
+    try:
+        response = _post("/v1/messages", {"recommendation": recommendation}, stream=True)
+        with response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "text" in event:
+                    chunks.append(event["text"])
+                    yield event["text"]
+                elif "personalized_message" in event:
+                    personalized_message = event["personalized_message"]
+    except Exception as e:
+        print(f"Message API error: {e}")
+
+    if not personalized_message:
+        personalized_message = "".join(chunks).strip()
+    if not personalized_message:
+        personalized_message = templated_message(recommendation)
+        yield personalized_message
+    recommendation["personalized_message"] = personalized_message
+
+def translate_recommendation(recommendation, target_lang='en'):
+    """
+    Translate a recommendation dictionary via the API.
+    """
+    if target_lang == 'en':
+        return recommendation
+    try:
+        return _post("/v1/translations", {"recommendation": recommendation, "language": target_lang})
+    except Exception as e:
+        print(f"Translation API error: {e}")
+        return recommendation
+
+def translate_text(text, target_lang='en'):
+    """
+    Translate text via the API.
+    """
+    try:
+        return _post("/v1/translations", {"text": text, "language": target_lang})["text"]
+    except Exception as e:
+        print(f"Translation API error: {e}")
+        return text
+
+def find_nearby_stores(latitude, longitude, ingredients):
+    """
+    Find nearby stores via the API.
+    """
+    try:
+        return _post("/v1/stores", {
+            "latitude": latitude,
+            "longitude": longitude,
+            "ingredients": ingredients
+        })["stores"]
+    except Exception as e:
+        print(f"Store API error: {e}")
+        return None
+
+def search_youtube(query, max_results=3):
+    """
+    Search YouTube videos via the API.
+    """
+    try:
+        return _post("/v1/videos", {"query": query, "max_results": max_results})["videos"]
+    except Exception as e:
+        print(f"Video API error: {e}")
+        return None
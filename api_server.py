@@ -0,0 +1,416 @@
+# api_server.py
+
+import argparse
+import json
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit
+from metrics import registry
+from dietary import diet_mask
+from result_cache import make_result_key
+from singleflight import flight
+
+# Time allowed to read or write a request once it has started, in seconds
+REQUEST_TIMEOUT = 15
+
+# Keep-alive connections idle this many seconds are closed; an idle
+# connection holds a pool thread while it waits for the next request
+KEEPALIVE_IDLE_TIMEOUT = float(os.getenv("SIPSYNC_KEEPALIVE_IDLE_TIMEOUT", 5))
+
+# Largest request body accepted, in bytes
+MAX_BODY_BYTES = 64 * 1024
+
+# Time allowed for in-flight requests to finish on shutdown, in seconds
+SHUTDOWN_GRACE_PERIOD = 30
+
+DRINK_TYPES = ["tea", "coffee", "milkshake", "light_food"]
+
+class ApiError(Exception):
+    """Error returned to the client as a JSON body with an HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+_services = None
+_services_lock = threading.Lock()
+
+def load_services():
+    """
+    Import the provider modules.
+
+    This runs inside each worker process after forking, so workers never share
+    SDK clients or pooled connections created at import time.
+    """
+    global _services
+    with _services_lock:
+        if _services is None:
+            import backend
+            import language_support
+            import maps
+            import youtube
+            _services = {
+                "backend": backend,
+                "language_support": language_support,
+                "maps": maps,
+                "youtube": youtube
+            }
+    return _services
+
+def _coordinate(payload, name):
+    value = payload.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ApiError(400, f"'{name}' must be a number")
+
+def _recommendation_args(payload):
+    user_input = payload.get("user_input")
+    if not isinstance(user_input, str) or not user_input.strip():
+        raise ApiError(400, "'user_input' must be a non-empty string")
+    drink_type = payload.get("drink_type", "tea")
+    if drink_type not in DRINK_TYPES:
+        raise ApiError(400, f"'drink_type' must be one of {DRINK_TYPES}")
+    return user_input, drink_type, _coordinate(payload, "latitude"), _coordinate(payload, "longitude")
+
+def _dietary_restrictions(payload):
+    restrictions = payload.get("dietary_restrictions") or []
+    if not isinstance(restrictions, list):
+        raise ApiError(400, "'dietary_restrictions' must be a list")
+    try:
+        diet_mask(restrictions)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+    return restrictions
+
+def _recommendation_payload(payload):
+    recommendation = payload.get("recommendation")
+    if not isinstance(recommendation, dict):
+        raise ApiError(400, "'recommendation' must be an object")
+    return recommendation
+
+def _recommend(user_input, drink_type, latitude, longitude, language, dietary_restrictions):
+    services = load_services()
+    recommendation = services["backend"].generate_response(
+        user_input, drink_type=drink_type, latitude=latitude, longitude=longitude,
+        dietary_restrictions=dietary_restrictions
+    )
+    if language != "en" and recommendation["status"] == "success":
+        recommendation = services["language_support"].translate_recommendation(recommendation, language)
+    return recommendation
+
+def handle_recommendation(payload):
+    """Full pipeline: resolve, personalize and optionally translate."""
+    user_input, drink_type, latitude, longitude = _recommendation_args(payload)
+    dietary_restrictions = _dietary_restrictions(payload)
+    language = payload.get("language", "en")
+    # Identical requests in flight share one pipeline run and translation
+    key = ("recommendation",) + make_result_key(
+        user_input, drink_type, latitude, longitude, language, dietary_restrictions
+    )
+    return flight.do(key, _recommend, user_input, drink_type, latitude, longitude, language, dietary_restrictions)
+
+def handle_resolve(payload):
+    """Resolve the ailment, weather and catalog entry without the personalized message."""
+    services = load_services()
+    user_input, drink_type, latitude, longitude = _recommendation_args(payload)
+    return services["backend"].resolve_recommendation(
+        user_input, drink_type=drink_type, latitude=latitude, longitude=longitude,
+        dietary_restrictions=_dietary_restrictions(payload)
+    )
+
+def handle_message(payload):
+    """Stream the personalized message as NDJSON chunks, ending with the final message."""
+    services = load_services()
+    recommendation = _recommendation_payload(payload)
+
+    def events():
+        for chunk in services["backend"].stream_personalized_message(recommendation):
+            yield {"text": chunk}
+        yield {"personalized_message": recommendation.get("personalized_message", "")}
+
+    return events()
+
+def handle_translation(payload):
+    """Translate either a single text or a recommendation."""
+    services = load_services()
+    language = payload.get("language", "en")
+    if "text" in payload:
+        return {"text": services["language_support"].translate_text(str(payload["text"]), language)}
+    recommendation = _recommendation_payload(payload)
+    return services["language_support"].translate_recommendation(recommendation, language)
+
+def handle_stores(payload):
+    services = load_services()
+    latitude = _coordinate(payload, "latitude")
+    longitude = _coordinate(payload, "longitude")
+    if latitude is None or longitude is None:
+        raise ApiError(400, "'latitude' and 'longitude' are required")
+    ingredients = payload.get("ingredients") or []
+    return {"stores": services["maps"].find_nearby_stores(latitude, longitude, ingredients)}
+
+def handle_videos(payload):
+    services = load_services()
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ApiError(400, "'query' must be a non-empty string")
+    max_results = payload.get("max_results", 3)
+    if not isinstance(max_results, int) or not 1 <= max_results <= 50:
+        raise ApiError(400, "'max_results' must be an integer between 1 and 50")
+    return {"videos": services["youtube"].search_youtube(query, max_results=max_results)}
+
+POST_ROUTES = {
+    "/v1/recommendations": handle_recommendation,
+    "/v1/recommendations/resolve": handle_resolve,
+    "/v1/messages": handle_message,
+    "/v1/translations": handle_translation,
+    "/v1/stores": handle_stores,
+    "/v1/videos": handle_videos
+}
+
+class RecommendationHandler(BaseHTTPRequestHandler):
+    """JSON API handler; HTTP/1.1 so clients can keep connections alive."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "SipSync/1.0"
+    timeout = REQUEST_TIMEOUT
+
+    def handle(self):
+        self.close_connection = True
+        self._handle_next_request()
+        while not self.close_connection:
+            self._handle_next_request()
+
+    def _handle_next_request(self):
+        # Wait for the request line on the short idle timeout; parse_request
+        # restores the full timeout once a request has arrived
+        self.connection.settimeout(KEEPALIVE_IDLE_TIMEOUT)
+        self.handle_one_request()
+
+    def parse_request(self):
+        self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/healthz":
+            self._send_json(200, {"status": "ok"})
+        elif path == "/metrics":
+            # Metrics are per worker process; scrape each worker or use --processes 1
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self._send_common_headers()
+            self.end_headers()
+            self.wfile.write(body)
+        elif path == "/metrics.json":
+            self._send_json(200, dict(registry.snapshot(), pid=os.getpid()))
+        else:
+            self._send_json(404, {"status": "error", "message": "Not found"})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        route = POST_ROUTES.get(path)
+        try:
+            payload = self._read_json()
+            if route is None:
+                raise ApiError(404, "Not found")
+            result = route(payload)
+        except ApiError as e:
+            self._send_json(e.status, {"status": "error", "message": e.message})
+            return
+        except Exception as e:
+            print(f"API error on {path}: {e}")
+            self._send_json(500, {"status": "error", "message": "Internal server error"})
+            return
+
+        if isinstance(result, dict):
+            self._send_json(200, result)
+        else:
+            self._send_stream(result)
+
+    def _read_json(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise ApiError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            # The unread body would corrupt the next request on this connection
+            self.close_connection = True
+            raise ApiError(413, "Request body too large")
+        body = self.rfile.read(length) if length else b"{}"
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise ApiError(400, "Request body must be valid JSON")
+        if not isinstance(payload, dict):
+            raise ApiError(400, "Request body must be a JSON object")
+        return payload
+
+    def _send_common_headers(self):
+        if self.server.draining.is_set():
+            self.send_header("Connection", "close")
+            self.close_connection = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self._send_common_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, events):
+        """Write an iterable of JSON events as chunked NDJSON."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self._send_common_headers()
+        self.end_headers()
+        try:
+            for event in events:
+                line = (json.dumps(event) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+        except Exception as e:
+            # Headers are already sent; drop the connection so the client sees a truncated stream
+            print(f"API stream error: {e}")
+            self.close_connection = True
+            return
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, format, *args):
+        if os.getenv("SIPSYNC_API_ACCESS_LOG"):
+            super().log_message(format, *args)
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTP server that handles connections on a bounded thread pool.
+
+    Connections beyond max_workers + max_pending are rejected with 503 instead
+    of queueing without limit.
+    """
+
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, handler, max_workers=16, max_pending=64):
+        super().__init__(address, handler)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sipsync-api")
+        self.slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self.draining = threading.Event()
+
+    def process_request(self, request, client_address):
+        if self.draining.is_set() or not self.slots.acquire(blocking=False):
+            self._reject(request)
+            return
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def _reject(self, request):
+        body = json.dumps({"status": "error", "message": "Server busy"}).encode("utf-8")
+        response = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Retry-After: 1\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode("ascii") + body
+        try:
+            request.sendall(response)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def drain(self, grace_period=SHUTDOWN_GRACE_PERIOD):
+        """Stop taking work and wait up to grace_period seconds for in-flight requests."""
+        self.draining.set()
+        waiter = threading.Thread(target=self.executor.shutdown, kwargs={"wait": True}, daemon=True)
+        waiter.start()
+        waiter.join(grace_period)
+        return not waiter.is_alive()
+
+def run_worker(server):
+    """Serve until SIGTERM/SIGINT, then drain in-flight requests and exit."""
+    load_services()
+
+    def request_stop(signum, frame):
+        # shutdown() blocks until serve_forever returns, so it must run on another thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    server.serve_forever(poll_interval=0.5)
+    if not server.drain():
+        print(f"Worker {os.getpid()}: in-flight requests did not finish within {SHUTDOWN_GRACE_PERIOD}s")
+    server.server_close()
+
+def serve(host="127.0.0.1", port=8080, processes=1, threads=16, max_pending=64):
+    """
+    Run the API, optionally as several pre-forked worker processes sharing one socket.
+    """
+    server = PooledHTTPServer((host, port), RecommendationHandler, max_workers=threads, max_pending=max_pending)
+    print(f"SipSync API listening on http://{host}:{server.server_address[1]} "
+          f"({processes} process(es) x {threads} threads)")
+
+    if processes <= 1 or not hasattr(os, "fork"):
+        run_worker(server)
+        return
+
+    children = []
+    for _ in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                run_worker(server)
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def forward(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    server.socket.close()
+
+    for child in children:
+        while True:
+            try:
+                os.waitpid(child, 0)
+                break
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SipSync headless recommendation API")
+    parser.add_argument("--host", default=os.getenv("SIPSYNC_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("SIPSYNC_API_PORT", 8080)))
+    parser.add_argument("--processes", type=int, default=1, help="pre-forked worker processes")
+    parser.add_argument("--threads", type=int, default=16, help="request threads per process")
+    parser.add_argument("--max-pending", type=int, default=64, help="queued connections before rejecting with 503")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.processes, args.threads, args.max_pending)
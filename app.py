@@ -1,7 +1,8 @@
 # app.py
 
+import os
 import streamlit as st
-from backend import generate_response
+from messages import templated_message
 from maps import geocode_address, find_nearby_stores, display_interactive_map
 # Uncomment the below line to use Google Maps API instead
 # from google_maps import geocode_address_google as geocode_address, find_nearby_places as find_nearby_stores, display_google_map as display_interactive_map
@@ -10,14 +11,29 @@ import time
 import re
 from language_support import (
     SUPPORTED_LANGUAGES, detect_language, translate_recommendation,
-    get_language_name
+    translate_text, get_language_name
 )
 from user_profile import UserProfile
+from analytics_store import generate_global_visualizations
 from streamlit_option_menu import option_menu
 from streamlit_lottie import st_lottie
-import requests
+from assets import load_asset
+from result_cache import make_result_key, recall_result, remember_result
+from metrics import start_metrics_server
+from session_memory import session_memory
+import hmac
 import json
 import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+if os.getenv("SIPSYNC_API_URL"):
+    # Thin-client mode: a running api_server.py does all provider calls
+    from api_client import (
+        resolve_recommendation, stream_personalized_message, translate_recommendation,
+        translate_text, find_nearby_stores, search_youtube
+    )
+else:
+    from backend import resolve_recommendation, stream_personalized_message
 
 # Set page configuration
 st.set_page_config(
@@ -54,6 +70,9 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Reload state spilled while this session was idle, and account for its memory
+session_memory.touch()
+
 # Initialize session state
 if 'user_id' not in st.session_state:
     try:
@@ -72,18 +91,284 @@ if 'profile' not in st.session_state:
         st.error("Error loading user profile. Please try refreshing the page.")
         st.stop()
 
-# Load Lottie animation
-def load_lottie_url(url):
+# Load Lottie animation from the local asset bundle
+lottie_tea = load_asset("lottie_tea")
+
+DRINK_TYPES = ["tea", "coffee", "milkshake", "light_food"]
+DRINK_ICONS = {"tea": "🍵", "coffee": "☕", "milkshake": "🥤", "light_food": "🍽️"}
+
+@st.cache_data(ttl=24 * 60 * 60, show_spinner=False)
+def cached_geocode(address):
+    """Geocode an address once per process instead of on every rerun."""
+    return geocode_address(address)
+
+@st.cache_resource
+def start_metrics_exporter(port):
+    """Expose /metrics and /metrics.json once per process."""
     try:
-        r = requests.get(url, timeout=10)
-        if r.status_code != 200:
-            return None
-        return r.json()
-    except Exception as e:
-        print(f"Error loading Lottie animation: {e}")
+        return start_metrics_server(port)
+    except OSError as e:
+        print(f"Metrics exporter not started: {e}")
         return None
 
-lottie_tea = load_lottie_url("https://assets5.lottiefiles.com/packages/lf20_DMgKk1.json")
+if os.getenv("SIPSYNC_METRICS_PORT"):
+    start_metrics_exporter(int(os.getenv("SIPSYNC_METRICS_PORT")))
+
+# Upper bound on waiting for background store and video lookups
+LOOKUP_TIMEOUT = 30
+
+# Operators open the app with ?operator=<token> to see dashboards spanning every user
+OPERATOR_TOKEN = os.getenv("SIPSYNC_OPERATOR_TOKEN")
+
+def is_operator():
+    """Whether this session may see cross-user dashboards; remembered for the session."""
+    token = st.query_params.get("operator")
+    if OPERATOR_TOKEN and token and hmac.compare_digest(token, OPERATOR_TOKEN):
+        st.session_state['operator'] = True
+    return st.session_state.get('operator', False)
+
+@st.cache_resource
+def get_lookup_executor():
+    """Thread pool shared by all sessions for store and video lookups."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="sipsync-lookup")
+
+def render_recommendation_card(bundle):
+    """
+    Render the core recommendation: message, benefits, sustainability and preparation.
+
+    Returns:
+        The placeholder holding the personalized message, so it can be updated in place.
+    """
+    recommendation = bundle["recommendation"]
+
+    # Display recommendation
+    # Dietary restrictions may have swapped in another drink type
+    drink_type = recommendation.get('drink_type', bundle['drink_type'])
+    st.markdown(f"## {DRINK_ICONS[drink_type]} {recommendation['drink']}")
+    message_slot = st.empty()
+    message_slot.markdown(f"*{recommendation['personalized_message']}*")
+    if recommendation.get("dietary_note"):
+        st.info(f"🥗 {recommendation['dietary_note']}")
+
+    # Benefits and ingredients
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        with st.expander("✨ Benefits", expanded=True):
+            for benefit in recommendation.get("benefits", []):
+                st.markdown(f"- {benefit}")
+    with col2:
+        with st.expander("📜 Ingredients", expanded=True):
+            for ingredient in recommendation.get("ingredients", []):
+                st.markdown(f"- {ingredient}")
+
+    # Sustainability score
+    st.write("---")
+    st.write("🌱 Sustainability Score")
+    sustainability_score = recommendation.get("sustainability_score", 0)
+    st.progress(min(max(sustainability_score / 5.0, 0), 1))
+    st.write("Eco-friendly Tips:")
+    for tip in recommendation.get("eco_friendly_tips", []):
+        st.markdown(f"- {tip}")
+
+    # Cultural origin and scientific evidence
+    st.write("---")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("🌍 Cultural Origin")
+        st.info(recommendation.get("cultural_origin", "Information not available"))
+    with col2:
+        st.write("🔬 Scientific Evidence")
+        st.info(recommendation.get("scientific_evidence", "Information not available"))
+
+    # Weather adjustment if applicable
+    if recommendation.get("weather_adjusted"):
+        st.write("---")
+        st.write("🌤️ Weather-Adjusted Recommendation")
+        st.info("This recommendation has been adjusted based on your local weather conditions.")
+
+    # Brewing tip
+    st.write("---")
+    st.write("🍶 Preparation Instructions")
+    st.success(recommendation.get("brewing_tip", "Simple preparation recommended"))
+
+    return message_slot
+
+def render_store_section(bundle):
+    """
+    Render the nearby store map, or a notice if the lookup failed.
+    """
+    stores = bundle["stores"]
+    try:
+        if stores:
+            display_interactive_map(
+                bundle["latitude"], bundle["longitude"], stores,
+                bundle["recommendation"].get("ingredients", [])
+            )
+        elif stores is None:
+            st.warning("Unable to load store locations. Please check your internet connection.")
+        else:
+            st.info("No stores found nearby. Try expanding your search area.")
+    except Exception as e:
+        st.warning("Unable to load store locations. Please check your internet connection.")
+
+def render_video_section(bundle):
+    """
+    Render related YouTube videos, or a notice if the lookup failed.
+    """
+    videos = bundle["videos"]
+    if videos:
+        video_cols = st.columns(min(3, len(videos)))
+        for i, video in enumerate(videos[:3]):
+            with video_cols[i]:
+                st.markdown(f"#### {video['title']}")
+                st.markdown(f"[![Thumbnail]({video['thumbnail']})]({video['url']})")
+                st.markdown(f"[Watch Video]({video['url']})")
+    elif videos is None:
+        st.warning("Unable to load YouTube videos. Please check your internet connection.")
+    else:
+        st.info("No related videos found.")
+
+def render_recommendation_bundle(bundle):
+    """
+    Render a completed recommendation bundle, e.g. one recalled from the result cache.
+    """
+    try:
+        render_recommendation_card(bundle)
+
+        # Map integration
+        if bundle["latitude"] and bundle["longitude"]:
+            st.write("---")
+            st.write("🗺️ Nearby Stores")
+            render_store_section(bundle)
+
+        # YouTube videos
+        st.write("---")
+        st.write("📺 Learn More")
+        render_video_section(bundle)
+    except Exception as e:
+        st.error("Error displaying recommendation. Please try again.")
+
+def stream_recommendation_bundle(user_input, drink_type, latitude, longitude, language, dietary_restrictions=None):
+    """
+    Run the recommendation workflow, rendering each section as soon as its data is ready.
+
+    Store and video lookups are submitted to a background executor as soon as
+    the ailment is resolved, so they overlap with the personalized message and
+    translation instead of running after them. The personalized message is
+    streamed into the card token by token.
+
+    Returns:
+        dict: The completed bundle, with "stores"/"videos" set to None for
+        lookups that failed.
+    """
+    with st.spinner("Finding your perfect brew..."):
+        # Detect input language
+        try:
+            input_lang, _ = detect_language(user_input)
+        except Exception as e:
+            st.warning("Language detection failed. Proceeding with English.")
+            input_lang = 'en'
+
+        # Resolve the ailment, weather and catalog entry
+        try:
+            recommendation = resolve_recommendation(
+                user_input,
+                drink_type=drink_type,
+                latitude=latitude,
+                longitude=longitude,
+                dietary_restrictions=dietary_restrictions
+            )
+        except Exception as e:
+            st.error("Failed to generate recommendation. Please try again.")
+            st.stop()
+
+    bundle = {
+        "recommendation": recommendation,
+        "drink_type": drink_type,
+        "latitude": latitude,
+        "longitude": longitude,
+        "stores": None,
+        "videos": None
+    }
+    if recommendation["status"] != "success":
+        return bundle
+
+    # Start the slow lookups now that the ailment is known
+    executor = get_lookup_executor()
+    lookups = {}
+    if latitude and longitude:
+        lookups[executor.submit(
+            find_nearby_stores, latitude, longitude, list(recommendation.get("ingredients", []))
+        )] = "stores"
+    lookups[executor.submit(search_youtube, recommendation.get("youtube_keywords", ""))] = "videos"
+
+    # Show the card straight away with a placeholder message; the Cohere
+    # message replaces it as it streams in
+    streaming = "personalized_message" not in recommendation
+    display = dict(recommendation)
+
+    # Translate if needed; a streaming message is translated once it is complete
+    if language != 'en':
+        with st.spinner("Translating your recommendation..."):
+            try:
+                display = translate_recommendation(display, language)
+            except Exception as e:
+                st.warning("Translation failed. Showing original recommendation.")
+    if streaming:
+        display["personalized_message"] = templated_message(recommendation) if language == 'en' else "…"
+    bundle["recommendation"] = display
+
+    message_slot = None
+    try:
+        message_slot = render_recommendation_card(bundle)
+    except Exception as e:
+        st.error("Error displaying recommendation. Please try again.")
+
+    if streaming:
+        chunks = []
+        for chunk in stream_personalized_message(recommendation):
+            chunks.append(chunk)
+            # Partial English text is only shown when no translation is pending
+            if message_slot and language == 'en':
+                message_slot.markdown(f"*{''.join(chunks)}▌*")
+
+        message = "".join(chunks).strip()
+        if language != 'en':
+            message = translate_text(message, language)
+        display["personalized_message"] = message
+        if message_slot:
+            message_slot.markdown(f"*{message}*")
+
+    # Reserve the remaining sections and fill them in as lookups finish
+    slots = {}
+    if "stores" in lookups.values():
+        st.write("---")
+        st.write("🗺️ Nearby Stores")
+        slots["stores"] = st.empty()
+        slots["stores"].info("Finding stores...")
+    st.write("---")
+    st.write("📺 Learn More")
+    slots["videos"] = st.empty()
+    slots["videos"].info("Loading videos...")
+
+    renderers = {"stores": render_store_section, "videos": render_video_section}
+    try:
+        for future in as_completed(lookups, timeout=LOOKUP_TIMEOUT):
+            section = lookups[future]
+            try:
+                bundle[section] = future.result()
+            except Exception as e:
+                print(f"Error loading {section}: {e}")
+            with slots[section].container():
+                renderers[section](bundle)
+    except FuturesTimeoutError:
+        for future, section in lookups.items():
+            if not future.done():
+                future.cancel()
+                with slots[section].container():
+                    renderers[section](bundle)
+
+    return bundle
 
 # Sidebar
 with st.sidebar:
@@ -120,16 +405,13 @@ if selected == "Home":
         or just need a moment of relaxation, we'll help you find the perfect drink to soothe your mind and body.
         """)
     with col2:
-        st_lottie(lottie_tea, height=200)
-
-    # Drink type selection
-    drink_types = ["tea", "coffee", "milkshake", "light_food"]
-    drink_icons = {"tea": "🍵", "coffee": "☕", "milkshake": "🥤", "light_food": "🍽️"}
+        if lottie_tea:
+            st_lottie(lottie_tea, height=200)
 
     selected_drink = st.radio(
         "What type of recommendation are you looking for?",
-        options=drink_types,
-        format_func=lambda x: f"{drink_icons[x]} {x.replace('_', ' ').title()}"
+        options=DRINK_TYPES,
+        format_func=lambda x: f"{DRINK_ICONS[x]} {x.replace('_', ' ').title()}"
     )
 
     # User input for ailment
@@ -144,138 +426,55 @@ if selected == "Home":
         address = st.text_input("Enter your location for weather-aware recommendations:", value="")
     with location_col2:
         if address:
-            latitude, longitude = geocode_address(address)
+            latitude, longitude = cached_geocode(address)
         else:
             latitude, longitude = None, None
 
     # Generate recommendation
+    rendered_key = None
     if st.button("Find My Brew"):
         if not user_input:
             st.warning("Please enter an ailment.")
         else:
             try:
-                with st.spinner("Finding your perfect brew..."):
-                    # Detect input language
-                    try:
-                        input_lang, _ = detect_language(user_input)
-                    except Exception as e:
-                        st.warning("Language detection failed. Proceeding with English.")
-                        input_lang = 'en'
-                    
-                    # Generate recommendation
-                    try:
-                        recommendation = generate_response(
-                            user_input,
-                            drink_type=selected_drink,
-                            latitude=latitude,
-                            longitude=longitude
+                dietary_restrictions = st.session_state['profile'].preferences.get('dietary_restrictions', [])
+                result_key = make_result_key(
+                    user_input, selected_drink, latitude, longitude, st.session_state['language'],
+                    dietary_restrictions
+                )
+                bundle = recall_result(st.session_state, result_key)
+                if bundle is None:
+                    bundle = stream_recommendation_bundle(
+                        user_input, selected_drink, latitude, longitude,
+                        st.session_state['language'], dietary_restrictions
+                    )
+                    if bundle["recommendation"]["status"] == "success":
+                        # Only share bundles whose lookups all finished with other sessions
+                        lookups_complete = bundle["videos"] is not None and (
+                            bundle["stores"] is not None or not (latitude and longitude)
                         )
-                    except Exception as e:
-                        st.error("Failed to generate recommendation. Please try again.")
-                        st.stop()
-                    
-                    # Translate if needed
-                    if st.session_state['language'] != 'en':
-                        try:
-                            recommendation = translate_recommendation(
-                                recommendation,
-                                st.session_state['language']
-                            )
-                        except Exception as e:
-                            st.warning("Translation failed. Showing original recommendation.")
-                    
+                        remember_result(st.session_state, result_key, bundle, shared=lookups_complete)
+                        rendered_key = result_key
+
+                if bundle["recommendation"]["status"] == "success":
                     # Save to user profile
                     try:
-                        st.session_state['profile'].add_recommendation(recommendation)
+                        st.session_state['profile'].add_recommendation(bundle["recommendation"])
                     except Exception as e:
                         st.warning("Failed to save recommendation to profile.")
-                    
-                    if recommendation["status"] == "success":
-                        try:
-                            # Display recommendation
-                            st.markdown(f"## {drink_icons[selected_drink]} {recommendation['drink']}")
-                            st.markdown(f"*{recommendation['personalized_message']}*")
-
-                            # Benefits and ingredients
-                            col1, col2 = st.columns([2, 1])
-                            with col1:
-                                with st.expander("✨ Benefits", expanded=True):
-                                    for benefit in recommendation.get("benefits", []):
-                                        st.markdown(f"- {benefit}")
-                            with col2:
-                                with st.expander("📜 Ingredients", expanded=True):
-                                    for ingredient in recommendation.get("ingredients", []):
-                                        st.markdown(f"- {ingredient}")
-
-                            # Sustainability score
-                            st.write("---")
-                            st.write("🌱 Sustainability Score")
-                            sustainability_score = recommendation.get("sustainability_score", 0)
-                            st.progress(min(max(sustainability_score / 5.0, 0), 1))
-                            st.write("Eco-friendly Tips:")
-                            for tip in recommendation.get("eco_friendly_tips", []):
-                                st.markdown(f"- {tip}")
-
-                            # Cultural origin and scientific evidence
-                            st.write("---")
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                st.write("🌍 Cultural Origin")
-                                st.info(recommendation.get("cultural_origin", "Information not available"))
-                            with col2:
-                                st.write("🔬 Scientific Evidence")
-                                st.info(recommendation.get("scientific_evidence", "Information not available"))
-
-                            # Weather adjustment if applicable
-                            if recommendation.get("weather_adjusted"):
-                                st.write("---")
-                                st.write("🌤️ Weather-Adjusted Recommendation")
-                                st.info("This recommendation has been adjusted based on your local weather conditions.")
-
-                            # Brewing tip
-                            st.write("---")
-                            st.write("🍶 Preparation Instructions")
-                            st.success(recommendation.get("brewing_tip", "Simple preparation recommended"))
-
-                            # Map integration
-                            if latitude and longitude:
-                                try:
-                                    st.write("---")
-                                    st.write("🗺️ Nearby Stores")
-                                    with st.spinner("Finding stores..."):
-                                        stores = find_nearby_stores(latitude, longitude, recommendation.get("ingredients", []))
-                                        if stores:
-                                            display_interactive_map(latitude, longitude, stores, recommendation.get("ingredients", []))
-                                        else:
-                                            st.info("No stores found nearby. Try expanding your search area.")
-                                except Exception as e:
-                                    st.warning("Unable to load store locations. Please check your internet connection.")
-
-                            # YouTube videos
-                            try:
-                                st.write("---")
-                                st.write("📺 Learn More")
-                                with st.spinner("Loading videos..."):
-                                    videos = search_youtube(recommendation.get("youtube_keywords", ""))
-                                    if videos:
-                                        video_cols = st.columns(min(3, len(videos)))
-                                        for i, video in enumerate(videos[:3]):
-                                            with video_cols[i]:
-                                                st.markdown(f"#### {video['title']}")
-                                                st.markdown(f"[![Thumbnail]({video['thumbnail']})]({video['url']})")
-                                                st.markdown(f"[Watch Video]({video['url']})")
-                                    else:
-                                        st.info("No related videos found.")
-                            except Exception as e:
-                                st.warning("Unable to load YouTube videos. Please check your internet connection.")
-                                
-                        except Exception as e:
-                            st.error("Error displaying recommendation. Please try again.")
-                    else:
-                        st.error(recommendation.get("message", "An error occurred. Please try again."))
+                    st.session_state['last_result_key'] = result_key
+                else:
+                    st.session_state.pop('last_result_key', None)
+                    st.error(bundle["recommendation"].get("message", "An error occurred. Please try again."))
             except Exception as e:
                 st.error("An unexpected error occurred. Please try again.")
 
+    # Re-render the last result from memory on every rerun
+    if st.session_state.get('last_result_key') and st.session_state['last_result_key'] != rendered_key:
+        last_bundle = recall_result(st.session_state, st.session_state['last_result_key'])
+        if last_bundle:
+            render_recommendation_bundle(last_bundle)
+
 elif selected == "Profile":
     st.title("👤 User Profile")
     
@@ -299,16 +498,37 @@ elif selected == "Profile":
             
 elif selected == "Analytics":
     st.title("📊 Analytics Dashboard")
+    operator = is_operator()
+    tabs = st.tabs(["👤 My History", "🌍 All Users"] if operator else ["👤 My History"])
     
-    # Generate visualizations
-    visualizations = st.session_state['profile'].generate_insights_visualizations()
-    if visualizations:
-        # Display charts
-        st.plotly_chart(visualizations['ailment_distribution'], use_container_width=True)
-        st.plotly_chart(visualizations['sustainability_trend'], use_container_width=True)
-        st.plotly_chart(visualizations['weather_usage'], use_container_width=True)
-    else:
-        st.info("Start getting recommendations to see your analytics!")
+    with tabs[0]:
+        # Generate visualizations
+        visualizations = st.session_state['profile'].generate_insights_visualizations()
+        if visualizations:
+            # Display charts
+            st.plotly_chart(visualizations['ailment_distribution'], use_container_width=True)
+            st.plotly_chart(visualizations['sustainability_trend'], use_container_width=True)
+            st.plotly_chart(visualizations['weather_usage'], use_container_width=True)
+        else:
+            st.info("Start getting recommendations to see your analytics!")
+    
+    # Every user's activity, for operators only
+    if operator:
+        with tabs[1]:
+            days = st.selectbox("Period", options=[7, 30, 90, 365], index=1, format_func=lambda d: f"Last {d} days")
+            global_visualizations = generate_global_visualizations(days)
+            if global_visualizations:
+                summary = global_visualizations['summary']
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Recommendations", f"{summary['total_recommendations']:,}")
+                col2.metric("Weather-Adjusted", f"{summary['weather_adjusted_percent']:.0f}%")
+                col3.metric("Avg. Sustainability", f"{summary['avg_sustainability']:.1f}")
+                st.plotly_chart(global_visualizations['top_ailments'], use_container_width=True)
+                st.plotly_chart(global_visualizations['top_drinks'], use_container_width=True)
+                st.plotly_chart(global_visualizations['sustainability_trend'], use_container_width=True)
+                st.plotly_chart(global_visualizations['weather_share'], use_container_width=True)
+            else:
+                st.info("No recommendations recorded in this period yet.")
         
 elif selected == "Settings":
     st.title("⚙️ Settings")
@@ -320,8 +540,8 @@ elif selected == "Settings":
     # Drink preference
     preferred_drink = st.selectbox(
         "Default Drink Type",
-        options=["tea", "coffee", "milkshake", "light_food"],
-        index=["tea", "coffee", "milkshake", "light_food"].index(
+        options=DRINK_TYPES,
+        index=DRINK_TYPES.index(
             preferences.get('preferred_drink_type', 'tea')
         )
     )
@@ -347,6 +567,15 @@ elif selected == "Settings":
             'sustainability_focus': sustainability
         })
         st.success("Preferences saved successfully!")
+    
+    # Approximate memory held for this browser tab
+    with st.expander("Session Memory"):
+        usage = session_memory.current()
+        if usage:
+            st.write(f"This session holds about **{usage['bytes'] / 1024:.1f} KB**.")
+            st.table({key: f"{size / 1024:.1f} KB" for key, size in usage['keys'].items()})
+        else:
+            st.write("Not measured yet.")
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,131 @@
+# assets.py
+
+import json
+import os
+import threading
+import time
+import requests
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Directory holding the bundled copies of static remote assets
+ASSET_DIR = os.path.join(BASE_DIR, "assets")
+
+# Refreshed copies go to the gitignored cache so the bundle in git is never rewritten
+ASSET_CACHE_DIR = os.getenv("ASSET_CACHE_DIR", os.path.join(BASE_DIR, "cache", "assets"))
+
+# Static remote assets shipped with the app, keyed by asset name
+STATIC_ASSETS = {
+    "lottie_tea": {
+        "url": "https://assets5.lottiefiles.com/packages/lf20_DMgKk1.json",
+        "filename": "lottie_tea.json"
+    }
+}
+
+# Refresh an asset from the network at most this often (seconds, 0 disables)
+REFRESH_INTERVAL = int(os.getenv("ASSET_REFRESH_INTERVAL", 24 * 60 * 60))
+
+_cache = {}
+_checked_at = {}
+_refreshing = set()
+_lock = threading.Lock()
+
+def _asset_path(name):
+    return os.path.join(ASSET_DIR, STATIC_ASSETS[name]["filename"])
+
+def _cached_path(name):
+    return os.path.join(ASSET_CACHE_DIR, STATIC_ASSETS[name]["filename"])
+
+def _read_asset(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Error reading asset {path}: {e}")
+        return None
+
+def _write_asset(path, data):
+    """Write an asset atomically so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def refresh_asset(name):
+    """
+    Download the latest copy of an asset into the cache directory.
+
+    Returns:
+        bool: True if the asset was refreshed.
+    """
+    spec = STATIC_ASSETS[name]
+    try:
+        response = requests.get(spec["url"], timeout=10)
+        if response.status_code != 200:
+            return False
+        data = response.json()
+    except Exception as e:
+        print(f"Error refreshing asset {name}: {e}")
+        return False
+
+    try:
+        _write_asset(_cached_path(name), data)
+    except OSError as e:
+        print(f"Error saving asset {name}: {e}")
+    with _lock:
+        _cache[name] = data
+    return True
+
+def _schedule_refresh(name):
+    """Refresh an asset on a daemon thread if the cached copy is missing or stale."""
+    if REFRESH_INTERVAL <= 0:
+        return
+
+    try:
+        age = time.time() - os.path.getmtime(_cached_path(name))
+    except OSError:
+        age = None
+    if age is not None and age < REFRESH_INTERVAL:
+        return
+
+    with _lock:
+        if name in _refreshing:
+            return
+        _refreshing.add(name)
+
+    def worker():
+        try:
+            refresh_asset(name)
+        finally:
+            with _lock:
+                _refreshing.discard(name)
+
+    threading.Thread(target=worker, name=f"asset-refresh-{name}", daemon=True).start()
+
+def load_asset(name):
+    """
+    Load a static asset, preferring a refreshed copy over the bundled one.
+
+    The asset is read from disk once and memoized. Every REFRESH_INTERVAL a
+    missing or stale cached copy is refreshed from the network in the
+    background, so callers never wait on the remote host and get None only
+    if no copy exists at all.
+    """
+    now = time.monotonic()
+    with _lock:
+        if name in _cache and (REFRESH_INTERVAL <= 0 or now - _checked_at[name] < REFRESH_INTERVAL):
+            return _cache[name]
+        _checked_at[name] = now
+        data = _cache.get(name)
+
+    if data is None:
+        data = _read_asset(_cached_path(name)) or _read_asset(_asset_path(name))
+        with _lock:
+            # A background refresh may have won the race; keep the newer copy
+            data = _cache.setdefault(name, data) if data is not None else _cache.get(name)
+
+    _schedule_refresh(name)
+    return data
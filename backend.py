@@ -4,9 +4,24 @@ import cohere
 import os
 import google.generativeai as genai
 from dotenv import load_dotenv
-from train import RECOMMENDATIONS, COHERE_PERSONALIZED_MESSAGE_PROMPT, WEATHER_RECOMMENDATIONS
-from fuzzywuzzy import process
+from train import WEATHER_RECOMMENDATIONS
+from catalog import get_catalog
+from dietary import compatible, diet_mask, diet_names
+from messages import build_message_prompt, templated_message
+from metrics import registry, stage, timed_stage, provider_call
+from singleflight import flight
+from result_cache import make_result_key, location_cell, RESULT_CACHE_TTL
+from cache import Cache
+from speculation import speculator
+from circuit_breaker import (
+    CLOSED, CircuitOpenError, guarded_call, gemini_breaker, cohere_breaker, GEMINI_TIMEOUT, COHERE_TIMEOUT
+)
+from semantic_matcher import get_matcher, decide, AMBIGUOUS_SCORE
+from symptom_extractor import extract_intent, segment_text
+from custom_responses import get_custom_response, set_custom_response, record_unmatched
 import re
+import math
+import time
 import requests
 from datetime import datetime
 
@@ -15,21 +30,92 @@ load_dotenv()
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_CLOUD_API_KEY")
 WEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+WEATHER_API_URL = os.getenv("OPENWEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
 
-# Initialize Cohere Client
-co = cohere.Client(COHERE_API_KEY)
+# Initialize Cohere Client; the SDK default is a 300s timeout with 3 retries
+co = cohere.Client(COHERE_API_KEY, timeout=math.ceil(COHERE_TIMEOUT), max_retries=1)
 
 # Initialize Google Generative AI
 genai.configure(api_key=GOOGLE_API_KEY)
 model = genai.GenerativeModel('gemini-pro')
 
+# Most ailments merged into one recommendation for a compound description
+MAX_MERGED_AILMENTS = 3
+
+DRINK_TYPES = ["tea", "coffee", "milkshake", "light_food"]
+
+# Weather conditions per ~1 km cell change slowly
+WEATHER_CACHE_TTL = int(os.getenv("WEATHER_CACHE_TTL", 10 * 60))
+
+# Shared across workers: weather per location cell, the drink-independent
+# request context, and generated messages keyed by prompt, so switching drink
+# type reuses the resolution and any prefetched message
+weather_cache = Cache("weather", ttl=WEATHER_CACHE_TTL)
+context_cache = Cache("context", ttl=RESULT_CACHE_TTL)
+message_cache = Cache("messages", ttl=RESULT_CACHE_TTL)
+
 class RecommendationError(Exception):
     """Custom exception for recommendation-related errors"""
     pass
 
+# Provider calls below go through the process-wide single-flight group, so
+# identical requests in flight at the same time share one upstream call.
+
+def _request_weather(url):
+    with provider_call("openweather", "current_weather") as call:
+        response = requests.get(url, timeout=10)  # Add timeout
+        if response.status_code != 200:
+            call.fail()
+    return response
+
+def _gemini_generate(operation, prompt):
+    """Breaker-guarded Gemini call; the response is shared read-only."""
+    def call():
+        with provider_call("gemini", operation):
+            return guarded_call(gemini_breaker, model.generate_content, prompt, timeout=GEMINI_TIMEOUT)
+    return flight.do(("gemini", prompt), call, copy_result=None)
+
+def _cohere_generate(prompt):
+    """Breaker-guarded Cohere call returning the generated text."""
+    def call():
+        with provider_call("cohere", "generate"):
+            response = guarded_call(
+                cohere_breaker, co.generate,
+                model="command",
+                prompt=prompt,
+                max_tokens=200,
+                temperature=0.7,
+                timeout=COHERE_TIMEOUT
+            )
+        return response.generations[0].text.strip()
+    return flight.do(("cohere", prompt), call, copy_result=None)
+
+def _fetch_weather_condition(latitude, longitude):
+    url = f"{WEATHER_API_URL}?lat={latitude}&lon={longitude}&appid={WEATHER_API_KEY}"
+    response = _request_weather(url)
+    if response.status_code != 200:
+        raise requests.HTTPError(f"HTTP {response.status_code}")
+    data = response.json()
+    temp = data.get('main', {}).get('temp')
+    if not temp:
+        return None
+    temp = temp - 273.15  # Convert to Celsius
+    conditions = data.get('weather', [{}])[0].get('main', '').lower()
+    
+    if temp < 15:
+        return "cold"
+    elif temp > 25:
+        return "hot"
+    elif conditions in ['rain', 'drizzle', 'thunderstorm']:
+        return "rainy"
+    return None
+
 def get_weather(latitude, longitude):
     """
     Get current weather conditions to adjust recommendations.
+
+    Conditions are cached per location cell for WEATHER_CACHE_TTL seconds;
+    concurrent lookups for a cell share one API call. Failures are not cached.
     """
     if not WEATHER_API_KEY:
         print("Warning: Weather API key not found")
@@ -39,22 +125,10 @@ def get_weather(latitude, longitude):
         return None
         
     try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={latitude}&lon={longitude}&appid={WEATHER_API_KEY}"
-        response = requests.get(url, timeout=10)  # Add timeout
-        if response.status_code == 200:
-            data = response.json()
-            temp = data.get('main', {}).get('temp')
-            if not temp:
-                return None
-            temp = temp - 273.15  # Convert to Celsius
-            conditions = data.get('weather', [{}])[0].get('main', '').lower()
-            
-            if temp < 15:
-                return "cold"
-            elif temp > 25:
-                return "hot"
-            elif conditions in ['rain', 'drizzle', 'thunderstorm']:
-                return "rainy"
+        return weather_cache.get_or_compute(
+            location_cell(latitude, longitude),
+            lambda: _fetch_weather_condition(latitude, longitude)
+        )
     except requests.RequestException as e:
         print(f"Weather API error: {e}")
     except (KeyError, IndexError, ValueError) as e:
@@ -63,78 +137,217 @@ def get_weather(latitude, longitude):
         print(f"Unexpected weather API error: {e}")
     return None
 
-def preprocess_input(user_input):
+def preprocess_input(user_input, catalog=None):
     """
-    Preprocess user input to extract keywords and sentiment.
+    Preprocess user input and extract its symptoms, severity, negations and duration.
+
+    Returns:
+        tuple: (processed_input, SymptomIntent)
     """
     if not user_input or not isinstance(user_input, str):
         raise RecommendationError("Invalid input: Please provide a valid text description")
         
     try:
+        # Extract from the original text, which still has digits for durations
+        intent = extract_intent(user_input, catalog)
+
         # Convert to lowercase and remove special characters
-        user_input = user_input.lower()
-        user_input = re.sub(r'[^a-zA-Z\s]', '', user_input)
-        
-        # Extract severity indicators
-        severity = "mild"
-        if any(word in user_input for word in ["severe", "terrible", "extreme"]):
-            severity = "severe"
-        elif any(word in user_input for word in ["moderate", "quite", "rather"]):
-            severity = "moderate"
-            
-        processed_input = user_input.strip()
+        processed_input = re.sub(r'[^a-zA-Z\s]', '', user_input.lower()).strip()
         if not processed_input:
             raise RecommendationError("Invalid input: Please provide a valid description")
             
-        return processed_input, severity
+        return processed_input, intent
     except Exception as e:
         raise RecommendationError(f"Error processing input: {str(e)}")
 
-def find_closest_ailment(user_input):
+def find_closest_ailment(user_input, catalog=None, intent=None):
     """
-    Find the closest matching ailment using fuzzy matching with context awareness.
+    Find the closest matching ailment using local semantic matching with context awareness.
+
+    Ailment names and their catalog synonyms are matched; the result is always
+    a canonical ailment name. A symptom named outright in the extracted intent
+    wins; otherwise Gemini is only asked when the local scores are ambiguous.
     """
     if not user_input:
         return None
         
     try:
-        ailments = list(RECOMMENDATIONS.keys())
-        # Get top 3 matches
-        matches = process.extractBests(user_input, ailments, score_cutoff=60, limit=3)
-        
-        if not matches:
+        catalog = catalog or get_catalog()
+        # An exact name or synonym needs neither fuzzy matching nor Gemini
+        exact = catalog.lookup(user_input)
+        if exact:
+            return exact
+
+        intent = intent or extract_intent(user_input, catalog)
+        if intent.symptoms:
+            return intent.symptoms[0]
+
+        # Match what is left once denied symptoms ("not stressed") are removed
+        text = intent.residual_text() if intent.negated else user_input
+        if not text:
+            return None
+
+        # Score the top 3 ailments by their most similar name or synonym
+        candidates = [c for c in get_matcher(catalog).top_k(text, k=3 + len(intent.negated))
+                      if c[0] not in intent.negated][:3]
+        decision, matches = decide(candidates)
+        registry.inc("sipsync_matcher_decisions_total", decision=decision)
+        if decision == "match":
+            return matches
+        if decision == "none":
             return None
-            
-        # If we have an exact match, use it
-        if matches[0][1] > 90:
-            return matches[0][0]
             
         # Use Gemini to select the most appropriate match
         prompt = f"""
         Given the user's description: '{user_input}'
+        What we extracted from it:
+        {intent.describe()}
         And these potential matches: {[m[0] for m in matches]}
         Which ailment is the most appropriate match? Consider synonyms and related symptoms.
-        Return ONLY the ailment name, nothing else.
+        Return ONLY the ailment name, nothing else. If none of them fits, return none.
         """
         
         try:
-            response = model.generate_content(prompt)
-            suggested_ailment = response.text.strip().lower()
-            if suggested_ailment in ailments:
+            response = _gemini_generate("match_ailment", prompt)
+            answer = response.text.strip().lower()
+            if answer == "none":
+                return None
+            suggested_ailment = catalog.lookup(answer)
+            if suggested_ailment in [m[0] for m in matches]:
                 return suggested_ailment
+        except CircuitOpenError:
+            pass
         except Exception as e:
             print(f"Gemini API error: {e}")
         
-        # Fall back to the highest fuzzy match
-        return matches[0][0] if matches[0][1] > 70 else None
+        # Fall back to the highest local match
+        return matches[0][0] if matches[0][1] >= AMBIGUOUS_SCORE else None
     except Exception as e:
         print(f"Error finding closest ailment: {e}")
         return None
 
-def generate_response(user_input, drink_type="tea", latitude=None, longitude=None):
+def find_closest_ailments(user_input, catalog=None, intent=None, limit=MAX_MERGED_AILMENTS):
     """
-    Generate a personalized recommendation based on the user's input and context.
+    Resolve every ailment in a possibly compound description.
+
+    Symptoms named outright come first, then segments split on conjunctions
+    ("headache and stress after a long day") are scored in one batch and
+    confident matches are added. Without any, this falls back to
+    find_closest_ailment for a single, possibly Gemini-assisted, match.
+
+    Returns:
+        list: Canonical ailment names, most prominent first; empty if none match.
+    """
+    if not user_input:
+        return []
+
+    try:
+        catalog = catalog or get_catalog()
+        exact = catalog.lookup(user_input)
+        if exact:
+            return [exact]
+
+        intent = intent or extract_intent(user_input, catalog)
+        found = list(intent.symptoms)
+        segments = segment_text(intent.text)
+        if len(segments) > 1:
+            for candidates in get_matcher(catalog).top_k_batch(segments, k=3 + len(intent.negated)):
+                candidates = [c for c in candidates if c[0] not in intent.negated]
+                decision, match = decide(candidates)
+                if decision == "match" and match not in found:
+                    found.append(match)
+        if found:
+            return found[:limit]
+    except Exception as e:
+        print(f"Error finding ailments: {e}")
+
+    closest = find_closest_ailment(user_input, catalog, intent)
+    return [closest] if closest else []
+
+@timed_stage("resolve")
+def resolve_recommendation(user_input, drink_type="tea", latitude=None, longitude=None, dietary_restrictions=None):
+    """
+    Resolve the ailment, weather and catalog entry for the user's input.
+
+    Returns the recommendation without its personalized message, which
+    personalize_recommendation adds, so callers can start dependent lookups
+    (stores, videos) as soon as the ailment is known. Identical requests in
+    flight at the same time share one resolution.
+
+    With dietary_restrictions (e.g. ["Vegan", "Gluten-free"]), an incompatible
+    drink is swapped for the ailment's first compatible drink type and
+    incompatible ingredients are dropped.
+    """
+    try:
+        diets = diet_mask(dietary_restrictions)
+    except ValueError as e:
+        return {"status": "error", "message": str(e), "ailment": ""}
+    if not isinstance(user_input, str):
+        return _resolve_recommendation(user_input, drink_type, latitude, longitude, diets)
+    key = ("resolve",) + make_result_key(user_input, drink_type, latitude, longitude, "en", dietary_restrictions)
+    with speculator.foreground():
+        return flight.do(key, _resolve_recommendation, user_input, drink_type, latitude, longitude, diets)
+
+def resolve_context(user_input, latitude=None, longitude=None):
+    """
+    Resolve everything about a request that does not depend on the drink type.
+
+    The weather, extracted intent, matched ailments and the weather-adjusted
+    catalog entry are computed once and shared by every drink type, so
+    switching drinks skips straight to the per-drink fields and message.
+
+    Returns:
+        dict: "processed_input", "intent" (the SymptomIntent description for
+        prompts), "weather_condition", "ailments" (empty when nothing matched)
+        and "recommendation" (None when nothing matched). JSON-serializable,
+        so it is shared through the cache backend; each caller gets its own copy.
     """
+    if not isinstance(user_input, str):
+        return _resolve_context(user_input, latitude, longitude)
+    return context_cache.get_or_compute(
+        make_result_key(user_input, None, latitude, longitude, "en"),
+        lambda: _resolve_context(user_input, latitude, longitude)
+    )
+
+def _resolve_context(user_input, latitude, longitude):
+    # Get weather conditions if location is provided
+    with stage("weather"):
+        weather_condition = get_weather(latitude, longitude) if latitude and longitude else None
+    
+    # Preprocess input and find the closest matching ailment
+    with stage("match_ailment"):
+        # One catalog snapshot per request, even if it reloads meanwhile
+        catalog = get_catalog()
+        processed_input, intent = preprocess_input(user_input, catalog)
+        ailments = find_closest_ailments(processed_input, catalog, intent)
+
+    recommendation = None
+    if ailments:
+        # Merge compound inputs; the catalog returns a fresh dict, so the
+        # weather adjustments below never leak into it
+        recommendation = catalog.merged_recommendation(ailments)
+        
+        # Adjust recommendation based on weather if available
+        if weather_condition and weather_condition in WEATHER_RECOMMENDATIONS:
+            weather_rec = WEATHER_RECOMMENDATIONS[weather_condition]
+            recommendation['ingredients'].extend(weather_rec['boost'])
+            recommendation['brewing_tip'] += f" Weather tip: {''.join(weather_rec['boost'])}"
+        
+        # Add required fields to response
+        recommendation['weather_adjusted'] = bool(weather_condition)
+        recommendation['status'] = "success"
+        recommendation['ailment'] = ailments[0] if len(ailments) == 1 else f"{', '.join(ailments[:-1])} and {ailments[-1]}"
+        recommendation['ailments'] = ailments
+
+    return {
+        "processed_input": processed_input,
+        "intent": intent.describe(),
+        "weather_condition": weather_condition,
+        "ailments": ailments,
+        "recommendation": recommendation
+    }
+
+def _resolve_recommendation(user_input, drink_type, latitude, longitude, diets=0):
     if not user_input:
         return {
             "status": "error",
@@ -142,7 +355,7 @@ def generate_response(user_input, drink_type="tea", latitude=None, longitude=Non
             "ailment": ""
         }
         
-    if drink_type not in ["tea", "coffee", "milkshake", "light_food"]:
+    if drink_type not in DRINK_TYPES:
         return {
             "status": "error",
             "message": "Invalid drink type selected",
@@ -150,37 +363,43 @@ def generate_response(user_input, drink_type="tea", latitude=None, longitude=Non
         }
     
     try:
-        # Get weather conditions if location is provided
-        weather_condition = get_weather(latitude, longitude) if latitude and longitude else None
-        
-        # Preprocess input and find the closest matching ailment
-        processed_input, severity = preprocess_input(user_input)
-        closest_ailment = find_closest_ailment(processed_input)
+        context = resolve_context(user_input, latitude, longitude)
+        processed_input = context["processed_input"]
+        intent = context["intent"]
+        weather_condition = context["weather_condition"]
         
         # If no close match is found, use Gemini for a custom response
-        if not closest_ailment:
+        if not context["ailments"]:
             prompt = f"""
             Suggest a {drink_type} or light food for someone who is feeling {user_input}.
             Consider:
-            - Severity: {severity}
+            {intent}
             - Weather: {weather_condition if weather_condition else 'unknown'}
+            - Dietary restrictions: {', '.join(diet_names(diets)) or 'none'}
             Provide a detailed, evidence-based recommendation with preparation instructions.
             Format the response as a brief paragraph.
             """
             try:
-                response = model.generate_content(prompt)
-                if not response or not response.text:
-                    raise RecommendationError("Failed to generate recommendation")
+                # Count the miss so frequent phrases can be promoted into the catalog offline
+                record_unmatched(processed_input)
+                text = get_custom_response(processed_input, drink_type, weather_condition, diets)
+                if text is None:
+                    with stage("custom_response"):
+                        response = _gemini_generate("custom_response", prompt)
+                    if not response or not response.text:
+                        raise RecommendationError("Failed to generate recommendation")
+                    text = response.text
+                    set_custom_response(processed_input, drink_type, weather_condition, text, diets)
                     
                 custom_response = {
                     "status": "success",
                     "ailment": processed_input,
                     "drink": f"Custom {drink_type.title()} Recommendation",
                     "benefits": ["Relieves " + processed_input, "Promotes wellness"],
-                    "brewing_tip": response.text,
+                    "brewing_tip": text,
                     "ingredients": ["Natural ingredients", "Based on availability"],
                     "youtube_keywords": f"natural remedies for {processed_input}",
-                    "personalized_message": response.text,
+                    "personalized_message": text,
                     "sustainability_score": 4.0,
                     "eco_friendly_tips": ["Choose organic ingredients", "Use reusable containers"],
                     "weather_adjusted": bool(weather_condition),
@@ -196,49 +415,11 @@ def generate_response(user_input, drink_type="tea", latitude=None, longitude=Non
                     "ailment": processed_input
                 }
         
-        # Use the closest matching ailment to fetch recommendations
-        recommendation = RECOMMENDATIONS[closest_ailment].copy()
-        
-        # Adjust recommendation based on weather if available
-        if weather_condition and weather_condition in WEATHER_RECOMMENDATIONS:
-            weather_rec = WEATHER_RECOMMENDATIONS[weather_condition]
-            recommendation['ingredients'].extend(weather_rec['boost'])
-            recommendation['brewing_tip'] += f" Weather tip: {''.join(weather_rec['boost'])}"
-        
-        # Generate personalized message using Cohere
-        try:
-            prompt = COHERE_PERSONALIZED_MESSAGE_PROMPT.format(
-                ailment=closest_ailment,
-                drink=recommendation[drink_type],
-                benefits=", ".join(recommendation["benefits"]),
-                brewing_tip=recommendation["brewing_tip"],
-                cultural_origin=recommendation["cultural_origin"],
-                scientific_evidence=recommendation["scientific_evidence"],
-                sustainability_score=recommendation["sustainability_score"],
-                eco_friendly_tips=", ".join(recommendation["eco_friendly_tips"])
-            )
-            
-            response = co.generate(
-                model="command",
-                prompt=prompt,
-                max_tokens=200,
-                temperature=0.7
-            )
-            personalized_message = response.generations[0].text.strip()
-        except Exception as e:
-            print(f"Error with Cohere API: {e}")
-            personalized_message = (
-                f"For your {closest_ailment}, I recommend {recommendation[drink_type]}. "
-                f"It's known for its {recommendation['benefits'][0].lower()} properties and has roots in {recommendation['cultural_origin']}. "
-                f"{recommendation['scientific_evidence']}. Here's a tip: {recommendation['brewing_tip']}"
-            )
-        
-        # Add required fields to response
-        recommendation['weather_adjusted'] = bool(weather_condition)
-        recommendation['personalized_message'] = personalized_message
-        recommendation['status'] = "success"
-        recommendation['ailment'] = closest_ailment
+        recommendation = context["recommendation"]
         recommendation['drink'] = recommendation[drink_type]
+        recommendation['drink_type'] = drink_type
+        if diets:
+            _apply_dietary_restrictions(recommendation, context["ailments"], drink_type, diets)
         
         return recommendation
         
@@ -249,9 +430,190 @@ def generate_response(user_input, drink_type="tea", latitude=None, longitude=Non
             "ailment": user_input
         }
     except Exception as e:
-        print(f"Unexpected error in generate_response: {e}")
+        print(f"Unexpected error in resolve_recommendation: {e}")
         return {
             "status": "error",
             "message": "An unexpected error occurred. Please try again.",
             "ailment": user_input
         }
+
+def _apply_dietary_restrictions(recommendation, ailments, drink_type, diets):
+    """
+    Swap in a compatible drink and drop incompatible ingredients, in place.
+
+    Drinks and ingredients are checked against the catalog's precompiled diet
+    bitmasks, so each test is a single mask comparison. When the requested
+    drink type has no compatible drink, the first other drink type that does
+    is served, and 'drink_type' names it. This also covers the weather-boost
+    ingredients added to the entry; the brewing tip is free text, so it gets
+    a note listing what to leave out.
+    """
+    catalog = get_catalog()
+    masks = catalog.drink_diets(ailments)
+    restrictions = ", ".join(diet_names(diets))
+    if not compatible(masks[drink_type], diets):
+        requested = recommendation['drink']
+        alternative = next(
+            (other for other in DRINK_TYPES if other != drink_type and compatible(masks[other], diets)), None
+        )
+        if alternative:
+            recommendation['drink'] = recommendation[alternative]
+            recommendation['drink_type'] = alternative
+            recommendation['dietary_note'] = (
+                f"{requested} doesn't suit a {restrictions} diet, so we suggest {recommendation['drink']} instead."
+            )
+        else:
+            recommendation['dietary_note'] = (
+                f"{requested} may not suit a {restrictions} diet; check the ingredients before preparing it."
+            )
+    recommendation['ingredients'] = [
+        ingredient for ingredient in recommendation['ingredients']
+        if compatible(catalog.ingredient_diet(ingredient), diets)
+    ]
+    leave_out = catalog.rules.violating_phrases(recommendation['brewing_tip'], diets)
+    if leave_out:
+        recommendation['brewing_tip'] += f" Dietary tip: leave out {', '.join(leave_out)} for a {restrictions} diet."
+    recommendation['dietary_restrictions'] = diet_names(diets)
+
+def _cached_message(prompt):
+    message = message_cache.get(prompt)
+    if message is None:
+        # A speculative run for this prompt may already be under way
+        message = speculator.claim(("message", prompt), timeout=COHERE_TIMEOUT)
+    return message
+
+def _prefetch_message(prompt):
+    message = _cohere_generate(prompt)
+    message_cache.set(prompt, message)
+    return message
+
+def prefetch_drink_variants(recommendation):
+    """
+    Speculatively generate the personalized messages for the other drink types.
+
+    The shared context is already cached, so these messages are the only part
+    of a drink switch that needs a provider call. Work runs on the low-priority
+    speculator and is skipped while the process is busy or Cohere is degraded.
+    """
+    if recommendation.get("status") != "success" or not recommendation.get("ailments"):
+        return
+    if cohere_breaker.state != CLOSED:
+        return
+    for drink_type in DRINK_TYPES:
+        if recommendation[drink_type] == recommendation["drink"]:
+            continue
+        prompt = build_message_prompt(dict(recommendation, drink=recommendation[drink_type]))
+        if message_cache.get(prompt) is None:
+            speculator.submit(("message", prompt), _prefetch_message, prompt)
+
+@timed_stage("personalize")
+def personalize_recommendation(recommendation):
+    """
+    Add a Cohere personalized message to a resolved recommendation.
+    """
+    if recommendation.get("status") != "success" or "personalized_message" in recommendation:
+        return recommendation
+
+    prompt = build_message_prompt(recommendation)
+    personalized_message = _cached_message(prompt)
+    if personalized_message is None:
+        try:
+            with speculator.foreground():
+                personalized_message = _cohere_generate(prompt)
+            message_cache.set(prompt, personalized_message)
+        except CircuitOpenError:
+            personalized_message = templated_message(recommendation)
+        except Exception as e:
+            print(f"Error with Cohere API: {e}")
+            personalized_message = templated_message(recommendation)
+
+    recommendation['personalized_message'] = personalized_message
+    prefetch_drink_variants(recommendation)
+    return recommendation
+
+def stream_personalized_message(recommendation):
+    """
+    Stream the Cohere personalized message for a resolved recommendation.
+
+    Yields text chunks as Cohere produces them; the concatenated chunks are the
+    complete message, also stored in recommendation['personalized_message'] when
+    the stream ends. If Cohere fails before any text, the templated fallback is
+    yielded instead; text already streamed is kept, as the user has read it. A
+    message already generated (or prefetched) for the same prompt is yielded at once.
+    """
+    if recommendation.get("status") != "success":
+        return
+    if "personalized_message" in recommendation:
+        yield recommendation["personalized_message"]
+        return
+
+    prompt = build_message_prompt(recommendation)
+    cached = _cached_message(prompt)
+    if cached is not None:
+        recommendation['personalized_message'] = cached
+        prefetch_drink_variants(recommendation)
+        yield cached
+        return
+
+    chunks = []
+    if not cohere_breaker.allow():
+        personalized_message = templated_message(recommendation)
+        recommendation['personalized_message'] = personalized_message
+        yield personalized_message
+        return
+
+    # The client timeout bounds each read; the breaker sees the whole stream's outcome
+    failed = False
+    start = time.perf_counter()
+    try:
+        with speculator.foreground(), provider_call("cohere", "generate_stream"):
+            stream = co.generate(
+                model="command",
+                prompt=prompt,
+                max_tokens=200,
+                temperature=0.7,
+                stream=True
+            )
+            for token in stream:
+                if token.text:
+                    chunks.append(token.text)
+                    yield token.text
+            personalized_message = "".join(chunks).strip()
+            if not personalized_message:
+                raise RecommendationError("Empty response from Cohere")
+        message_cache.set(prompt, personalized_message)
+    except Exception as e:
+        print(f"Error with Cohere API: {e}")
+        failed = True
+        personalized_message = "".join(chunks).strip()
+        if not personalized_message:
+            personalized_message = templated_message(recommendation)
+            yield personalized_message
+    finally:
+        # Also runs if the consumer abandons the stream, so a half-open probe is never lost
+        cohere_breaker.record(not failed, time.perf_counter() - start)
+
+    recommendation['personalized_message'] = personalized_message
+    prefetch_drink_variants(recommendation)
+
+def _generate_response(user_input, drink_type, latitude, longitude, dietary_restrictions=None):
+    recommendation = resolve_recommendation(user_input, drink_type, latitude, longitude, dietary_restrictions)
+    return personalize_recommendation(recommendation)
+
+def generate_response(user_input, drink_type="tea", latitude=None, longitude=None, dietary_restrictions=None):
+    """
+    Generate a personalized recommendation based on the user's input and context.
+
+    Concurrent calls with the same normalized input, drink type, weather cell
+    and dietary restrictions share one pipeline run; each caller gets its own
+    copy of the result.
+    """
+    if not isinstance(user_input, str):
+        return _generate_response(user_input, drink_type, latitude, longitude, dietary_restrictions)
+    try:
+        key = ("generate_response",) + make_result_key(
+            user_input, drink_type, latitude, longitude, "en", dietary_restrictions
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e), "ailment": ""}
+    return flight.do(key, _generate_response, user_input, drink_type, latitude, longitude, dietary_restrictions)
@@ -0,0 +1,371 @@
+# batch.py
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dietary import diet_mask
+from result_cache import normalize_input, location_cell
+
+DRINK_TYPES = ["tea", "coffee", "milkshake", "light_food"]
+
+# Fields tried, in order, for the symptom text and the record id
+INPUT_FIELDS = ["user_input", "text", "input", "body"]
+ID_FIELDS = ["id", "request_id"]
+
+# Completed results kept for deduplicating later identical inputs
+DEDUPE_CACHE_SIZE = 100000
+
+def run_recommendation(user_input, drink_type, latitude, longitude, dietary_restrictions=None):
+    """
+    Run the recommendation pipeline for one input, timing each stage.
+
+    Returns:
+        tuple: (recommendation, {stage: seconds})
+    """
+    import backend
+
+    timings = {}
+    start = time.perf_counter()
+    recommendation = backend.resolve_recommendation(
+        user_input, drink_type=drink_type, latitude=latitude, longitude=longitude,
+        dietary_restrictions=dietary_restrictions
+    )
+    resolved = time.perf_counter()
+    timings["resolve"] = resolved - start
+    recommendation = backend.personalize_recommendation(recommendation)
+    timings["personalize"] = time.perf_counter() - resolved
+    timings["total"] = time.perf_counter() - start
+    return recommendation, timings
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def parse_location(record):
+    """
+    Read a record's optional latitude and longitude.
+
+    Returns:
+        tuple: (latitude, longitude) as floats, or (None, None) without a location.
+
+    Raises:
+        ValueError: If only one is given, or either is not a valid coordinate.
+    """
+    latitude, longitude = record.get("latitude"), record.get("longitude")
+    if latitude is None and longitude is None:
+        return None, None
+    if latitude is None or longitude is None:
+        raise ValueError("latitude and longitude must be given together")
+    coordinates = []
+    for name, value, limit in (("latitude", latitude, 90), ("longitude", longitude, 180)):
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid {name}: {value!r}")
+        if not math.isfinite(number) or abs(number) > limit:
+            raise ValueError(f"Invalid {name}: {value!r}")
+        coordinates.append(number)
+    return tuple(coordinates)
+
+def read_jobs(path, input_field=None, id_field=None, default_drink="tea"):
+    """
+    Yield jobs from a JSONL file, one per non-empty line.
+
+    Lines that are not valid JSON objects, have no input text, or carry invalid
+    coordinates or dietary restrictions are yielded with an "error" instead of
+    input so they are reported, not silently lost.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            job = {"id": f"line-{line_number}"}
+            try:
+                record = json.loads(line)
+            except ValueError:
+                job["error"] = "Invalid JSON"
+                yield job
+                continue
+            if not isinstance(record, dict):
+                job["error"] = "Record is not a JSON object"
+                yield job
+                continue
+
+            for field in ([id_field] if id_field else ID_FIELDS):
+                if record.get(field) is not None:
+                    job["id"] = str(record[field])
+                    break
+
+            text = None
+            for field in ([input_field] if input_field else INPUT_FIELDS):
+                if isinstance(record.get(field), str) and record[field].strip():
+                    text = record[field]
+                    break
+            if text is None:
+                job["error"] = "No input text"
+                yield job
+                continue
+
+            drink_type = record.get("drink_type", default_drink)
+            if drink_type not in DRINK_TYPES:
+                job["error"] = f"Invalid drink type: {drink_type}"
+                yield job
+                continue
+
+            try:
+                latitude, longitude = parse_location(record)
+            except ValueError as e:
+                job["error"] = str(e)
+                yield job
+                continue
+
+            dietary_restrictions = record.get("dietary_restrictions") or []
+            try:
+                if not isinstance(dietary_restrictions, list):
+                    raise ValueError("dietary_restrictions must be a list of diet names")
+                diets = diet_mask(dietary_restrictions)
+            except ValueError as e:
+                job["error"] = str(e)
+                yield job
+                continue
+
+            job.update({
+                "user_input": text,
+                "drink_type": drink_type,
+                "latitude": latitude,
+                "longitude": longitude,
+                "dietary_restrictions": dietary_restrictions,
+                "diets": diets
+            })
+            yield job
+
+def load_checkpoint(path):
+    """
+    Collect the ids already written to an output file.
+
+    A partially written last line (from an interrupted run) is truncated so
+    appending resumes on a clean line boundary.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)["id"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+class BatchRunner:
+    """
+    Stream jobs through a bounded worker pool and write results as JSONL.
+    """
+
+    def __init__(self, output, workers=8, mode="thread", ordered=False, checkpoint_every=50):
+        self.output = output
+        self.workers = workers
+        self.ordered = ordered
+        self.checkpoint_every = checkpoint_every
+        self.window = workers * 4
+        pool = ProcessPoolExecutor if mode == "process" else ThreadPoolExecutor
+        self.executor = pool(max_workers=workers)
+        self.by_key = OrderedDict()
+        self.pending = deque()
+        self.written_since_sync = 0
+        self.stats = {
+            "records": 0,
+            "submitted": 0,
+            "deduplicated": 0,
+            "skipped": 0,
+            "errors": 0,
+            "stage_latency": {}
+        }
+
+    def submit(self, job):
+        """Queue a job, sharing the computation with any identical earlier input."""
+        self.stats["records"] += 1
+        if "error" in job:
+            self.pending.append((job, None, False))
+            return self._drain()
+
+        key = (
+            normalize_input(job["user_input"]),
+            job["drink_type"],
+            location_cell(job["latitude"], job["longitude"]),
+            job["diets"]
+        )
+        future = self.by_key.get(key)
+        duplicate = future is not None
+        if duplicate:
+            self.by_key.move_to_end(key)
+            self.stats["deduplicated"] += 1
+        else:
+            future = self.executor.submit(
+                run_recommendation, job["user_input"], job["drink_type"],
+                job["latitude"], job["longitude"], job["dietary_restrictions"]
+            )
+            self.stats["submitted"] += 1
+            self.by_key[key] = future
+            while len(self.by_key) > DEDUPE_CACHE_SIZE:
+                self.by_key.popitem(last=False)
+
+        self.pending.append((job, future, duplicate))
+        self._drain()
+
+    def _drain(self, final=False):
+        """Write finished results; block while the in-flight window is full."""
+        while self.pending:
+            must_wait = final or len(self.pending) >= self.window
+            if self.ordered:
+                job, future, duplicate = self.pending[0]
+                if future is not None and not future.done():
+                    if not must_wait:
+                        return
+                    future.result()
+                self.pending.popleft()
+                self._write(job, future, duplicate)
+                continue
+
+            ready = [item for item in self.pending if item[1] is None or item[1].done()]
+            if not ready:
+                if not must_wait:
+                    return
+                wait([item[1] for item in self.pending], return_when=FIRST_COMPLETED)
+                continue
+            for item in ready:
+                self.pending.remove(item)
+                self._write(*item)
+
+    def _write(self, job, future, duplicate):
+        record = {"id": job["id"]}
+        if future is None:
+            record.update({"status": "error", "message": job["error"]})
+        else:
+            try:
+                recommendation, timings = future.result()
+                record.update({
+                    "status": recommendation.get("status", "error"),
+                    "input": job["user_input"],
+                    "drink_type": job["drink_type"],
+                    "recommendation": recommendation,
+                    "deduplicated": duplicate
+                })
+                if not duplicate:
+                    record["latency_ms"] = {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}
+                    for stage, seconds in timings.items():
+                        self.stats["stage_latency"].setdefault(stage, []).append(seconds)
+            except Exception as e:
+                record.update({"status": "error", "input": job["user_input"], "message": str(e)})
+
+        if record["status"] != "success":
+            self.stats["errors"] += 1
+
+        self.output.write(json.dumps(record) + "\n")
+        self.written_since_sync += 1
+        if self.written_since_sync >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make everything written so far durable, so --resume can pick up from here."""
+        self.output.flush()
+        os.fsync(self.output.fileno())
+        self.written_since_sync = 0
+
+    def finish(self):
+        self._drain(final=True)
+        self.checkpoint()
+        self.executor.shutdown(wait=True)
+
+def build_report(stats, elapsed):
+    """Summarize a run: throughput, error rate and per-stage latency percentiles."""
+    processed = stats["records"]
+    report = {
+        "records": processed,
+        "skipped_from_checkpoint": stats["skipped"],
+        "pipeline_runs": stats["submitted"],
+        "deduplicated": stats["deduplicated"],
+        "errors": stats["errors"],
+        "error_rate": stats["errors"] / processed if processed else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(processed / elapsed, 2) if elapsed > 0 else 0.0,
+        "stage_latency_ms": {}
+    }
+    for stage, values in stats["stage_latency"].items():
+        report["stage_latency_ms"][stage] = {
+            "p50": round(percentile(values, 50) * 1000, 1),
+            "p95": round(percentile(values, 95) * 1000, 1),
+            "p99": round(percentile(values, 99) * 1000, 1),
+            "max": round(max(values) * 1000, 1)
+        }
+    return report
+
+def run_batch(input_path, output_path, workers=8, mode="thread", ordered=False,
+              resume=False, input_field=None, id_field=None, default_drink="tea",
+              checkpoint_every=50):
+    """
+    Score every record of a JSONL file and write one JSONL result per record.
+
+    Returns:
+        dict: The run report.
+    """
+    done = load_checkpoint(output_path) if resume else set()
+    start = time.perf_counter()
+
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as output:
+        runner = BatchRunner(output, workers=workers, mode=mode, ordered=ordered,
+                             checkpoint_every=checkpoint_every)
+        try:
+            for job in read_jobs(input_path, input_field, id_field, default_drink):
+                if job["id"] in done:
+                    runner.stats["skipped"] += 1
+                    continue
+                runner.submit(job)
+        finally:
+            runner.finish()
+
+    return build_report(runner.stats, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a JSONL file of symptom descriptions")
+    parser.add_argument("input", help="input JSONL file")
+    parser.add_argument("output", help="output JSONL file (also the resume checkpoint)")
+    parser.add_argument("--workers", type=int, default=8, help="maximum concurrent pipelines")
+    parser.add_argument("--mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--ordered", action="store_true", help="write results in input order")
+    parser.add_argument("--resume", action="store_true", help="skip ids already present in the output")
+    parser.add_argument("--input-field", help="field holding the symptom text")
+    parser.add_argument("--id-field", help="field holding the record id")
+    parser.add_argument("--drink-type", default="tea", choices=DRINK_TYPES,
+                        help="drink type for records that do not set one")
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="fsync the output every N records")
+    parser.add_argument("--report", help="also write the run report to this JSON file")
+    args = parser.parse_args()
+
+    report = run_batch(
+        args.input, args.output, workers=args.workers, mode=args.mode, ordered=args.ordered,
+        resume=args.resume, input_field=args.input_field, id_field=args.id_field,
+        default_drink=args.drink_type, checkpoint_every=args.checkpoint_every
+    )
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    print()
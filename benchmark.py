@@ -0,0 +1,244 @@
+# benchmark.py
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from batch import percentile
+from fake_providers import PROVIDERS, FaultProfile, fake_providers
+
+# Typical provider latencies in milliseconds, used unless overridden
+DEFAULT_LATENCY_MS = {
+    "cohere": 400,
+    "gemini": 300,
+    "openweather": 80,
+    "nominatim": 150,
+    "overpass": 500,
+    "google_places": 150,
+    "youtube": 120,
+    "googletrans": 60
+}
+
+# Mix of exact, paraphrased and unmatched inputs
+SAMPLE_INPUTS = [
+    "headache", "I have a terrible headache", "tired", "feeling exhausted after work",
+    "upset stomach", "stress", "quite stressed about exams", "sore throat",
+    "jet lag", "hangover"
+]
+SAMPLE_LOCATIONS = [(51.5074, -0.1278), (40.7128, -74.0060), (None, None)]
+DRINK_TYPES = ["tea", "coffee", "milkshake", "light_food"]
+LANGUAGES = ["fr", "es", "hi", "ja"]
+
+def _sample_recommendation():
+    from catalog import get_catalog
+    recommendation = get_catalog().recommendation("headache")
+    recommendation.update({
+        "status": "success",
+        "ailment": "headache",
+        "drink": recommendation["tea"],
+        "personalized_message": "Peppermint tea should ease your headache."
+    })
+    return recommendation
+
+def scenario_generate_response(rng):
+    import backend
+    latitude, longitude = rng.choice(SAMPLE_LOCATIONS)
+    result = backend.generate_response(
+        rng.choice(SAMPLE_INPUTS), drink_type=rng.choice(DRINK_TYPES),
+        latitude=latitude, longitude=longitude
+    )
+    return result.get("status") == "success"
+
+def scenario_translate_recommendation(rng):
+    import language_support
+    translated = language_support.translate_recommendation(_sample_recommendation(), rng.choice(LANGUAGES))
+    return translated is not None
+
+def scenario_find_nearby_stores(rng):
+    import maps
+    latitude, longitude = rng.choice(SAMPLE_LOCATIONS[:2])
+    return bool(maps.find_nearby_stores(latitude, longitude, ["Honey", "Fresh ginger root", "Almond milk"]))
+
+def scenario_find_nearby_places(rng):
+    import google_maps
+    latitude, longitude = rng.choice(SAMPLE_LOCATIONS[:2])
+    return bool(google_maps.find_nearby_places(latitude, longitude, ["honey"]))
+
+def scenario_search_youtube(rng):
+    import youtube
+    from catalog import get_catalog
+    keyword = rng.choice(get_catalog().columns["youtube_keywords"])
+    return bool(youtube.search_youtube(keyword))
+
+SCENARIOS = {
+    "generate_response": scenario_generate_response,
+    "translate_recommendation": scenario_translate_recommendation,
+    "find_nearby_stores": scenario_find_nearby_stores,
+    "find_nearby_places": scenario_find_nearby_places,
+    "search_youtube": scenario_search_youtube
+}
+
+def run_scenario(name, requests_count, concurrency, seed=0):
+    """
+    Call one scenario requests_count times with the given concurrency.
+
+    Returns:
+        dict: Throughput, error rate and latency percentiles.
+    """
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = 0
+
+    def one(index):
+        rng = random.Random(seed * 100003 + index)
+        start = time.perf_counter()
+        try:
+            ok = scenario(rng)
+        except Exception as e:
+            print(f"{name} raised: {e}", file=sys.stderr)
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, ok in executor.map(one, range(requests_count)):
+            latencies.append(latency)
+            errors += 0 if ok else 1
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests_count,
+        "concurrency": concurrency,
+        "errors": errors,
+        "error_rate": round(errors / requests_count, 4) if requests_count else 0.0,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests_count / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2) if latencies else 0.0
+        }
+    }
+
+def run_benchmark(scenarios, concurrency_levels, requests_count, profiles, seed=0, cache_backend="memory"):
+    """
+    Run every scenario at every concurrency level against the fake providers.
+    """
+    results = {}
+    with fake_providers(profiles, cache_backend=cache_backend) as fakes:
+        for name in scenarios:
+            results[name] = {}
+            for concurrency in concurrency_levels:
+                fakes.calls.reset()
+                result = run_scenario(name, requests_count, concurrency, seed)
+                result["provider_calls"] = fakes.calls.snapshot()
+                results[name][str(concurrency)] = result
+                print(
+                    f"{name:<26} c={concurrency:<4} {result['throughput_rps']:>8.2f} req/s  "
+                    f"p50={result['latency_ms']['p50']:>8.1f}ms  p95={result['latency_ms']['p95']:>8.1f}ms  "
+                    f"p99={result['latency_ms']['p99']:>8.1f}ms  errors={result['error_rate']:.1%}",
+                    file=sys.stderr
+                )
+
+    return {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": requests_count,
+            "seed": seed,
+            "cache_backend": cache_backend,
+            "profiles": {name: profile.to_dict() for name, profile in profiles.items()}
+        },
+        "results": results
+    }
+
+def compare(current, baseline, tolerance=0.15):
+    """
+    Compare a run with a saved baseline.
+
+    Returns:
+        list: Human-readable regressions (p95 latency up or throughput down by
+        more than tolerance) for scenario/concurrency pairs present in both.
+    """
+    regressions = []
+    for name, levels in current["results"].items():
+        for concurrency, result in levels.items():
+            base = baseline.get("results", {}).get(name, {}).get(concurrency)
+            if not base:
+                continue
+            p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+            if base_p95 and p95 > base_p95 * (1 + tolerance):
+                regressions.append(f"{name} c={concurrency}: p95 {base_p95}ms -> {p95}ms")
+            rps, base_rps = result["throughput_rps"], base["throughput_rps"]
+            if base_rps and rps < base_rps * (1 - tolerance):
+                regressions.append(f"{name} c={concurrency}: throughput {base_rps} -> {rps} req/s")
+    return regressions
+
+def _parse_overrides(values, cast):
+    """Parse 'provider=value' pairs; a bare value applies to every provider."""
+    overrides = {}
+    for value in values or []:
+        if "=" in value:
+            name, number = value.split("=", 1)
+            if name not in PROVIDERS:
+                raise SystemExit(f"Unknown provider '{name}', expected one of {PROVIDERS}")
+            overrides[name] = cast(number)
+        else:
+            overrides.update({name: cast(value) for name in PROVIDERS})
+    return overrides
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark SipSync against local provider stand-ins")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="calls per scenario and concurrency level")
+    parser.add_argument("--latency", action="append", metavar="[PROVIDER=]MS", help="provider latency override")
+    parser.add_argument("--jitter", action="append", metavar="[PROVIDER=]MS", help="latency jitter (+/- ms)")
+    parser.add_argument("--error-rate", action="append", metavar="[PROVIDER=]RATE", help="injected failure rate")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every latency and jitter")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write results to this JSON baseline file")
+    parser.add_argument("--compare", help="compare with a saved JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--cache-backend", choices=["memory", "sqlite", "redis"], default="memory",
+                        help="shared cache backend (redis uses a local stand-in)")
+    args = parser.parse_args()
+
+    latency = dict(DEFAULT_LATENCY_MS, **_parse_overrides(args.latency, float))
+    jitter = _parse_overrides(args.jitter, float)
+    error_rate = _parse_overrides(args.error_rate, float)
+    profiles = {
+        name: FaultProfile(
+            latency_ms=latency[name] * args.latency_scale,
+            jitter_ms=jitter.get(name, latency[name] * 0.2) * args.latency_scale,
+            error_rate=error_rate.get(name, 0.0),
+            seed=args.seed
+        )
+        for name in PROVIDERS
+    }
+    concurrency_levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    report = run_benchmark(args.scenario or list(SCENARIOS), concurrency_levels, args.requests, profiles, args.seed,
+                           args.cache_backend)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+    if not args.save:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,482 @@
+# cache.py
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, unquote
+from metrics import registry, record_cache
+from singleflight import flight
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Backend shared by every namespace: "memory" (per process), "sqlite" (per host) or "redis"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(BASE_DIR, "cache", "shared.sqlite3"))
+CACHE_URL = os.getenv("CACHE_URL", "redis://127.0.0.1:6379/0")
+
+# Total bytes kept by the memory and SQLite backends (Redis is bounded by its own maxmemory),
+# and the largest single value any backend stores
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+CACHE_MAX_VALUE_BYTES = int(os.getenv("CACHE_MAX_VALUE_BYTES", 1024 * 1024))
+
+# Prefix of every key, so several apps can share one Redis database
+KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "sipsync")
+
+# Keys longer than this are replaced by their digest
+MAX_PLAIN_KEY_LENGTH = 120
+
+# Cross-process fill lock: how long it is held at most, and how long others wait for the value
+LOCK_TTL = 30.0
+LOCK_WAIT = 10.0
+LOCK_POLL = 0.05
+
+registry.describe("sipsync_cache_errors_total", "counter", "Shared cache backend errors by backend and operation")
+
+class CacheError(Exception):
+    """Raised by a backend that cannot complete an operation."""
+    pass
+
+class MemoryBackend:
+    """Per-process LRU of serialized values, bounded by total bytes."""
+
+    name = "memory"
+    # Only this process sees the entries, so the single-flight group is all the locking needed
+    shared = False
+
+    def __init__(self, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at is not None and expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key, data, ttl=None):
+        with self._lock:
+            self._set(key, data, ttl)
+
+    def add(self, key, data, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] >= time.time()):
+                return False
+            self._set(key, data, ttl)
+            return True
+
+    def _set(self, key, data, ttl):
+        self._remove(key)
+        self._entries[key] = (time.time() + ttl if ttl else None, data)
+        self._bytes += len(key) + len(data)
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self, prefix=""):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(key) + len(entry[1])
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "entries": len(self._entries), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes}
+
+class SQLiteBackend:
+    """
+    Entries in a local SQLite file, shared by every worker process on the host.
+
+    Expired rows are misses; on roughly one write in PRUNE_EVERY, they are
+    deleted and the least recently used rows are dropped until the file holds
+    at most max_bytes of values.
+    """
+
+    name = "sqlite"
+    shared = True
+    PRUNE_EVERY = 200
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            self._local.conn = conn
+        return conn
+
+    def _run(self, operation, sql, params=()):
+        try:
+            return self._conn().execute(sql, params)
+        except sqlite3.Error as e:
+            raise CacheError(f"SQLite cache {operation} failed: {e}")
+
+    def get(self, key):
+        now = time.time()
+        row = self._run("get", "SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < now):
+            return None
+        self._run("touch", "UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+        return bytes(row[0])
+
+    def set(self, key, data, ttl=None):
+        now = time.time()
+        self._run(
+            "set",
+            "INSERT OR REPLACE INTO entries (key, value, expires_at, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(data), now + ttl if ttl else None, len(data), now)
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def add(self, key, data, ttl=None):
+        now = time.time()
+        # An expired row does not block the insert
+        self._run("add", "DELETE FROM entries WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = self._run(
+            "add",
+            "INSERT OR IGNORE INTO entries (key, value, expires_at, size, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, sqlite3.Binary(data), now + ttl if ttl else None, len(data), now)
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        self._run("delete", "DELETE FROM entries WHERE key = ?", (key,))
+
+    def clear(self, prefix=""):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        self._run("clear", "DELETE FROM entries WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+    def prune(self):
+        now = time.time()
+        self._run("prune", "DELETE FROM entries WHERE expires_at < ?", (now,))
+        total = self._run("prune", "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            # Drop the least recently used rows until a tenth of the budget is free again
+            self._run(
+                "prune",
+                "DELETE FROM entries WHERE key IN (SELECT key FROM ("
+                "SELECT key, SUM(size) OVER (ORDER BY last_used DESC) AS kept FROM entries"
+                ") WHERE kept > ?)",
+                (self.max_bytes * 0.9,)
+            )
+
+    def stats(self):
+        entries, size = self._run("stats", "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"backend": self.name, "path": self.path, "entries": entries, "bytes": size,
+                "max_bytes": self.max_bytes}
+
+class RedisBackend:
+    """
+    Entries in a Redis-protocol server (Redis, Valkey, KeyDB, or the stand-in
+    in fake_providers), shared by every worker on every host.
+
+    Speaks RESP directly over one socket per thread, so no client library is
+    needed. Total size is bounded by the server's maxmemory policy.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url=CACHE_URL, timeout=2.0):
+        parts = urlsplit(url)
+        if parts.scheme not in ("redis", ""):
+            raise CacheError(f"Unsupported cache URL {url}")
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.db = int(parts.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            if self.password:
+                self._send(conn, "AUTH", self.password)
+            if self.db:
+                self._send(conn, "SELECT", self.db)
+        return conn
+
+    def _send(self, conn, *args):
+        sock, reader = conn
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        sock.sendall(b"".join(parts))
+        return self._read(reader)
+
+    def _read(self, reader):
+        line = reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise CacheError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise CacheError(f"Cache server error: {rest.decode('utf-8', 'replace')}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read(reader) for _ in range(length)]
+        raise CacheError(f"Unexpected reply from cache server: {line!r}")
+
+    def command(self, *args):
+        try:
+            return self._send(self._connection(), *args)
+        except (OSError, ValueError) as e:
+            self._close()
+            raise CacheError(f"Redis cache {args[0]} failed: {e}")
+        except CacheError:
+            self._close()
+            raise
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, data, ttl=None):
+        if ttl:
+            self.command("SET", key, data, "PX", int(ttl * 1000))
+        else:
+            self.command("SET", key, data)
+
+    def add(self, key, data, ttl=None):
+        args = ["SET", key, data, "NX"]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        return self.command(*args) == "OK"
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def clear(self, prefix=""):
+        cursor = "0"
+        while True:
+            cursor, keys = self.command("SCAN", cursor, "MATCH", prefix + "*", "COUNT", 500)
+            cursor = cursor.decode("utf-8") if isinstance(cursor, bytes) else str(cursor)
+            if keys:
+                self.command("DEL", *keys)
+            if cursor == "0":
+                break
+
+    def stats(self):
+        return {"backend": self.name, "url": f"redis://{self.host}:{self.port}/{self.db}",
+                "keys": self.command("DBSIZE")}
+
+def make_backend(kind=CACHE_BACKEND):
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "redis":
+        return RedisBackend()
+    raise CacheError(f"Unknown CACHE_BACKEND {kind!r} (expected memory, sqlite or redis)")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """The process-wide backend chosen by CACHE_BACKEND."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = make_backend()
+    return _backend
+
+_MISSING = object()
+
+class Cache:
+    """
+    A namespace in the shared cache.
+
+    Values are stored as JSON, so anything the pipeline produces (recommendation
+    dicts, weather conditions, translations, store and video lists) round-trips,
+    and every get returns a fresh object callers may modify. Tuples come back
+    as lists. Backend failures are logged and treated as misses, so a cache
+    outage only costs upstream calls.
+    """
+
+    def __init__(self, namespace, ttl=None, version=1, max_value_bytes=CACHE_MAX_VALUE_BYTES, backend=None):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.version = version
+        self.max_value_bytes = max_value_bytes
+        self._backend = backend
+
+    @property
+    def backend(self):
+        return self._backend or get_backend()
+
+    @property
+    def prefix(self):
+        # Bumping version orphans every entry written by earlier code
+        return f"{KEY_PREFIX}:{self.namespace}:v{self.version}:"
+
+    def key(self, key):
+        plain = key if isinstance(key, str) else json.dumps(key, separators=(",", ":"), default=str)
+        if len(plain) > MAX_PLAIN_KEY_LENGTH:
+            plain = hashlib.sha1(plain.encode("utf-8")).hexdigest()
+        return self.prefix + plain
+
+    def _call(self, operation, *args, default=None):
+        backend = self.backend
+        try:
+            return getattr(backend, operation)(*args)
+        except CacheError as e:
+            registry.inc("sipsync_cache_errors_total", backend=backend.name, operation=operation)
+            print(f"Cache {operation} error ({self.namespace}): {e}")
+            return default
+
+    def _load(self, full_key):
+        data = self._call("get", full_key)
+        if data is None:
+            return _MISSING
+        try:
+            return json.loads(data)
+        except ValueError:
+            return _MISSING
+
+    def _store(self, full_key, value, ttl):
+        data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if len(data) > self.max_value_bytes:
+            return False
+        self._call("set", full_key, data, ttl or self.ttl)
+        return True
+
+    def get(self, key, default=None):
+        value = self._load(self.key(key))
+        record_cache(self.namespace, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None):
+        """Store a JSON-serializable value; returns False if it exceeds max_value_bytes."""
+        return self._store(self.key(key), value, ttl)
+
+    def delete(self, key):
+        self._call("delete", self.key(key))
+
+    def clear(self):
+        """Drop every entry in this namespace, of every version."""
+        self._call("clear", f"{KEY_PREFIX}:{self.namespace}:")
+
+    def get_or_compute(self, key, compute, ttl=None, cache_if=None):
+        """
+        Get a value, computing and storing it on a miss.
+
+        Stampede protection: concurrent misses in this process share one
+        compute() call, and with a shared backend a lock key lets one process
+        fill the entry while the others wait up to LOCK_WAIT seconds for it.
+
+        Args:
+            compute: Zero-argument callable producing the value. Exceptions
+                propagate and nothing is stored.
+            cache_if: Optional predicate; values it rejects are returned but
+                not stored (e.g. failed lookups).
+        """
+        full_key = self.key(key)
+        value = self._load(full_key)
+        record_cache(self.namespace, value is not _MISSING)
+        if value is not _MISSING:
+            return value
+        return flight.do(("cache", full_key), self._fill, full_key, compute, ttl, cache_if)
+
+    def _fill(self, full_key, compute, ttl, cache_if):
+        # A caller that missed just before the previous fill stored its value lands here
+        value = self._load(full_key)
+        if value is not _MISSING:
+            return value
+        backend = self.backend
+        lock_key = None
+        if backend.shared:
+            if self._call("add", full_key + ":lock", b"1", LOCK_TTL, default=True):
+                lock_key = full_key + ":lock"
+            else:
+                # Another process is filling this entry
+                deadline = time.monotonic() + LOCK_WAIT
+                while time.monotonic() < deadline:
+                    time.sleep(LOCK_POLL)
+                    value = self._load(full_key)
+                    if value is not _MISSING:
+                        return value
+        try:
+            value = compute()
+            if cache_if is None or cache_if(value):
+                self._store(full_key, value, ttl)
+            return value
+        finally:
+            if lock_key:
+                self._call("delete", lock_key)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared cache tools")
+    parser.add_argument("--stats", action="store_true", help="show backend statistics")
+    parser.add_argument("--clear", metavar="NAMESPACE", action="append",
+                        help="drop every entry in a namespace (repeatable)")
+    args = parser.parse_args()
+
+    for namespace in args.clear or []:
+        Cache(namespace).clear()
+        print(f"Cleared {namespace}")
+    if args.stats or not args.clear:
+        print(json.dumps(get_backend().stats(), indent=2))
@@ -0,0 +1,437 @@
+# catalog.py
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import pickle
+import sys
+import threading
+import time
+from dietary import ALL_DIETS, DIETARY_RULES_PATH, load_rules
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Catalog source (JSON or CSV); train.RECOMMENDATIONS is used if it does not exist
+CATALOG_PATH = os.getenv("CATALOG_PATH", os.path.join(BASE_DIR, "data", "recommendations.json"))
+
+# Compiled copies of the catalog, reused while the source is unchanged
+CATALOG_CACHE_DIR = os.getenv("CATALOG_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+# How often, in seconds, get_catalog() checks the source for changes (0 disables)
+CATALOG_CHECK_INTERVAL = float(os.getenv("CATALOG_CHECK_INTERVAL", 5))
+
+# Bump when the compiled layout changes so stale compiled files are ignored
+COMPILED_FORMAT = 2
+
+# Per-ailment fields, in record order
+TEXT_FIELDS = (
+    "tea", "coffee", "milkshake", "light_food", "brewing_tip", "youtube_keywords",
+    "cultural_origin", "scientific_evidence"
+)
+LIST_FIELDS = ("benefits", "ingredients", "eco_friendly_tips", "synonyms")
+FIELDS = ("name",) + TEXT_FIELDS + LIST_FIELDS + ("sustainability_score",)
+
+# Text fields naming the drink offered for each drink type
+DRINK_FIELDS = ("tea", "coffee", "milkshake", "light_food")
+
+# CSV cells holding lists separate their items with this character
+CSV_LIST_SEPARATOR = "|"
+
+class CatalogError(Exception):
+    """Raised when a catalog source cannot be read or is invalid."""
+    pass
+
+class CatalogEntry:
+    """One ailment's recommendations; list fields are immutable tuples."""
+
+    __slots__ = FIELDS
+
+    def __init__(self, *values):
+        for field, value in zip(FIELDS, values):
+            setattr(self, field, value)
+
+    def to_dict(self):
+        """
+        Get the entry in the original RECOMMENDATIONS dict format.
+
+        Lists are fresh copies, so callers may extend them freely.
+        """
+        data = {field: getattr(self, field) for field in TEXT_FIELDS}
+        for field in LIST_FIELDS:
+            if field != "synonyms":
+                data[field] = list(getattr(self, field))
+        data["sustainability_score"] = self.sustainability_score
+        return data
+
+def normalize_term(term):
+    return " ".join(str(term).lower().split())
+
+class Catalog:
+    """
+    Immutable, column-oriented catalog with prebuilt lookup indexes.
+
+    Columns are tuples of interned strings, and identical list values are
+    shared, which keeps 100k+ entries compact and fast to unpickle.
+    """
+
+    def __init__(self, columns, version, source=None, indexes=None, rules=None):
+        self.columns = columns
+        self.version = version
+        self.source = source
+        self.names = columns["name"]
+        self.rules = rules or load_rules()
+        self.indexes = indexes or build_indexes(columns, self.rules)
+        self.name_index = self.indexes["name"]
+        self.term_index = self.indexes["term"]
+        self.ingredient_index = self.indexes["ingredient"]
+        self.diet_index = self.indexes["diet"]
+        self.ingredient_diet_index = self.indexes["ingredient_diet"]
+        self._terms = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return normalize_term(name) in self.name_index
+
+    def keys(self):
+        return list(self.names)
+
+    def terms(self):
+        """Every normalized name and synonym, for fuzzy matching; resolve hits with lookup()."""
+        if self._terms is None:
+            self._terms = list(self.term_index)
+        return self._terms
+
+    def entry(self, name):
+        """Get the CatalogEntry for an ailment name, or None."""
+        i = self.name_index.get(normalize_term(name))
+        if i is None:
+            return None
+        return CatalogEntry(*(self.columns[field][i] for field in FIELDS))
+
+    def lookup(self, term):
+        """Resolve an exact ailment name or synonym to its canonical name, or None."""
+        i = self.term_index.get(normalize_term(term))
+        return self.names[i] if i is not None else None
+
+    def recommendation(self, name):
+        """Get a fresh, mutable recommendation dict for an ailment, or None."""
+        entry = self.entry(name)
+        return entry.to_dict() if entry is not None else None
+
+    def merged_recommendation(self, names):
+        """
+        Combine several ailments' entries into one recommendation dict.
+
+        The first ailment leads: its YouTube keywords are used and its items
+        come first. Drinks and tips are joined, list fields are deduplicated
+        case-insensitively and the sustainability score is the mean.
+        """
+        entries = [entry for entry in (self.entry(name) for name in names) if entry is not None]
+        if not entries:
+            return None
+        if len(entries) == 1:
+            return entries[0].to_dict()
+
+        def unique(values):
+            seen, result = set(), []
+            for value in values:
+                if value and value.lower() not in seen:
+                    seen.add(value.lower())
+                    result.append(value)
+            return result
+
+        merged = {}
+        for field in ("tea", "coffee", "milkshake", "light_food"):
+            merged[field] = " + ".join(unique(getattr(entry, field) for entry in entries))
+        for field in ("benefits", "ingredients", "eco_friendly_tips"):
+            merged[field] = unique(item for entry in entries for item in getattr(entry, field))
+        merged["brewing_tip"] = " ".join(
+            f"For {entry.name}: {entry.brewing_tip}" for entry in entries if entry.brewing_tip
+        )
+        merged["youtube_keywords"] = entries[0].youtube_keywords
+        merged["cultural_origin"] = "; ".join(unique(entry.cultural_origin for entry in entries))
+        merged["scientific_evidence"] = "; ".join(unique(entry.scientific_evidence for entry in entries))
+        merged["sustainability_score"] = round(
+            sum(entry.sustainability_score for entry in entries) / len(entries), 1
+        )
+        return merged
+
+    def with_ingredient(self, ingredient):
+        """Names of ailments whose recommendation uses an ingredient."""
+        return [self.names[i] for i in self.ingredient_index.get(normalize_term(ingredient), [])]
+
+    def drink_diets(self, names):
+        """
+        Diet bitmask of each drink type's drink for one ailment or a merged set.
+
+        Returns:
+            dict: Drink type -> mask (see dietary.DIETS); merged drinks are
+            compatible only with the diets all their parts are.
+        """
+        masks = dict.fromkeys(DRINK_FIELDS, ALL_DIETS)
+        for name in names:
+            i = self.name_index.get(normalize_term(name))
+            if i is not None:
+                for drink_type, mask in zip(DRINK_FIELDS, self.diet_index[i]):
+                    masks[drink_type] &= mask
+        return masks
+
+    def ingredient_diet(self, ingredient):
+        """Diet bitmask of an ingredient, precompiled for catalog ingredients."""
+        mask = self.ingredient_diet_index.get(normalize_term(ingredient))
+        return mask if mask is not None else self.rules.mask(ingredient)
+
+def build_indexes(columns, rules=None):
+    """Build the name, name-or-synonym, ingredient and diet bitmask indexes."""
+    rules = rules or load_rules()
+    name_index = {normalize_term(name): i for i, name in enumerate(columns["name"])}
+    # Synonyms never shadow a real ailment name
+    term_index = {}
+    for i, synonyms in enumerate(columns["synonyms"]):
+        for synonym in synonyms:
+            term_index.setdefault(normalize_term(synonym), i)
+    term_index.update(name_index)
+    ingredient_index = {}
+    for i, ingredients in enumerate(columns["ingredients"]):
+        for ingredient in ingredients:
+            ingredient_index.setdefault(normalize_term(ingredient), []).append(i)
+    diet_index = tuple(
+        tuple(rules.mask(columns[field][i]) for field in DRINK_FIELDS) for i in range(len(columns["name"]))
+    )
+    ingredient_diet_index = {ingredient: rules.mask(ingredient) for ingredient in ingredient_index}
+    return {"name": name_index, "term": term_index, "ingredient": ingredient_index,
+            "diet": diet_index, "ingredient_diet": ingredient_diet_index}
+
+def _compile_records(records):
+    """Turn raw record dicts into interned, deduplicated columns."""
+    shared = {}
+
+    def share(values):
+        values = tuple(values)
+        existing = shared.get(values)
+        if existing is None:
+            existing = shared[values] = tuple(sys.intern(str(v)) for v in values)
+        return existing
+
+    columns = {field: [] for field in FIELDS}
+    seen = set()
+    for record in records:
+        name = str(record.get("name") or "").strip().lower()
+        if not name:
+            raise CatalogError("Every catalog entry needs a name")
+        if name in seen:
+            raise CatalogError(f"Duplicate catalog entry: {name}")
+        seen.add(name)
+
+        columns["name"].append(sys.intern(name))
+        for field in TEXT_FIELDS:
+            columns[field].append(sys.intern(str(record.get(field) or "")))
+        for field in LIST_FIELDS:
+            value = record.get(field) or ()
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(CSV_LIST_SEPARATOR) if item.strip()]
+            columns[field].append(share(value))
+        try:
+            columns["sustainability_score"].append(float(record.get("sustainability_score") or 0.0))
+        except (TypeError, ValueError):
+            raise CatalogError(f"Invalid sustainability_score for {name}")
+
+    return {field: tuple(values) for field, values in columns.items()}
+
+def _read_source(path):
+    """Read raw records from a JSON (object or list) or CSV catalog."""
+    try:
+        if path.endswith(".csv"):
+            with open(path, 'r', encoding='utf-8', newline='') as f:
+                return list(csv.DictReader(f))
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CatalogError(f"Cannot read catalog {path}: {e}")
+
+    if isinstance(data, dict):
+        return [dict(entry, name=name) for name, entry in data.items()]
+    if isinstance(data, list):
+        return data
+    raise CatalogError(f"Catalog {path} must be a JSON object or list")
+
+def _builtin_catalog():
+    from train import RECOMMENDATIONS
+    records = [dict(entry, name=name) for name, entry in RECOMMENDATIONS.items()]
+    rules = load_rules()
+    digest = hashlib.sha1(json.dumps(records, sort_keys=True).encode("utf-8") + rules.digest.encode()).hexdigest()[:12]
+    return Catalog(_compile_records(records), version=f"builtin-{digest}", rules=rules)
+
+def _compiled_path(path):
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CATALOG_CACHE_DIR, f"catalog-{key}.pickle")
+
+def load_catalog(path=CATALOG_PATH):
+    """
+    Load a catalog, preferring a compiled copy that matches the source.
+
+    The version is a digest of the source file and the dietary rules, so every
+    process loading the same files agrees on it.
+    """
+    if not os.path.exists(path):
+        return _builtin_catalog()
+
+    with open(path, 'rb') as f:
+        raw = f.read()
+    rules = load_rules()
+    version = hashlib.sha1(raw + rules.digest.encode()).hexdigest()[:12]
+    compiled_path = _compiled_path(path)
+
+    try:
+        with open(compiled_path, 'rb') as f:
+            compiled = pickle.load(f)
+        if compiled.get("format") == COMPILED_FORMAT and compiled.get("version") == version:
+            return Catalog(compiled["columns"], version, source=path, indexes=compiled["indexes"], rules=rules)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Ignoring unreadable compiled catalog {compiled_path}: {e}")
+
+    columns = _compile_records(_read_source(path))
+    catalog = Catalog(columns, version, source=path, rules=rules)
+    try:
+        os.makedirs(CATALOG_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{compiled_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({"format": COMPILED_FORMAT, "version": version, "columns": columns,
+                         "indexes": catalog.indexes},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, compiled_path)
+    except OSError as e:
+        print(f"Could not save compiled catalog: {e}")
+    return catalog
+
+_catalog = None
+_source_stat = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except OSError:
+        return None
+
+def get_catalog():
+    """
+    Get the current catalog, reloading it if the source file or dietary rules changed.
+
+    Reloads swap in a fully built Catalog, so callers holding the previous one
+    keep a consistent view; fetch it once per request and use that object.
+    A source that fails to load leaves the current catalog in place.
+    """
+    global _catalog, _source_stat, _checked_at
+    now = time.monotonic()
+    catalog = _catalog
+    if catalog is not None and (CATALOG_CHECK_INTERVAL <= 0 or now - _checked_at < CATALOG_CHECK_INTERVAL):
+        return catalog
+
+    with _lock:
+        # Another thread may have loaded or checked while we waited
+        if _catalog is not None and (CATALOG_CHECK_INTERVAL <= 0 or now - _checked_at < CATALOG_CHECK_INTERVAL):
+            return _catalog
+        _checked_at = now
+        source_stat = (_stat(CATALOG_PATH), _stat(DIETARY_RULES_PATH))
+        if _catalog is not None and source_stat == _source_stat:
+            return _catalog
+        try:
+            _catalog = load_catalog(CATALOG_PATH)
+            _source_stat = source_stat
+        except CatalogError as e:
+            if _catalog is None:
+                raise
+            print(f"Keeping catalog {_catalog.version}: {e}")
+        return _catalog
+
+def update_catalog_source(path=CATALOG_PATH, synonyms=None, entries=None):
+    """
+    Add synonyms to existing ailments and append new entries in a JSON catalog.
+
+    Args:
+        synonyms (dict): Ailment name -> list of new synonyms.
+        entries (list): Full records, each with a "name"; existing names are skipped.
+
+    The file is replaced atomically, so running processes reload either the
+    old or the new catalog, never a partial one.
+    """
+    if path.endswith(".csv"):
+        raise CatalogError("Catalog updates need a JSON source; convert it with --export first")
+    if not os.path.exists(path):
+        export_catalog(path)
+    records = _read_source(path)
+    by_name = {normalize_term(record["name"]): record for record in records}
+
+    for name, new_synonyms in (synonyms or {}).items():
+        record = by_name.get(normalize_term(name))
+        if record is None:
+            raise CatalogError(f"Unknown ailment {name}")
+        existing = list(record.get("synonyms") or [])
+        known = {normalize_term(term) for term in existing + [record["name"]]}
+        for synonym in new_synonyms:
+            if normalize_term(synonym) not in known:
+                existing.append(synonym)
+                known.add(normalize_term(synonym))
+        record["synonyms"] = existing
+
+    for entry in entries or []:
+        if normalize_term(entry["name"]) not in by_name:
+            record = dict(entry)
+            records.append(record)
+            by_name[normalize_term(record["name"])] = record
+
+    # Validate before writing so a bad entry never reaches the running app
+    _compile_records(records)
+    data = {record["name"]: {k: v for k, v in record.items() if k != "name"} for record in records}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+def export_catalog(path, catalog=None):
+    """Write a catalog as JSON (object keyed by ailment) or CSV, e.g. to seed a data file."""
+    catalog = catalog or get_catalog()
+    entries = [catalog.entry(name) for name in catalog.names]
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if path.endswith(".csv"):
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            for entry in entries:
+                writer.writerow({
+                    field: CSV_LIST_SEPARATOR.join(value) if field in LIST_FIELDS else value
+                    for field, value in ((field, getattr(entry, field)) for field in FIELDS)
+                })
+    else:
+        data = {}
+        for entry in entries:
+            data[entry.name] = dict(entry.to_dict(), synonyms=list(entry.synonyms))
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+    os.replace(tmp_path, path)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recommendation catalog tools")
+    parser.add_argument("--compile", action="store_true", help="compile the catalog source and report timings")
+    parser.add_argument("--export", metavar="PATH", help="write the current catalog as JSON or CSV")
+    args = parser.parse_args()
+
+    if args.export:
+        export_catalog(args.export)
+        print(f"Exported catalog to {args.export}")
+    if args.compile or not args.export:
+        start = time.perf_counter()
+        catalog = load_catalog(CATALOG_PATH)
+        print(f"Loaded {len(catalog)} entries (version {catalog.version}) "
+              f"in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,184 @@
+# circuit_breaker.py
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from metrics import registry
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Gauge values for sipsync_circuit_state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+registry.describe("sipsync_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)")
+registry.describe("sipsync_circuit_rejections_total", "counter", "Calls short-circuited by an open breaker")
+registry.describe("sipsync_circuit_timeouts_total", "counter", "Provider calls abandoned after their hard timeout")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+    pass
+
+class ProviderTimeout(Exception):
+    """Raised when a provider call exceeds its hard timeout."""
+    pass
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open breaker for one provider.
+
+    Outcomes are kept for a rolling window. The breaker opens when, with at
+    least min_calls in the window, the share of failed calls reaches
+    failure_rate or the share of calls slower than slow_call_seconds reaches
+    slow_call_rate. After open_seconds it lets half_open_calls probes through;
+    if they all succeed it closes, otherwise it opens again.
+    """
+
+    def __init__(self, name, failure_rate=0.5, slow_call_rate=0.8, slow_call_seconds=5.0,
+                 min_calls=5, window_seconds=60.0, open_seconds=30.0, half_open_calls=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._lock = threading.Lock()
+        self._outcomes = deque()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        registry.set_gauge("sipsync_circuit_state", STATE_VALUES[CLOSED], provider=name)
+
+    @property
+    def state(self):
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _set_state(self, state):
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != CLOSED:
+            self._probes = 0
+            self._probe_successes = 0
+        self._outcomes.clear()
+        registry.set_gauge("sipsync_circuit_state", STATE_VALUES[state], provider=self.name)
+        print(f"Circuit breaker '{self.name}' is now {state}")
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+
+    def allow(self):
+        """Check whether a call may go through; half-open admits a limited number of probes."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+        registry.inc("sipsync_circuit_rejections_total", provider=self.name)
+        return False
+
+    def record(self, success, duration):
+        """Record the outcome of a call admitted by allow()."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if not success or duration >= self.slow_call_seconds:
+                    self._set_state(OPEN)
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self._set_state(CLOSED)
+                return
+            if self._state == OPEN:
+                # A call admitted before the breaker opened finished late
+                return
+
+            self._outcomes.append((now, not success, duration >= self.slow_call_seconds))
+            while self._outcomes and now - self._outcomes[0][0] > self.window_seconds:
+                self._outcomes.popleft()
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for _, failed, _ in self._outcomes if failed)
+            slow = sum(1 for _, _, is_slow in self._outcomes if is_slow)
+            if failures / calls >= self.failure_rate or slow / calls >= self.slow_call_rate:
+                self._set_state(OPEN)
+
+    def reset(self):
+        with self._lock:
+            self._set_state(CLOSED)
+
+# Hung provider calls keep a thread until the SDK gives up; cap how many can pile up
+_call_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PROVIDER_CALL_THREADS", 32)),
+    thread_name_prefix="sipsync-provider"
+)
+
+def call_with_timeout(func, timeout, *args, **kwargs):
+    """
+    Run func on the provider pool and wait at most timeout seconds.
+
+    The caller is released on timeout; the abandoned call finishes (or fails)
+    in the background.
+    """
+    future = _call_executor.submit(func, *args, **kwargs)
+    try:
+        return future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        future.cancel()
+        raise ProviderTimeout(f"Call did not finish within {timeout}s")
+
+def guarded_call(breaker, func, *args, timeout=None, **kwargs):
+    """
+    Call func through breaker, with a hard timeout if given.
+
+    Raises:
+        CircuitOpenError: Without calling func, if the breaker is open.
+        ProviderTimeout: If the call exceeds timeout.
+    """
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} circuit is open")
+    start = time.perf_counter()
+    try:
+        if timeout is None:
+            result = func(*args, **kwargs)
+        else:
+            result = call_with_timeout(func, timeout, *args, **kwargs)
+    except ProviderTimeout:
+        registry.inc("sipsync_circuit_timeouts_total", provider=breaker.name)
+        breaker.record(False, time.perf_counter() - start)
+        raise
+    except Exception:
+        breaker.record(False, time.perf_counter() - start)
+        raise
+    breaker.record(True, time.perf_counter() - start)
+    return result
+
+def _env_breaker(name, timeout):
+    """Breaker for a provider, tunable via <NAME>_BREAKER_* environment variables."""
+    prefix = name.upper()
+    return CircuitBreaker(
+        name,
+        failure_rate=float(os.getenv(f"{prefix}_BREAKER_FAILURE_RATE", 0.5)),
+        slow_call_seconds=float(os.getenv(f"{prefix}_BREAKER_SLOW_SECONDS", timeout * 0.8)),
+        min_calls=int(os.getenv(f"{prefix}_BREAKER_MIN_CALLS", 5)),
+        open_seconds=float(os.getenv(f"{prefix}_BREAKER_OPEN_SECONDS", 30))
+    )
+
+# Hard per-call timeouts, in seconds
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 8))
+COHERE_TIMEOUT = float(os.getenv("COHERE_TIMEOUT", 10))
+
+gemini_breaker = _env_breaker("gemini", GEMINI_TIMEOUT)
+cohere_breaker = _env_breaker("cohere", COHERE_TIMEOUT)
@@ -0,0 +1,310 @@
+# custom_responses.py
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from metrics import record_cache
+from result_cache import normalize_input
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Persistent cache of Gemini custom responses and unmatched-input counts, shared by all workers
+CUSTOM_RESPONSE_CACHE_PATH = os.getenv(
+    "CUSTOM_RESPONSE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "custom_responses.sqlite3")
+)
+CUSTOM_RESPONSE_TTL = int(os.getenv("CUSTOM_RESPONSE_TTL", 30 * 24 * 60 * 60))
+CUSTOM_RESPONSE_MAX_ENTRIES = int(os.getenv("CUSTOM_RESPONSE_MAX_ENTRIES", 10000))
+
+# Unmatched inputs not seen for this long are forgotten
+UNMATCHED_RETENTION = 90 * 24 * 60 * 60
+
+# Prune expired and excess rows once every this many writes by a process
+PRUNE_EVERY = 100
+
+_writes = 0
+_writes_lock = threading.Lock()
+
+def _prune_due():
+    """Count a write; True on every PRUNE_EVERY-th one."""
+    global _writes
+    with _writes_lock:
+        _writes += 1
+        return _writes % PRUNE_EVERY == 0
+
+def _connect():
+    directory = os.path.dirname(CUSTOM_RESPONSE_CACHE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(CUSTOM_RESPONSE_CACHE_PATH, timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS custom_responses ("
+        "key TEXT PRIMARY KEY, input TEXT NOT NULL, text TEXT NOT NULL, "
+        "created_at REAL NOT NULL, last_used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS custom_responses_last_used ON custom_responses (last_used)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS unmatched_inputs ("
+        "input TEXT PRIMARY KEY, count INTEGER NOT NULL, sample TEXT NOT NULL, "
+        "first_seen REAL NOT NULL, last_seen REAL NOT NULL)"
+    )
+    return conn
+
+@contextmanager
+def _open_cache():
+    """Open the cache database, committing on success and always closing."""
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _cache_key(normalized_input, drink_type, weather_condition, diets=0):
+    if diets:
+        drink_type = f"{drink_type}/{diets}"
+    return f"{drink_type}|{weather_condition or '-'}|{normalized_input}"
+
+def get_custom_response(user_input, drink_type, weather_condition=None, diets=0):
+    """
+    Get the cached Gemini text for an unmatched input, or None.
+
+    The prompt depends on the drink type, weather and dietary restrictions (a
+    dietary.diet_mask), so all are part of the key.
+    """
+    key = _cache_key(normalize_input(user_input), drink_type, weather_condition, diets)
+    text = None
+    try:
+        with _open_cache() as conn:
+            row = conn.execute(
+                "SELECT text, created_at FROM custom_responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and time.time() - row[1] < CUSTOM_RESPONSE_TTL:
+                text = row[0]
+                conn.execute(
+                    "UPDATE custom_responses SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                    (time.time(), key)
+                )
+    except sqlite3.Error as e:
+        print(f"Custom response cache read error: {e}")
+    record_cache("custom_responses", text is not None)
+    return text
+
+def set_custom_response(user_input, drink_type, weather_condition, text, diets=0):
+    normalized = normalize_input(user_input)
+    now = time.time()
+    try:
+        with _open_cache() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO custom_responses (key, input, text, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (_cache_key(normalized, drink_type, weather_condition, diets), normalized, text, now, now)
+            )
+            if _prune_due():
+                _prune(conn, now)
+    except sqlite3.Error as e:
+        print(f"Custom response cache write error: {e}")
+
+def _prune(conn, now):
+    """Drop expired responses, the least recently used beyond the size limit, and stale counts."""
+    conn.execute("DELETE FROM custom_responses WHERE created_at < ?", (now - CUSTOM_RESPONSE_TTL,))
+    conn.execute(
+        "DELETE FROM custom_responses WHERE key IN ("
+        "SELECT key FROM custom_responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+        (CUSTOM_RESPONSE_MAX_ENTRIES,)
+    )
+    conn.execute("DELETE FROM unmatched_inputs WHERE last_seen < ?", (now - UNMATCHED_RETENTION,))
+
+def record_unmatched(user_input):
+    """Count an input that matched no catalog ailment."""
+    normalized = normalize_input(user_input)
+    if not normalized:
+        return
+    now = time.time()
+    try:
+        with _open_cache() as conn:
+            conn.execute(
+                "INSERT INTO unmatched_inputs (input, count, sample, first_seen, last_seen) "
+                "VALUES (?, 1, ?, ?, ?) "
+                "ON CONFLICT(input) DO UPDATE SET count = count + 1, last_seen = excluded.last_seen",
+                (normalized, str(user_input)[:200], now, now)
+            )
+            if _prune_due():
+                _prune(conn, now)
+    except sqlite3.Error as e:
+        print(f"Unmatched input tracking error: {e}")
+
+def top_unmatched(min_count=1, limit=50):
+    """
+    Get the most frequent unmatched inputs.
+
+    Returns:
+        list: (input, count, last_seen, sample) tuples, most frequent first,
+        where sample is the input as first typed, before normalization.
+    """
+    with _open_cache() as conn:
+        return conn.execute(
+            "SELECT input, count, last_seen, sample FROM unmatched_inputs WHERE count >= ? "
+            "ORDER BY count DESC, last_seen DESC LIMIT ?",
+            (min_count, limit)
+        ).fetchall()
+
+def forget(inputs):
+    """Drop counts and cached responses for inputs now covered by the catalog."""
+    with _open_cache() as conn:
+        for normalized in inputs:
+            conn.execute("DELETE FROM unmatched_inputs WHERE input = ?", (normalized,))
+            conn.execute("DELETE FROM custom_responses WHERE input = ?", (normalized,))
+
+# Fields Gemini must fill when drafting a new catalog entry
+ENTRY_DRAFT_PROMPT = """
+Draft a catalog entry for a wellness drink recommender for someone reporting: '{phrase}'.
+Return ONLY a JSON object with these keys:
+"tea", "coffee", "milkshake", "light_food" (one named suggestion each),
+"benefits" (3 short phrases), "ingredients" (3-4 items), "brewing_tip" (one sentence),
+"youtube_keywords", "sustainability_score" (number 1-5), "eco_friendly_tips" (2 short phrases),
+"cultural_origin", "scientific_evidence" (one sentence), "synonyms" (3-5 alternative phrasings).
+"""
+
+# Asked before an unmatched input becomes a synonym of the ailment it scores closest to
+SYNONYM_CONFIRM_PROMPT = """
+A wellness drink recommender maps symptom descriptions to ailments.
+Does '{phrase}' describe the ailment '{ailment}'?
+Answer ONLY yes or no.
+"""
+
+def _draft_entry(phrase):
+    """Ask Gemini for a full catalog entry; None if it does not return valid JSON with every field."""
+    import backend
+    from catalog import FIELDS
+
+    try:
+        response = backend._gemini_generate("draft_entry", ENTRY_DRAFT_PROMPT.format(phrase=phrase))
+        text = response.text.strip().strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+        record = json.loads(text)
+    except Exception as e:
+        print(f"Could not draft an entry for '{phrase}': {e}")
+        return None
+    missing = [field for field in FIELDS if field != "name" and field not in record]
+    if missing:
+        print(f"Draft for '{phrase}' is missing {missing}")
+        return None
+    record["name"] = phrase
+    return record
+
+def _confirm_synonym(phrase, ailment):
+    """Ask Gemini whether a phrase means an ailment; None if Gemini is unavailable."""
+    import backend
+
+    try:
+        response = backend._gemini_generate(
+            "confirm_synonym", SYNONYM_CONFIRM_PROMPT.format(phrase=phrase, ailment=ailment)
+        )
+        answer = response.text.strip().lower()
+    except Exception as e:
+        print(f"Could not confirm '{phrase}' as '{ailment}': {e}")
+        return None
+    if answer.startswith("yes"):
+        return True
+    if answer.startswith("no"):
+        return False
+    return None
+
+def plan_promotions(min_count=5, min_score=None, limit=50):
+    """
+    Propose how frequent unmatched inputs should join the catalog.
+
+    Inputs are scored the way the pipeline scores them, with negated symptoms
+    removed. These inputs already failed to match (or Gemini turned their
+    candidates down), so a close score alone is not trusted: an input whose
+    best match scores at least min_score becomes a synonym only once Gemini
+    confirms it means that ailment. Unconfirmed inputs are left for a later
+    run; the rest are proposed as new entries.
+
+    Returns:
+        list: dicts with "input", "sample" (as first typed), "count", "action"
+        ("covered", "synonym", "unconfirmed" or "entry"), and for synonyms and
+        unconfirmed inputs the target "ailment" and its "score".
+    """
+    from catalog import get_catalog
+    from semantic_matcher import get_matcher, AMBIGUOUS_SCORE
+    from symptom_extractor import extract_intent
+
+    min_score = AMBIGUOUS_SCORE if min_score is None else min_score
+    rows = top_unmatched(min_count, limit)
+    if not rows:
+        return []
+    catalog = get_catalog()
+    intents = [extract_intent(row[0], catalog) for row in rows]
+    texts = [intent.residual_text() if intent.negated else row[0] for row, intent in zip(rows, intents)]
+    scored = get_matcher(catalog).top_k_batch(texts, k=1 + max(len(intent.negated) for intent in intents))
+    plans = []
+    for (normalized, count, _, sample), intent, text, candidates in zip(rows, intents, texts, scored):
+        plan = {"input": normalized, "sample": sample, "count": count, "action": "entry"}
+        candidates = [c for c in candidates if c[0] not in intent.negated]
+        if catalog.lookup(normalized):
+            plan["action"] = "covered"
+        elif text and candidates and candidates[0][1] >= min_score:
+            ailment, score = candidates[0]
+            confirmed = _confirm_synonym(normalized, ailment)
+            if confirmed is not False:
+                plan.update({
+                    "action": "synonym" if confirmed else "unconfirmed",
+                    "ailment": ailment,
+                    "score": round(score, 3)
+                })
+        plans.append(plan)
+    return plans
+
+def apply_promotions(plans, draft_entries=False):
+    """
+    Write promoted synonyms (and optionally Gemini-drafted entries) into the
+    catalog source; the running app picks them up on its next catalog reload.
+
+    Returns:
+        dict: Counts of promoted synonyms and entries.
+    """
+    from catalog import CATALOG_PATH, update_catalog_source
+
+    synonyms, entries, done = {}, [], []
+    for plan in plans:
+        if plan["action"] == "synonym":
+            synonyms.setdefault(plan["ailment"], []).append(plan["input"])
+            done.append(plan["input"])
+        elif plan["action"] == "covered":
+            done.append(plan["input"])
+        elif plan["action"] == "entry" and draft_entries:
+            record = _draft_entry(plan["input"])
+            if record is not None:
+                entries.append(record)
+                done.append(plan["input"])
+
+    if synonyms or entries:
+        update_catalog_source(CATALOG_PATH, synonyms=synonyms, entries=entries)
+    forget(done)
+    return {"synonyms": sum(len(v) for v in synonyms.values()), "entries": len(entries)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Promote frequent unmatched inputs into the catalog")
+    parser.add_argument("--min-count", type=int, default=5, help="occurrences before an input is promoted")
+    parser.add_argument("--min-score", type=float, help="similarity needed to become a synonym")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--apply", action="store_true", help="write the promotions (default: dry run)")
+    parser.add_argument("--draft-entries", action="store_true",
+                        help="ask Gemini to draft new entries for inputs with no close ailment")
+    args = parser.parse_args()
+
+    plans = plan_promotions(args.min_count, args.min_score, args.limit)
+    for plan in plans:
+        target = f" -> {plan['ailment']} ({plan['score']})" if "ailment" in plan else ""
+        typed = f" (e.g. {plan['sample']!r})" if plan["sample"] != plan["input"] else ""
+        print(f"{plan['count']:>6}  {plan['action']:<11} {plan['input']}{typed}{target}")
+    if args.apply:
+        result = apply_promotions(plans, draft_entries=args.draft_entries)
+        print(f"Promoted {result['synonyms']} synonyms and {result['entries']} new entries", file=sys.stderr)
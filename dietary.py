@@ -0,0 +1,111 @@
+# dietary.py
+
+import hashlib
+import json
+import os
+import re
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Ingredient phrases with the diets they break, and explicit drink attributes
+DIETARY_RULES_PATH = os.getenv("DIETARY_RULES_PATH", os.path.join(BASE_DIR, "data", "dietary.json"))
+
+# One bit per diet; a mask has the bit set when the item is compatible with that diet
+DIETS = ("vegan", "vegetarian", "gluten-free", "dairy-free")
+DIET_BITS = {diet: 1 << i for i, diet in enumerate(DIETS)}
+ALL_DIETS = (1 << len(DIETS)) - 1
+
+def normalize_diet(name):
+    return "-".join(str(name).lower().replace("_", " ").replace("-", " ").split())
+
+def diet_mask(diets):
+    """Bitmask of a list of diet names, e.g. the Settings page's ["Vegan", "Gluten-free"]."""
+    mask = 0
+    for diet in diets or ():
+        bit = DIET_BITS.get(normalize_diet(diet))
+        if bit is None:
+            raise ValueError(f"Unknown diet '{diet}', expected one of {DIETS}")
+        mask |= bit
+    return mask
+
+def diet_names(mask):
+    return [diet for diet in DIETS if mask & DIET_BITS[diet]]
+
+def compatible(mask, required):
+    """Whether an item's mask satisfies every required diet."""
+    return mask & required == required
+
+class DietaryRules:
+    """
+    Maps ingredient and drink text to diet bitmasks.
+
+    Text is matched word by word against rule phrases, longest phrase first,
+    so "almond milk" overrides "milk" and "dark chocolate" overrides
+    "chocolate". Drinks listed under "drinks" use their explicit diets instead.
+    """
+
+    def __init__(self, ingredients=None, drinks=None, digest=""):
+        self.violations = {}
+        for phrase, diets in (ingredients or {}).items():
+            self.violations[" ".join(phrase.lower().split())] = diet_mask(diets)
+        self.drinks = {" ".join(name.lower().split()): diet_mask(diets) for name, diets in (drinks or {}).items()}
+        self.longest = max((len(phrase.split()) for phrase in self.violations), default=1)
+        self.digest = digest
+        self._masks = {}
+
+    def _violation(self, phrase):
+        found = self.violations.get(phrase)
+        if found is None and phrase.endswith("s"):
+            found = self.violations.get(phrase[:-1])
+        return found
+
+    def _phrases(self, text):
+        """Yield (phrase, violated diets) for each rule phrase in the text, longest first."""
+        words = re.findall(r"[a-z]+", text)
+        i = 0
+        while i < len(words):
+            for length in range(min(self.longest, len(words) - i), 0, -1):
+                phrase = " ".join(words[i:i + length])
+                found = self._violation(phrase)
+                if found is not None:
+                    yield phrase, found
+                    i += length
+                    break
+            else:
+                i += 1
+
+    def mask(self, text):
+        """Diets the text is compatible with, memoized per distinct text."""
+        key = " ".join(str(text).lower().split())
+        mask = self._masks.get(key)
+        if mask is not None:
+            return mask
+        mask = self.drinks.get(key)
+        if mask is None:
+            violations = 0
+            for _, found in self._phrases(key):
+                violations |= found
+            mask = ALL_DIETS & ~violations
+        self._masks[key] = mask
+        return mask
+
+    def violating_phrases(self, text, required):
+        """Phrases in free text, e.g. a brewing tip, that break any required diet, in order."""
+        phrases = []
+        for phrase, found in self._phrases(" ".join(str(text).lower().split())):
+            if found & required and phrase not in phrases:
+                phrases.append(phrase)
+        return phrases
+
+def load_rules(path=DIETARY_RULES_PATH):
+    """Load the rules file; without one, nothing is restricted."""
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read()
+        data = json.loads(raw)
+        return DietaryRules(data.get("ingredients"), data.get("drinks"), digest=hashlib.sha1(raw).hexdigest()[:12])
+    except FileNotFoundError:
+        return DietaryRules()
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"Ignoring unreadable dietary rules {path}: {e}")
+        return DietaryRules()
@@ -0,0 +1,247 @@
+# drink_similarity.py
+
+import argparse
+import glob
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import pyarrow.parquet as pq
+from analytics_store import get_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Item-item index, shared by all worker processes on the host
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", os.path.join(BASE_DIR, "cache", "drink_similarity.sqlite3"))
+
+# Similar drinks kept per drink, and the fewest users two drinks must share to count
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", 10))
+SIMILARITY_MIN_SUPPORT = int(os.getenv("SIMILARITY_MIN_SUPPORT", 2))
+
+# Seconds between checks for an index updated by another process
+SIMILARITY_CHECK_INTERVAL = float(os.getenv("SIMILARITY_CHECK_INTERVAL", 30))
+
+def _connect():
+    directory = os.path.dirname(SIMILARITY_INDEX_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(SIMILARITY_INDEX_PATH, timeout=30)
+    conn.executescript(
+        # Sparse user x drink matrix (binary: the user was recommended the drink)
+        "CREATE TABLE IF NOT EXISTS user_drinks ("
+        "user_id TEXT NOT NULL, drink TEXT NOT NULL, PRIMARY KEY (user_id, drink));"
+        "CREATE TABLE IF NOT EXISTS drink_users (drink TEXT PRIMARY KEY, users INTEGER NOT NULL);"
+        # Users shared by each pair of drinks, stored in both directions
+        "CREATE TABLE IF NOT EXISTS cooccurrence ("
+        "drink TEXT NOT NULL, other TEXT NOT NULL, users INTEGER NOT NULL, PRIMARY KEY (drink, other));"
+        "CREATE TABLE IF NOT EXISTS similar ("
+        "drink TEXT NOT NULL, rank INTEGER NOT NULL, other TEXT NOT NULL, score REAL NOT NULL, "
+        "PRIMARY KEY (drink, rank));"
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+    )
+    return conn
+
+@contextmanager
+def _open_index():
+    """Open the index database, committing on success and always closing."""
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _bump_version(conn):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('version', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+def _recompute_similar(conn, drinks):
+    """Rebuild the top-k lists of the given drinks from the co-occurrence counts."""
+    for drink in drinks:
+        rows = conn.execute(
+            "SELECT c.other, c.users, a.users, b.users FROM cooccurrence c "
+            "JOIN drink_users a ON a.drink = c.drink JOIN drink_users b ON b.drink = c.other "
+            "WHERE c.drink = ? AND c.users >= ?",
+            (drink, SIMILARITY_MIN_SUPPORT)
+        ).fetchall()
+        # Cosine similarity of the two drinks' user columns
+        scored = sorted(
+            ((shared / math.sqrt(users_a * users_b), other) for other, shared, users_a, users_b in rows),
+            key=lambda item: (-item[0], item[1])
+        )[:SIMILARITY_TOP_K]
+        conn.execute("DELETE FROM similar WHERE drink = ?", (drink,))
+        conn.executemany(
+            "INSERT INTO similar (drink, rank, other, score) VALUES (?, ?, ?, ?)",
+            [(drink, rank, other, score) for rank, (score, other) in enumerate(scored)]
+        )
+
+def update_index(pairs):
+    """
+    Fold (user_id, drink) pairs into the index.
+
+    Only pairs new to the user change the matrix, so replaying events is
+    harmless. The top-k lists of every drink whose scores moved are recomputed.
+
+    Returns:
+        int: Number of new (user, drink) pairs.
+    """
+    pairs = {(str(user_id), str(drink)) for user_id, drink in pairs if drink}
+    if not pairs:
+        return 0
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        added = 0
+        touched = set()
+        for user_id, drink in sorted(pairs):
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO user_drinks (user_id, drink) VALUES (?, ?)", (user_id, drink)
+            )
+            if not cursor.rowcount:
+                continue
+            added += 1
+            touched.add(drink)
+            conn.execute(
+                "INSERT INTO drink_users (drink, users) VALUES (?, 1) "
+                "ON CONFLICT(drink) DO UPDATE SET users = users + 1",
+                (drink,)
+            )
+            others = [row[0] for row in conn.execute(
+                "SELECT drink FROM user_drinks WHERE user_id = ? AND drink != ?", (user_id, drink)
+            )]
+            conn.executemany(
+                "INSERT INTO cooccurrence (drink, other, users) VALUES (?, ?, 1) "
+                "ON CONFLICT(drink, other) DO UPDATE SET users = users + 1",
+                [(drink, other) for other in others] + [(other, drink) for other in others]
+            )
+        if touched:
+            # A drink's new users change its score in every list that mentions it
+            placeholders = ",".join("?" * len(touched))
+            neighbours = {row[0] for row in conn.execute(
+                f"SELECT DISTINCT other FROM cooccurrence WHERE drink IN ({placeholders})", sorted(touched)
+            )}
+            _recompute_similar(conn, touched | neighbours)
+            _bump_version(conn)
+        conn.commit()
+        return added
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"Drink similarity index error: {e}")
+        return 0
+    finally:
+        conn.close()
+
+def rebuild_index(events_dir=None):
+    """
+    Build the index from scratch from every analytics event file.
+
+    Returns:
+        int: Number of distinct (user, drink) pairs.
+    """
+    events_dir = events_dir or get_store().events_dir
+    user_drinks = defaultdict(set)
+    for path in glob.glob(os.path.join(events_dir, "date=*", "*.parquet")):
+        table = pq.ParquetFile(path).read(columns=["user_id", "drink"])
+        for user_id, drink in zip(table["user_id"].to_pylist(), table["drink"].to_pylist()):
+            if drink:
+                user_drinks[user_id].add(drink)
+
+    drink_users = defaultdict(int)
+    cooccurrence = defaultdict(int)
+    for drinks in user_drinks.values():
+        for drink in drinks:
+            drink_users[drink] += 1
+            for other in drinks:
+                if other != drink:
+                    cooccurrence[drink, other] += 1
+
+    with _open_index() as conn:
+        conn.execute("DELETE FROM user_drinks")
+        conn.execute("DELETE FROM drink_users")
+        conn.execute("DELETE FROM cooccurrence")
+        conn.execute("DELETE FROM similar")
+        conn.executemany(
+            "INSERT INTO user_drinks (user_id, drink) VALUES (?, ?)",
+            [(user_id, drink) for user_id, drinks in user_drinks.items() for drink in drinks]
+        )
+        conn.executemany("INSERT INTO drink_users (drink, users) VALUES (?, ?)", drink_users.items())
+        conn.executemany(
+            "INSERT INTO cooccurrence (drink, other, users) VALUES (?, ?, ?)",
+            [(drink, other, users) for (drink, other), users in cooccurrence.items()]
+        )
+        _recompute_similar(conn, list(drink_users))
+        _bump_version(conn)
+    return sum(len(drinks) for drinks in user_drinks.values())
+
+def index_events(events):
+    """Analytics store listener: fold each written batch of events into the index."""
+    update_index((event["user_id"], event["drink"]) for event in events)
+
+_similar = None
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+def _load():
+    """Read the top-k lists into memory, or return the current ones if unchanged."""
+    global _similar, _version
+    try:
+        with _open_index() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            version = row[0] if row else 0
+            if _similar is not None and version == _version:
+                return _similar
+            similar = defaultdict(list)
+            for drink, other, score in conn.execute("SELECT drink, other, score FROM similar ORDER BY drink, rank"):
+                similar[drink].append((other, score))
+    except sqlite3.Error as e:
+        print(f"Drink similarity index error: {e}")
+        return _similar or {}
+    _similar, _version = dict(similar), version
+    return _similar
+
+def get_similar_index():
+    """
+    Get the drink -> [(similar drink, score), ...] lists, best first.
+
+    Lists updated by any process are picked up within SIMILARITY_CHECK_INTERVAL
+    seconds.
+    """
+    global _checked_at
+    now = time.monotonic()
+    similar = _similar
+    if similar is not None and now - _checked_at < SIMILARITY_CHECK_INTERVAL:
+        return similar
+
+    with _lock:
+        if _similar is not None and now - _checked_at < SIMILARITY_CHECK_INTERVAL:
+            return _similar
+        _checked_at = now
+        return _load()
+
+def similar_drinks(drink, k=3, exclude=()):
+    """The k drinks most often recommended to the same users as `drink`."""
+    return [
+        (other, score) for other, score in get_similar_index().get(drink, [])
+        if other not in exclude
+    ][:k]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drink similarity index tools")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild from every analytics event")
+    parser.add_argument("--drink", help="show the drinks most similar to this one")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.rebuild:
+        began = time.perf_counter()
+        pairs = rebuild_index()
+        print(f"Indexed {pairs} user-drink pairs in {time.perf_counter() - began:.2f}s")
+    if args.drink:
+        for other, score in similar_drinks(args.drink, args.k):
+            print(f"{score:.3f}  {other}")
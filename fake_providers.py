@@ -0,0 +1,437 @@
+# fake_providers.py
+
+import fnmatch
+import json
+import random
+import re
+import socketserver
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from types import SimpleNamespace
+from urllib.parse import urlsplit, parse_qs
+
+# Every external provider SipSync talks to
+PROVIDERS = [
+    "cohere", "gemini", "openweather", "nominatim", "overpass",
+    "google_places", "youtube", "googletrans"
+]
+
+class ProviderFault(Exception):
+    """Injected provider failure."""
+    pass
+
+class FaultProfile:
+    """Latency, jitter and error injection for one fake provider."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+
+    def delay(self):
+        latency = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def should_fail(self):
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def to_dict(self):
+        return {"latency_ms": self.latency_ms, "jitter_ms": self.jitter_ms, "error_rate": self.error_rate}
+
+class CallCounter:
+    """Thread-safe count of upstream calls per provider."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def hit(self, provider):
+        with self._lock:
+            self._counts[provider] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+def _call(provider, profiles, calls):
+    """Record a call, wait out the injected latency and maybe raise an injected fault."""
+    calls.hit(provider)
+    profile = profiles[provider]
+    profile.delay()
+    if profile.should_fail():
+        raise ProviderFault(f"Injected {provider} failure")
+
+class FakeCohereClient:
+    """Stand-in for cohere.Client.generate, including stream=True."""
+
+    def __init__(self, profiles, calls):
+        self.profiles = profiles
+        self.calls = calls
+
+    def generate(self, prompt=None, stream=False, **kwargs):
+        _call("cohere", self.profiles, self.calls)
+        match = re.search(r"Recommended drink: (.+)", prompt or "")
+        drink = match.group(1).strip() if match else "this drink"
+        text = (
+            f"I'm sorry you're not feeling well. {drink} is a gentle, well-loved choice "
+            f"that should help you feel better soon. Enjoy it mindfully and sustainably!"
+        )
+        if not stream:
+            return SimpleNamespace(generations=[SimpleNamespace(text=text)])
+        return self._stream(text)
+
+    def _stream(self, text):
+        for word in text.split(" "):
+            yield SimpleNamespace(text=word + " ", is_finished=False)
+
+class FakeGeminiModel:
+    """Stand-in for genai.GenerativeModel.generate_content."""
+
+    def __init__(self, profiles, calls):
+        self.profiles = profiles
+        self.calls = calls
+
+    def generate_content(self, prompt, **kwargs):
+        _call("gemini", self.profiles, self.calls)
+        # Ailment disambiguation prompts list the candidates; pick the first
+        match = re.search(r"potential matches: \[([^\]]*)\]", prompt)
+        if match:
+            candidates = re.findall(r"'([^']+)'", match.group(1))
+            return SimpleNamespace(text=candidates[0] if candidates else "")
+        return SimpleNamespace(text=(
+            "Try a warm cup of ginger and lemon tea with a spoon of honey. "
+            "Steep sliced ginger for five minutes, then add lemon and honey to taste."
+        ))
+
+class FakeTranslator:
+    """Stand-in for googletrans.Translator.translate."""
+
+    def __init__(self, profiles, calls):
+        self.profiles = profiles
+        self.calls = calls
+
+    def translate(self, text, dest='en', **kwargs):
+        _call("googletrans", self.profiles, self.calls)
+        return SimpleNamespace(text=f"[{dest}] {text}", dest=dest)
+
+def _fake_stores(count=25):
+    kinds = [("amenity", "cafe"), ("shop", "tea"), ("shop", "supermarket"), ("shop", "herbalist")]
+    elements = []
+    for i in range(count):
+        key, value = kinds[i % len(kinds)]
+        elements.append({
+            "type": "node",
+            "id": 1000 + i,
+            "lat": 51.5 + i * 0.001,
+            "lon": -0.12 - i * 0.001,
+            "tags": {"name": f"Fake {value.title()} {i}", key: value, "addr:street": "High Street",
+                     "addr:housenumber": str(i + 1)}
+        })
+    return elements
+
+class _ProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("/openweather/", "openweather"),
+        ("/nominatim/", "nominatim"),
+        ("/overpass/", "overpass"),
+        ("/google/", "google_places"),
+        ("/youtube/", "youtube")
+    ]
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length:
+            self.rfile.read(length)
+        self._handle()
+
+    def _handle(self):
+        url = urlsplit(self.path)
+        provider = next((name for prefix, name in self.ROUTES if url.path.startswith(prefix)), None)
+        if provider is None:
+            self._send(404, {"error": "unknown provider"})
+            return
+        try:
+            _call(provider, self.server.profiles, self.server.calls)
+        except ProviderFault:
+            self._send(503, {"error": f"injected {provider} failure"})
+            return
+        self._send(200, self._payload(provider, url.path, parse_qs(url.query)))
+
+    def _payload(self, provider, path, query):
+        if provider == "openweather":
+            return {"main": {"temp": 291.15}, "weather": [{"main": "Rain"}]}
+        if provider == "nominatim":
+            return [{"lat": "51.5074", "lon": "-0.1278", "display_name": "London"}]
+        if provider == "overpass":
+            return {"elements": _fake_stores()}
+        if provider == "youtube":
+            q = query.get("q", ["video"])[0]
+            return {"items": [
+                {"id": {"videoId": f"vid{i}"},
+                 "snippet": {"title": f"{q.title()} #{i}", "thumbnails": {"high": {"url": f"https://img/{i}.jpg"}}}}
+                for i in range(int(query.get("maxResults", ["3"])[0]))
+            ]}
+        if path.endswith("/geocode/json"):
+            return {"status": "OK", "results": [{"geometry": {"location": {"lat": 51.5074, "lng": -0.1278}}}]}
+        if path.endswith("/place/details/json"):
+            return {"status": "OK", "result": {"name": "Fake Cafe", "formatted_phone_number": "000"}}
+        keyword = query.get("keyword", query.get("type", ["place"]))[0]
+        return {"status": "OK", "results": [
+            {"place_id": f"{keyword}-{i}", "name": f"Fake {keyword} {i}", "types": ["cafe"] if i % 2 else ["store"],
+             "geometry": {"location": {"lat": 51.5 + i * 0.001, "lng": -0.12}}, "vicinity": "High Street",
+             "rating": 4.2}
+            for i in range(5)
+        ]}
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeProviderServer(ThreadingHTTPServer):
+    """Local HTTP server emulating the REST providers (weather, OSM, Google Places, YouTube)."""
+
+    daemon_threads = True
+
+    def __init__(self, profiles, calls, host="127.0.0.1", port=0):
+        super().__init__((host, port), _ProviderHandler)
+        self.profiles = profiles
+        self.calls = calls
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-providers", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+class _RedisHandler(socketserver.StreamRequestHandler):
+    """One RESP connection: read array commands, write replies."""
+
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (ValueError, OSError):
+                return
+            if args is None:
+                return
+            self.wfile.write(self.server.execute(args))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            raise ValueError("inline commands are not supported")
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+def _resp(value):
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, list):
+        return b"*%d\r\n" % len(value) + b"".join(_resp(item) for item in value)
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(value), value)
+
+class FakeRedisServer(socketserver.ThreadingTCPServer):
+    """
+    In-memory Redis stand-in speaking RESP, with the commands the shared cache
+    uses (GET, SET with EX/PX/NX, DEL, SCAN, DBSIZE, FLUSHDB, PING, AUTH, SELECT).
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    # Every worker thread opens its own connection; the default backlog of 5 drops bursts
+    request_queue_size = 128
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _RedisHandler)
+        self.data = {}
+        self.commands = Counter()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def _alive(self, key, now):
+        entry = self.data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self.data[key]
+            return None
+        return entry
+
+    def execute(self, args):
+        name = args[0].decode("utf-8").upper()
+        now = time.time()
+        with self.lock:
+            self.commands[name] += 1
+            if name in ("PING", "AUTH", "SELECT"):
+                return _resp("PONG" if name == "PING" else "OK")
+            if name == "GET":
+                entry = self._alive(args[1], now)
+                return _resp(entry[0] if entry else None)
+            if name == "SET":
+                key, value, expires_at, only_new = args[1], args[2], None, False
+                options = [a.decode("utf-8").upper() for a in args[3:]]
+                for i, option in enumerate(options):
+                    if option == "NX":
+                        only_new = True
+                    elif option in ("EX", "PX"):
+                        amount = float(options[i + 1])
+                        expires_at = now + (amount if option == "EX" else amount / 1000.0)
+                if only_new and self._alive(key, now):
+                    return _resp(None)
+                self.data[key] = (value, expires_at)
+                return _resp("OK")
+            if name in ("DEL", "UNLINK"):
+                return _resp(sum(self.data.pop(key, None) is not None for key in args[1:]))
+            if name == "SCAN":
+                pattern = "*"
+                options = [a.decode("utf-8") for a in args[2:]]
+                if "MATCH" in [o.upper() for o in options]:
+                    pattern = options[[o.upper() for o in options].index("MATCH") + 1]
+                keys = [k for k in list(self.data) if self._alive(k, now)
+                        and fnmatch.fnmatchcase(k.decode("utf-8", "replace"), pattern)]
+                return _resp([b"0", keys])
+            if name == "DBSIZE":
+                return _resp(len(self.data))
+            if name == "FLUSHDB":
+                self.data.clear()
+                return _resp("OK")
+        return f"-ERR unknown command '{name}'\r\n".encode("utf-8")
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+def build_profiles(overrides=None, seed=None):
+    """Create a FaultProfile per provider, applying {provider: FaultProfile} overrides."""
+    profiles = {name: FaultProfile(seed=seed) for name in PROVIDERS}
+    profiles.update(overrides or {})
+    return profiles
+
+@contextmanager
+def fake_providers(profiles=None, cache_backend="memory"):
+    """
+    Point every provider used by SipSync at local stand-ins.
+
+    HTTP providers are served by a FakeProviderServer; SDK-based providers
+    (Cohere, Gemini, googletrans) are replaced by in-process fakes. The shared
+    cache starts empty on a fresh backend: "memory", "sqlite" (in a temporary
+    directory) or "redis" (a FakeRedisServer). Custom responses, the drink
+    similarity index, session spills and analytics events also go to a
+    temporary directory. Module attributes are restored on exit.
+
+    Yields:
+        SimpleNamespace: with "calls" (CallCounter), "profiles", "server" and
+        "redis" (the FakeRedisServer, or None).
+    """
+    import analytics_store
+    import backend
+    import cache
+    import custom_responses
+    import drink_similarity
+    import google_maps
+    import language_support
+    import maps
+    import session_memory
+    import youtube
+
+    profiles = build_profiles(profiles)
+    calls = CallCounter()
+    server = FakeProviderServer(profiles, calls).start()
+    cache_dir = tempfile.TemporaryDirectory(prefix="sipsync-fakes-")
+    redis = None
+    if cache_backend == "redis":
+        redis = FakeRedisServer().start()
+        shared_cache = cache.RedisBackend(redis.url)
+    elif cache_backend == "sqlite":
+        shared_cache = cache.SQLiteBackend(f"{cache_dir.name}/shared.sqlite3")
+    else:
+        shared_cache = cache.MemoryBackend()
+    # Fake provider output must never reach the real caches, indexes or analytics
+    analytics = analytics_store.AnalyticsStore(f"{cache_dir.name}/analytics", flush_seconds=0)
+    analytics.add_listener(drink_similarity.index_events)
+
+    patches = [
+        (backend, "co", FakeCohereClient(profiles, calls)),
+        (backend, "model", FakeGeminiModel(profiles, calls)),
+        (backend, "WEATHER_API_KEY", "fake-key"),
+        (backend, "WEATHER_API_URL", f"{server.url}/openweather/data/2.5/weather"),
+        (language_support, "translator", FakeTranslator(profiles, calls)),
+        (maps, "NOMINATIM_URL", f"{server.url}/nominatim/search"),
+        (maps, "OVERPASS_URL", f"{server.url}/overpass/api/interpreter"),
+        (maps, "OSM_REQUEST_DELAY", 0),
+        (google_maps, "GOOGLE_API_KEY", "fake-key"),
+        (google_maps, "GOOGLE_MAPS_API_URL", f"{server.url}/google"),
+        (google_maps, "PLACES_REQUEST_DELAY", 0),
+        (youtube, "YOUTUBE_API_KEY", "fake-key"),
+        (youtube, "YOUTUBE_API_URL", f"{server.url}/youtube"),
+        (youtube, "YOUTUBE_CACHE_PATH", f"{cache_dir.name}/youtube.sqlite3"),
+        (youtube, "YOUTUBE_DAILY_QUOTA", 10 ** 9),
+        (cache, "_backend", shared_cache),
+        (custom_responses, "CUSTOM_RESPONSE_CACHE_PATH", f"{cache_dir.name}/custom_responses.sqlite3"),
+        (drink_similarity, "SIMILARITY_INDEX_PATH", f"{cache_dir.name}/drink_similarity.sqlite3"),
+        (drink_similarity, "_similar", None),
+        (drink_similarity, "_checked_at", 0.0),
+        (session_memory.session_memory, "spill_dir", f"{cache_dir.name}/sessions"),
+        (analytics_store, "_store", analytics)
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    try:
+        yield SimpleNamespace(calls=calls, profiles=profiles, server=server, redis=redis)
+    finally:
+        analytics.flush()
+        for module, name, value in originals:
+            setattr(module, name, value)
+        server.stop()
+        if redis is not None:
+            redis.stop()
+        cache_dir.cleanup()
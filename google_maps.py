@@ -7,10 +7,15 @@ from streamlit_folium import folium_static
 import time
 import os
 from dotenv import load_dotenv
+from metrics import provider_call
 
 # Load environment variables
 load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_CLOUD_API_KEY")
+GOOGLE_MAPS_API_URL = os.getenv("GOOGLE_MAPS_API_URL", "https://maps.googleapis.com/maps/api")
+
+# Pause between Places API calls to respect rate limits
+PLACES_REQUEST_DELAY = float(os.getenv("PLACES_REQUEST_DELAY", 0.2))
 
 def geocode_address_google(address):
     """
@@ -23,13 +28,16 @@ def geocode_address_google(address):
         tuple: (latitude, longitude) or (None, None) if geocoding fails.
     """
     try:
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
+        url = f"{GOOGLE_MAPS_API_URL}/geocode/json"
         params = {
             "address": address,
             "key": GOOGLE_API_KEY
         }
         
-        response = requests.get(url, params=params)
+        with provider_call("google_places", "geocode") as call:
+            response = requests.get(url, params=params)
+            if response.status_code != 200:
+                call.fail()
         
         if response.status_code == 200:
             data = response.json()
@@ -71,7 +79,7 @@ def find_nearby_places(latitude, longitude, ingredients=None, radius=3000):
     try:
         # First search by type
         for place_type in search_types:
-            url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+            url = f"{GOOGLE_MAPS_API_URL}/place/nearbysearch/json"
             params = {
                 "location": f"{latitude},{longitude}",
                 "radius": radius,
@@ -79,18 +87,21 @@ def find_nearby_places(latitude, longitude, ingredients=None, radius=3000):
                 "key": GOOGLE_API_KEY
             }
             
-            response = requests.get(url, params=params)
+            with provider_call("google_places", "nearby_search") as call:
+                response = requests.get(url, params=params)
+                if response.status_code != 200:
+                    call.fail()
             if response.status_code == 200:
                 data = response.json()
                 if data["status"] == "OK":
                     places.extend(data["results"])
             
             # Respect API rate limits
-            time.sleep(0.2)
+            time.sleep(PLACES_REQUEST_DELAY)
         
         # Then search by keyword for more specific places
         for keyword in keywords:
-            url = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+            url = f"{GOOGLE_MAPS_API_URL}/place/nearbysearch/json"
             params = {
                 "location": f"{latitude},{longitude}",
                 "radius": radius,
@@ -98,14 +109,17 @@ def find_nearby_places(latitude, longitude, ingredients=None, radius=3000):
                 "key": GOOGLE_API_KEY
             }
             
-            response = requests.get(url, params=params)
+            with provider_call("google_places", "nearby_search") as call:
+                response = requests.get(url, params=params)
+                if response.status_code != 200:
+                    call.fail()
             if response.status_code == 200:
                 data = response.json()
                 if data["status"] == "OK":
                     places.extend(data["results"])
             
             # Respect API rate limits
-            time.sleep(0.2)
+            time.sleep(PLACES_REQUEST_DELAY)
         
         # Remove duplicates by place_id
         unique_places = {}
@@ -159,14 +173,17 @@ def get_place_details(place_id):
         dict: Place details.
     """
     try:
-        url = "https://maps.googleapis.com/maps/api/place/details/json"
+        url = f"{GOOGLE_MAPS_API_URL}/place/details/json"
         params = {
             "place_id": place_id,
             "fields": "name,formatted_address,formatted_phone_number,website,opening_hours,rating,review",
             "key": GOOGLE_API_KEY
         }
         
-        response = requests.get(url, params=params)
+        with provider_call("google_places", "place_details") as call:
+            response = requests.get(url, params=params)
+            if response.status_code != 200:
+                call.fail()
         if response.status_code == 200:
             data = response.json()
             if data["status"] == "OK":
@@ -4,10 +4,16 @@ import os
 from googletrans import Translator
 from langdetect import detect
 import pycountry
+from metrics import timed_stage, provider_call
+from cache import Cache
 
 # Initialize translator
 translator = Translator()
 
+# Translations of catalog text repeat across users, so keep them for a month
+TRANSLATION_CACHE_TTL = int(os.getenv("TRANSLATION_CACHE_TTL", 30 * 24 * 60 * 60))
+translation_cache = Cache("translations", ttl=TRANSLATION_CACHE_TTL)
+
 # Supported languages with their codes
 SUPPORTED_LANGUAGES = {
     'en': 'English',
@@ -33,6 +39,10 @@ def detect_language(text):
     except:
         return 'en', 'English'
 
+def _translate(text, target_lang):
+    with provider_call("googletrans", "translate"):
+        return translator.translate(text, dest=target_lang).text
+
 def translate_text(text, target_lang='en'):
     """
     Translate text to target language.
@@ -40,11 +50,12 @@ def translate_text(text, target_lang='en'):
     try:
         if target_lang not in SUPPORTED_LANGUAGES:
             target_lang = 'en'
-        translation = translator.translate(text, dest=target_lang)
-        return translation.text
+        # Cached across workers; identical texts translated concurrently share one request
+        return translation_cache.get_or_compute((target_lang, text), lambda: _translate(text, target_lang))
     except:
         return text
 
+@timed_stage("translate")
 def translate_recommendation(recommendation, target_lang='en'):
     """
     Translate a recommendation dictionary to target language.
@@ -57,7 +68,7 @@ def translate_recommendation(recommendation, target_lang='en'):
         # Translate main fields
         fields_to_translate = [
             'drink', 'light_food', 'brewing_tip', 'personalized_message',
-            'cultural_origin', 'scientific_evidence'
+            'cultural_origin', 'scientific_evidence', 'dietary_note'
         ]
         
         for field in fields_to_translate:
@@ -0,0 +1,265 @@
+# load_test.py
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+from batch import percentile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# One click-through: open Home, search for a drink, then visit every other page
+STEPS = ["Home", "Search", "Profile", "Analytics", "Settings"]
+
+# Session state key the patched sidebar menu reads the current page from
+PAGE_KEY = "_load_test_page"
+
+def _rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        # Peak rather than current RSS, in kilobytes on Linux and bytes on macOS
+        if resource is None:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def _patch_navigation():
+    """Make the sidebar option menu return the page chosen by the load generator."""
+    import streamlit as st
+    import streamlit_option_menu
+
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: st.session_state.get(PAGE_KEY, "Home")
+
+class Session:
+    """One simulated user: an AppTest with its own session state."""
+
+    def __init__(self, index, seed, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.rng = random.Random(seed * 100003 + index)
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.user_id = None
+
+    def rerun(self, step):
+        """
+        Perform one step of STEPS and time the script run it triggers.
+
+        Returns:
+            tuple: (seconds, ok)
+        """
+        from benchmark import DRINK_TYPES, SAMPLE_INPUTS
+
+        app = self.app
+        app.session_state[PAGE_KEY] = "Home" if step == "Search" else step
+        if step == "Search":
+            app.radio[0].set_value(self.rng.choice(DRINK_TYPES))
+            app.text_input[0].input(self.rng.choice(SAMPLE_INPUTS))
+            app.button[0].click()
+        start = time.perf_counter()
+        try:
+            app.run()
+            ok = not app.exception and not app.error
+        except Exception as e:
+            print(f"Session rerun raised: {e}", file=sys.stderr)
+            ok = False
+        elapsed = time.perf_counter() - start
+        if self.user_id is None and "user_id" in app.session_state:
+            self.user_id = app.session_state["user_id"]
+        return elapsed, ok
+
+    def state_bytes(self):
+        """Session state size, measured the way Streamlit reports it."""
+        return self.app.session_state._state.get_stats()[0].byte_length
+
+def _worker(index, sessions, rounds, seed, latency_scale, timeout, barrier, results):
+    """
+    Serve `sessions` simulated users in one process, like one Streamlit server.
+
+    AppTest swaps a process-global runtime on every run, so reruns within a
+    worker are serialized; sessions are interleaved round-robin and all stay
+    resident, as they would in a server process.
+    """
+    from benchmark import DEFAULT_LATENCY_MS
+    from fake_providers import PROVIDERS, FaultProfile, fake_providers
+
+    _patch_navigation()
+    profiles = {
+        name: FaultProfile(latency_ms=DEFAULT_LATENCY_MS[name] * latency_scale,
+                           jitter_ms=DEFAULT_LATENCY_MS[name] * 0.2 * latency_scale, seed=seed + index)
+        for name in PROVIDERS
+    }
+    warmup = Session(-1 - index, seed, timeout)
+    users = []
+    try:
+        with fake_providers(profiles) as fakes:
+            # One click-through first, so lazy imports and loads are not measured
+            for step in STEPS:
+                warmup.rerun(step)
+            rss_before = _rss_bytes()
+            users = [Session(index * sessions + i, seed, timeout) for i in range(sessions)]
+            fakes.calls.reset()
+            barrier.wait()
+
+            reruns = {step: [] for step in STEPS}
+            errors = 0
+            cpu_start, start = time.process_time(), time.perf_counter()
+            for _ in range(rounds):
+                for step in STEPS:
+                    for user in users:
+                        elapsed, ok = user.rerun(step)
+                        reruns[step].append(elapsed)
+                        errors += 0 if ok else 1
+            wall = time.perf_counter() - start
+            cpu = time.process_time() - cpu_start
+
+            results.put({
+                "worker": index,
+                "reruns": reruns,
+                "errors": errors,
+                "wall_s": wall,
+                "cpu_s": cpu,
+                "rss_before": rss_before,
+                "rss_after": _rss_bytes(),
+                "state_bytes": [user.state_bytes() for user in users],
+                "provider_calls": fakes.calls.snapshot()
+            })
+    except Exception as e:
+        results.put({"worker": index, "failed": f"{type(e).__name__}: {e}"})
+    finally:
+        # The app saves a profile per session; don't leave them behind
+        for user in [warmup] + users:
+            if user.user_id:
+                try:
+                    os.remove(os.path.join("user_profiles", f"{user.user_id}.json"))
+                except OSError:
+                    pass
+
+def run_load(users, workers, rounds=1, seed=0, latency_scale=1.0, timeout=120):
+    """
+    Simulate `users` concurrent sessions spread over `workers` processes.
+
+    Returns:
+        dict: Throughput, per-step rerun latency, CPU and memory figures.
+    """
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    per_worker = [users // workers + (1 if i < users % workers else 0) for i in range(workers)]
+    processes = [
+        context.Process(target=_worker, args=(i, count, rounds, seed, latency_scale, timeout, barrier, results))
+        for i, count in enumerate(per_worker)
+    ]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    failed = [report["failed"] for report in reports if "failed" in report]
+    if failed:
+        raise RuntimeError(f"Load test worker failed: {failed[0]}")
+
+    wall = max(report["wall_s"] for report in reports)
+    all_reruns = [seconds for report in reports for values in report["reruns"].values() for seconds in values]
+    cpu = sum(report["cpu_s"] for report in reports)
+    state_bytes = [size for report in reports for size in report["state_bytes"]]
+    rss_growth = sum(report["rss_after"] - report["rss_before"] for report in reports)
+    provider_calls = {}
+    for report in reports:
+        for name, count in report["provider_calls"].items():
+            provider_calls[name] = provider_calls.get(name, 0) + count
+
+    return {
+        "users": users,
+        "workers": workers,
+        "reruns": len(all_reruns),
+        "errors": sum(report["errors"] for report in reports),
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(all_reruns) / wall, 2) if wall > 0 else 0.0,
+        "rerun_ms": {
+            step: {
+                "p50": round(percentile(values, 50) * 1000, 1),
+                "p95": round(percentile(values, 95) * 1000, 1),
+                "p99": round(percentile(values, 99) * 1000, 1)
+            }
+            for step in STEPS
+            for values in [[seconds for report in reports for seconds in report["reruns"][step]]]
+        },
+        "cpu": {
+            "total_s": round(cpu, 3),
+            "ms_per_rerun": round(cpu / len(all_reruns) * 1000, 2) if all_reruns else 0.0,
+            # Share of the workers' wall time spent on CPU; 100% per busy core
+            "utilization_percent": round(cpu / wall * 100, 1) if wall > 0 else 0.0
+        },
+        "memory": {
+            "session_state_kb_mean": round(sum(state_bytes) / len(state_bytes) / 1024, 1) if state_bytes else 0.0,
+            "session_state_kb_max": round(max(state_bytes) / 1024, 1) if state_bytes else 0.0,
+            "rss_growth_kb_per_session": round(rss_growth / users / 1024, 1) if users else 0.0,
+            "rss_mb_per_worker": round(max(report["rss_after"] for report in reports) / 2 ** 20, 1)
+        },
+        "provider_calls": provider_calls
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Simulate concurrent Streamlit sessions clicking through the app against fake providers"
+    )
+    parser.add_argument("--users", type=int, default=16, help="concurrent sessions")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker process counts")
+    parser.add_argument("--rounds", type=int, default=1, help="click-throughs per session")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every fake provider latency")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per script run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the report to this JSON file")
+    args = parser.parse_args()
+
+    runs = []
+    for workers in [int(count) for count in args.workers.split(",") if count.strip()]:
+        result = run_load(args.users, workers, args.rounds, args.seed, args.latency_scale, args.timeout)
+        # Throughput relative to perfect scaling from the first worker count
+        if runs:
+            base = runs[0]
+            ideal = base["throughput_rps"] * workers / base["workers"]
+            result["scaling_efficiency"] = round(result["throughput_rps"] / ideal, 3) if ideal else 0.0
+        else:
+            result["scaling_efficiency"] = 1.0
+        runs.append(result)
+        print(
+            f"workers={workers:<3} users={args.users:<4} {result['throughput_rps']:>7.2f} reruns/s  "
+            f"search p95={result['rerun_ms']['Search']['p95']:>7.1f}ms  cpu={result['cpu']['ms_per_rerun']:>6.1f}ms/rerun  "
+            f"state={result['memory']['session_state_kb_mean']:>7.1f}KB/session  "
+            f"scaling={result['scaling_efficiency']:.2f}  errors={result['errors']}",
+            file=sys.stderr
+        )
+
+    report = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "rounds": args.rounds,
+            "latency_scale": args.latency_scale,
+            "seed": args.seed
+        },
+        "runs": runs
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
@@ -5,12 +5,51 @@ import streamlit as st
 from streamlit_folium import folium_static
 import requests
 import time
+import os
+from metrics import provider_call
+from cache import Cache
+
+# Provider endpoints, overridable for self-hosted instances and benchmarks
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+OVERPASS_URL = os.getenv("OVERPASS_URL", "https://overpass-api.de/api/interpreter")
+
+# Pause after each request to respect the public OSM usage policies
+OSM_REQUEST_DELAY = float(os.getenv("OSM_REQUEST_DELAY", 1))
+
+# Addresses rarely move; shops open and close. Store searches are keyed by a
+# ~100 m cell, well inside the 3 km search radius.
+GEOCODE_CACHE_TTL = int(os.getenv("GEOCODE_CACHE_TTL", 30 * 24 * 60 * 60))
+STORE_CACHE_TTL = int(os.getenv("STORE_CACHE_TTL", 24 * 60 * 60))
+STORE_CACHE_PRECISION = 3
+
+# Where store searches go: "overpass" (the public API) or "osm" (a local index
+# built from an OSM extract by osm_stores.py, served without network calls)
+STORE_PROVIDER = os.getenv("STORE_PROVIDER", "overpass")
+
+# Search radius around the user, in metres
+STORE_SEARCH_RADIUS = 3000
+
+# Shop tag values searched for regardless of the ingredients
+SHOP_TYPES = ["cafe", "coffee_shop", "tea", "supermarket", "convenience", "herbalist", "spices", "health_food"]
+
+geocode_cache = Cache("geocode", ttl=GEOCODE_CACHE_TTL)
+store_cache = Cache("stores", ttl=STORE_CACHE_TTL)
 
 def geocode_address(address):
     """
     Convert an address into latitude and longitude using OpenStreetMap's Nominatim API.
+
+    Successful lookups are cached across workers; failures are retried next time.
     """
-    url = "https://nominatim.openstreetmap.org/search"
+    latitude, longitude = geocode_cache.get_or_compute(
+        " ".join(str(address).lower().split()),
+        lambda: _geocode(address),
+        cache_if=lambda coords: coords[0] is not None
+    )
+    return latitude, longitude
+
+def _geocode(address):
+    url = NOMINATIM_URL
     headers = {
         "User-Agent": "SipSync/1.0"  # Required by Nominatim's ToS
     }
@@ -20,9 +59,12 @@ def geocode_address(address):
     }
     
     try:
-        response = requests.get(url, params=params, headers=headers)
+        with provider_call("nominatim", "geocode") as call:
+            response = requests.get(url, params=params, headers=headers)
+            if response.status_code != 200:
+                call.fail()
         # Add delay to respect usage policy
-        time.sleep(1)
+        time.sleep(OSM_REQUEST_DELAY)
         
         if response.status_code == 200:
             data = response.json()
@@ -41,98 +83,143 @@ def find_nearby_stores(latitude, longitude, ingredients):
         latitude (float): The latitude of the location.
         longitude (float): The longitude of the location.
         ingredients (list): List of ingredients to search for.
+
+    Returns:
+        list: Stores, or None if the search failed (as opposed to finding nothing).
     """
     try:
-        # Build a query for tea/coffee shops and stores for ingredients
-        keywords = ["cafe", "tea", "coffee", "supermarket", "grocery", "market"]
-        
-        # Add more specific queries based on ingredients
-        if isinstance(ingredients, list) and ingredients:
-            for ingredient in ingredients:
-                if "milk" in ingredient.lower():
-                    keywords.extend(["dairy", "milk"])
-                if "honey" in ingredient.lower():
-                    keywords.append("organic")
-                if "ginger" in ingredient.lower() or "herbs" in ingredient.lower():
-                    keywords.extend(["spice", "herbalist"])
-        
-        # Build Overpass query for multiple shop types
-        query_parts = []
-        for keyword in keywords:
-            query_parts.append(f'node[~".*{keyword}.*"~"."](around:3000,{latitude},{longitude});')
-        
-        # Add specific shop types
-        shop_types = ["cafe", "coffee_shop", "tea", "supermarket", "convenience", "herbalist", "spices", "health_food"]
-        for shop in shop_types:
-            query_parts.append(f'node["shop"="{shop}"](around:3000,{latitude},{longitude});')
-        
-        # Add amenities like cafes
-        query_parts.append(f'node["amenity"="cafe"](around:3000,{latitude},{longitude});')
-        
-        # Combined query
-        query = f"""
-        [out:json];
-        (
-            {' '.join(query_parts)}
-        );
-        out body;
-        """
-        
-        url = "https://overpass-api.de/api/interpreter"
-        response = requests.post(url, data=query)
-        
-        # Add delay to respect usage policy
-        time.sleep(1)
-        
-        if response.status_code == 200:
-            data = response.json()
-            stores = []
-            seen_names = set()  # To avoid duplicate stores
-            
-            for element in data.get("elements", []):
-                if "tags" in element and "name" in element.get("tags", {}):
-                    name = element["tags"]["name"]
-                    
-                    # Skip if we've already seen this store
-                    if name in seen_names:
-                        continue
-                    seen_names.add(name)
-                    
-                    # Get store type/category
-                    store_type = "Store"
-                    if "shop" in element["tags"]:
-                        store_type = element["tags"]["shop"].replace("_", " ").title()
-                    elif "amenity" in element["tags"] and element["tags"]["amenity"] == "cafe":
-                        store_type = "Cafe"
-                    
-                    # Get a proper address if available
-                    address = "Address not available"
-                    if "addr:street" in element["tags"]:
-                        street = element["tags"].get("addr:street", "")
-                        housenumber = element["tags"].get("addr:housenumber", "")
-                        city = element["tags"].get("addr:city", "")
-                        if street and housenumber:
-                            address = f"{housenumber} {street}, {city}" if city else f"{housenumber} {street}"
-                        elif street:
-                            address = f"{street}, {city}" if city else street
-                    
-                    store = {
-                        "name": name,
-                        "latitude": element["lat"],
-                        "longitude": element["lon"],
-                        "address": address,
-                        "type": store_type
-                    }
-                    stores.append(store)
-            
-            # Sort stores by type (cafes and tea shops first)
-            stores.sort(key=lambda x: 0 if x["type"] in ["Cafe", "Tea", "Coffee Shop"] else 1)
-            
-            return stores
+        keywords = _store_keywords(ingredients)
+        if STORE_PROVIDER == "osm":
+            # Local lookups take milliseconds; nothing to gain from the shared cache
+            import osm_stores
+            return osm_stores.search_stores(latitude, longitude, keywords)
+        key = (
+            round(float(latitude), STORE_CACHE_PRECISION),
+            round(float(longitude), STORE_CACHE_PRECISION),
+            sorted(set(keywords))
+        )
+        return store_cache.get_or_compute(
+            key,
+            lambda: _search_stores(latitude, longitude, keywords),
+            cache_if=lambda result: result is not None
+        )
     except Exception as e:
         print(f"Store search error: {e}")
     
-    return []
+    return None
+
+def _store_keywords(ingredients):
+    # Build a query for tea/coffee shops and stores for ingredients
+    keywords = ["cafe", "tea", "coffee", "supermarket", "grocery", "market"]
+    
+    # Add more specific queries based on ingredients
+    if isinstance(ingredients, list) and ingredients:
+        for ingredient in ingredients:
+            if "milk" in ingredient.lower():
+                keywords.extend(["dairy", "milk"])
+            if "honey" in ingredient.lower():
+                keywords.append("organic")
+            if "ginger" in ingredient.lower() or "herbs" in ingredient.lower():
+                keywords.extend(["spice", "herbalist"])
+    return keywords
+
+def _search_stores(latitude, longitude, keywords):
+    """
+    Query Overpass for stores around a point.
+
+    Returns:
+        list: Stores, or None if the request failed (so it is not cached).
+    """
+    # Build Overpass query for multiple shop types
+    query_parts = []
+    around = f"around:{STORE_SEARCH_RADIUS},{latitude},{longitude}"
+    for keyword in keywords:
+        query_parts.append(f'node[~".*{keyword}.*"~"."]({around});')
+    
+    # Add specific shop types
+    for shop in SHOP_TYPES:
+        query_parts.append(f'node["shop"="{shop}"]({around});')
+    
+    # Add amenities like cafes
+    query_parts.append(f'node["amenity"="cafe"]({around});')
+    
+    # Combined query
+    query = f"""
+    [out:json];
+    (
+        {' '.join(query_parts)}
+    );
+    out body;
+    """
+    
+    url = OVERPASS_URL
+    with provider_call("overpass", "find_stores") as call:
+        response = requests.post(url, data=query)
+        if response.status_code != 200:
+            call.fail()
+    
+    # Add delay to respect usage policy
+    time.sleep(OSM_REQUEST_DELAY)
+    
+    if response.status_code == 200:
+        data = response.json()
+        stores = []
+        for element in data.get("elements", []):
+            store = store_from_tags(element.get("tags", {}), element["lat"], element["lon"])
+            if store:
+                stores.append(store)
+        return rank_stores(stores)
+    return None
+
+def store_from_tags(tags, latitude, longitude):
+    """
+    Turn an OSM element's tags into a store entry.
+
+    Returns:
+        dict: The store, or None for unnamed elements.
+    """
+    if "name" not in tags:
+        return None
+
+    # Get store type/category
+    store_type = "Store"
+    if "shop" in tags:
+        store_type = tags["shop"].replace("_", " ").title()
+    elif tags.get("amenity") == "cafe":
+        store_type = "Cafe"
+    
+    # Get a proper address if available
+    address = "Address not available"
+    if "addr:street" in tags:
+        street = tags.get("addr:street", "")
+        housenumber = tags.get("addr:housenumber", "")
+        city = tags.get("addr:city", "")
+        if street and housenumber:
+            address = f"{housenumber} {street}, {city}" if city else f"{housenumber} {street}"
+        elif street:
+            address = f"{street}, {city}" if city else street
+    
+    return {
+        "name": tags["name"],
+        "latitude": latitude,
+        "longitude": longitude,
+        "address": address,
+        "type": store_type
+    }
+
+def rank_stores(stores):
+    """Drop repeated names, keeping the first, and list cafes and tea shops first."""
+    ranked = []
+    seen_names = set()  # To avoid duplicate stores
+    for store in stores:
+        if store["name"] in seen_names:
+            continue
+        seen_names.add(store["name"])
+        ranked.append(store)
+    
+    # Sort stores by type (cafes and tea shops first)
+    ranked.sort(key=lambda x: 0 if x["type"] in ["Cafe", "Tea", "Coffee Shop"] else 1)
+    return ranked
 
 def display_interactive_map(latitude, longitude, stores=None, ingredients=None):
     """
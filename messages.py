@@ -0,0 +1,31 @@
+# messages.py
+
+from train import COHERE_PERSONALIZED_MESSAGE_PROMPT, COHERE_COMBINED_AILMENTS_NOTE
+
+def templated_message(recommendation):
+    """
+    Build the fallback personalized message from the catalog fields.
+    """
+    return (
+        f"For your {recommendation['ailment']}, I recommend {recommendation['drink']}. "
+        f"It's known for its {recommendation['benefits'][0].lower()} properties and has roots in {recommendation['cultural_origin']}. "
+        f"{recommendation['scientific_evidence']}. Here's a tip: {recommendation['brewing_tip']}"
+    )
+
+def build_message_prompt(recommendation):
+    """
+    Fill the Cohere personalized message prompt from a resolved recommendation.
+    """
+    prompt = COHERE_PERSONALIZED_MESSAGE_PROMPT.format(
+        ailment=recommendation["ailment"],
+        drink=recommendation["drink"],
+        benefits=", ".join(recommendation["benefits"]),
+        brewing_tip=recommendation["brewing_tip"],
+        cultural_origin=recommendation["cultural_origin"],
+        scientific_evidence=recommendation["scientific_evidence"],
+        sustainability_score=recommendation["sustainability_score"],
+        eco_friendly_tips=", ".join(recommendation["eco_friendly_tips"])
+    )
+    if len(recommendation.get("ailments", [])) > 1:
+        prompt += COHERE_COMBINED_AILMENTS_NOTE.format(ailments=", ".join(recommendation["ailments"]))
+    return prompt
@@ -0,0 +1,325 @@
+# metrics.py
+
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Set SIPSYNC_METRICS=0 to turn every span into a shared no-op
+METRICS_ENABLED = os.getenv("SIPSYNC_METRICS", "1") != "0"
+
+# Fraction of root spans (and their children) written as structured JSON logs
+TRACE_SAMPLE_RATE = float(os.getenv("SIPSYNC_TRACE_SAMPLE_RATE", 0.0))
+
+# Histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+trace_logger = logging.getLogger("sipsync.trace")
+
+class Histogram:
+    """Cumulative-bucket latency histogram."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            yield bound, total
+
+class MetricsRegistry:
+    """Process-wide counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._help = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def cache_hit_ratios(self):
+        """Hit ratio per cache, from the sipsync_cache_requests_total counter."""
+        totals = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                if name != "sipsync_cache_requests_total":
+                    continue
+                labels = dict(labels)
+                hits, requests = totals.get(labels["cache"], (0, 0))
+                if labels["result"] == "hit":
+                    hits += value
+                totals[labels["cache"]] = (hits, requests + value)
+        return {cache: hits / requests for cache, (hits, requests) in totals.items() if requests}
+
+    def snapshot(self):
+        """
+        Get all metrics as plain data, e.g. for JSON export or tests.
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in self._counters.items()]
+            gauges = [{"name": name, "labels": dict(labels), "value": value}
+                      for (name, labels), value in self._gauges.items()]
+            histograms = [{"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                           "buckets": {str(bound): total for bound, total in h.cumulative()}}
+                          for (name, labels), h in self._histograms.items()]
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "histograms": histograms,
+            "cache_hit_ratios": self.cache_hit_ratios()
+        }
+
+    def render_prometheus(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        def fmt_labels(labels, extra=None):
+            items = list(labels) + (list(extra.items()) if extra else [])
+            if not items:
+                return ""
+            escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in items]
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        lines = []
+        with self._lock:
+            grouped = {}
+            for (name, labels), value in self._counters.items():
+                grouped.setdefault((name, "counter"), []).append((labels, value))
+            for (name, labels), value in self._gauges.items():
+                grouped.setdefault((name, "gauge"), []).append((labels, value))
+            histograms = sorted(self._histograms.items())
+
+            for (name, kind), series in sorted(grouped.items()):
+                help_text = self._help.get(name, (kind, name))[1]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(series):
+                    lines.append(f"{name}{fmt_labels(labels)} {value}")
+
+            current = None
+            for (name, labels), histogram in histograms:
+                if name != current:
+                    current = name
+                    lines.append(f"# HELP {name} {self._help.get(name, ('histogram', name))[1]}")
+                    lines.append(f"# TYPE {name} histogram")
+                for bound, total in histogram.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{fmt_labels(labels, {'le': le})} {total}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {histogram.count}")
+
+        ratios = self.cache_hit_ratios()
+        if ratios:
+            lines.append("# HELP sipsync_cache_hit_ratio Fraction of cache lookups that were hits")
+            lines.append("# TYPE sipsync_cache_hit_ratio gauge")
+            for cache, ratio in sorted(ratios.items()):
+                lines.append(f'sipsync_cache_hit_ratio{{cache="{cache}"}} {ratio}')
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+registry.describe("sipsync_stage_latency_seconds", "histogram", "Latency of recommendation pipeline stages")
+registry.describe("sipsync_stage_errors_total", "counter", "Failed recommendation pipeline stages")
+registry.describe("sipsync_provider_latency_seconds", "histogram", "Latency of outbound provider calls")
+registry.describe("sipsync_provider_errors_total", "counter", "Failed outbound provider calls")
+registry.describe("sipsync_cache_requests_total", "counter", "Cache lookups by cache and result")
+
+# (trace_id, span_id, sampled) of the innermost active span
+_current_span = ContextVar("sipsync_current_span", default=None)
+
+class Span:
+    """
+    Times one pipeline stage or provider call.
+
+    Use through stage() or provider_call(). A span counts as failed if its
+    block raises or if fail() is called, e.g. for a non-200 response that the
+    caller handles without raising.
+    """
+
+    __slots__ = ("name", "kind", "labels", "failed", "start", "context", "token", "parent")
+
+    def __init__(self, name, kind, labels):
+        self.name = name
+        self.kind = kind
+        self.labels = labels
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+    def __enter__(self):
+        self.parent = _current_span.get()
+        if self.parent is None:
+            self.context = (uuid.uuid4().hex, uuid.uuid4().hex[:16], random.random() < TRACE_SAMPLE_RATE)
+        else:
+            self.context = (self.parent[0], uuid.uuid4().hex[:16], self.parent[2])
+        self.token = _current_span.set(self.context)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self.token)
+        except ValueError:
+            # A generator holding this span was closed from another context
+            pass
+        failed = self.failed or exc_type is not None
+
+        if self.kind == "provider":
+            registry.observe("sipsync_provider_latency_seconds", duration, **self.labels)
+            if failed:
+                registry.inc("sipsync_provider_errors_total", **self.labels)
+        else:
+            registry.observe("sipsync_stage_latency_seconds", duration, **self.labels)
+            if failed:
+                registry.inc("sipsync_stage_errors_total", **self.labels)
+
+        trace_id, span_id, sampled = self.context
+        if sampled:
+            trace_logger.info(json.dumps({
+                "ts": time.time(),
+                "trace_id": trace_id,
+                "span_id": span_id,
+                "parent_id": self.parent[1] if self.parent else None,
+                "name": self.name,
+                "kind": self.kind,
+                "labels": self.labels,
+                "duration_ms": round(duration * 1000, 3),
+                "error": failed,
+                "exception": exc_type.__name__ if exc_type else None
+            }))
+        return False
+
+class _NoopSpan:
+    """Shared stand-in returned while metrics are disabled."""
+
+    __slots__ = ()
+
+    def fail(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+def stage(name):
+    """Span around a recommendation pipeline stage."""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, "stage", {"stage": name})
+
+def provider_call(provider, operation):
+    """Span around one outbound call to an external provider."""
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return Span(f"{provider}.{operation}", "provider", {"provider": provider, "operation": operation})
+
+def timed_stage(name):
+    """Decorator running the whole function inside stage(name)."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_cache(cache, hit):
+    """Count a cache lookup for the hit-ratio metrics."""
+    if METRICS_ENABLED:
+        registry.inc("sipsync_cache_requests_total", cache=cache, result="hit" if hit else "miss")
+
+def configure_trace_logging(path=None):
+    """
+    Send sampled spans to a file (JSON lines) or, by default, stderr.
+    """
+    if trace_logger.handlers:
+        return
+    handler = logging.FileHandler(path) if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    trace_logger.addHandler(handler)
+    trace_logger.setLevel(logging.INFO)
+    trace_logger.propagate = False
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] == "/metrics":
+            body = registry.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path.split("?")[0] == "/metrics.json":
+            body = json.dumps(registry.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serve /metrics (Prometheus) and /metrics.json on a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    return server
+
+if TRACE_SAMPLE_RATE > 0:
+    configure_trace_logging(os.getenv("SIPSYNC_TRACE_LOG"))
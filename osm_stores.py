@@ -0,0 +1,311 @@
+# osm_stores.py
+
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+from maps import SHOP_TYPES, STORE_SEARCH_RADIUS, _store_keywords, rank_stores, store_from_tags
+from metrics import provider_call
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Store index built from an OSM extract, read when maps.STORE_PROVIDER is "osm"
+OSM_STORE_PATH = os.getenv("OSM_STORE_PATH", os.path.join(BASE_DIR, "cache", "osm_stores.sqlite3"))
+
+# Every keyword any ingredient can add to a search; elements whose tag keys
+# contain none of them, and that are neither shops nor cafes, are not imported
+IMPORT_KEYWORDS = _store_keywords(["milk", "honey", "ginger", "herbs"])
+
+# Metres per degree of latitude
+METRES_PER_DEGREE = 111320
+
+# Rows committed per transaction during an import
+IMPORT_BATCH_SIZE = 10000
+
+SCHEMA = (
+    "CREATE TABLE stores ("
+    "id INTEGER PRIMARY KEY, osm_type TEXT NOT NULL, osm_id INTEGER NOT NULL, "
+    "name TEXT NOT NULL, latitude REAL NOT NULL, longitude REAL NOT NULL, address TEXT NOT NULL, "
+    "type TEXT NOT NULL, shop TEXT, amenity TEXT, tag_keys TEXT NOT NULL);"
+    "CREATE VIRTUAL TABLE store_index USING rtree(id, min_lat, max_lat, min_lon, max_lon);"
+    "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+)
+
+def _wanted(tags):
+    """Whether an element could match any store search."""
+    if "name" not in tags:
+        return False
+    if "shop" in tags or tags.get("amenity") == "cafe":
+        return True
+    return any(keyword in key for key in tags for keyword in IMPORT_KEYWORDS)
+
+def _centroid(points):
+    points = [(lat, lon) for lat, lon in points if lat is not None and lon is not None]
+    if not points:
+        return None, None
+    return sum(lat for lat, _ in points) / len(points), sum(lon for _, lon in points) / len(points)
+
+def _geometry_points(geometry):
+    """Every (lat, lon) of a GeoJSON geometry; coordinates are (lon, lat)."""
+    kind = geometry.get("type")
+    if kind == "GeometryCollection":
+        return [point for part in geometry.get("geometries", []) for point in _geometry_points(part)]
+    coordinates = geometry.get("coordinates")
+    depth = {"Point": 0, "MultiPoint": 1, "LineString": 1, "Polygon": 2, "MultiLineString": 2, "MultiPolygon": 3}
+    if kind not in depth or coordinates is None:
+        return []
+    positions = [coordinates]
+    for _ in range(depth[kind]):
+        positions = [position for part in positions for position in part]
+    return [(position[1], position[0]) for position in positions]
+
+def _read_geojson(data):
+    """Elements of a GeoJSON FeatureCollection, as written by osmium export or overpass turbo."""
+    for feature in data.get("features", []):
+        properties = feature.get("properties") or {}
+        # overpass turbo nests the tags; osmium export flattens them
+        tags = properties["tags"] if isinstance(properties.get("tags"), dict) else {
+            key: value for key, value in properties.items() if not key.startswith("@")
+        }
+        if not _wanted(tags):
+            continue
+        osm_type, _, osm_id = str(feature.get("id") or properties.get("@id") or "").partition("/")
+        latitude, longitude = _centroid(_geometry_points(feature.get("geometry") or {}))
+        if latitude is not None:
+            yield osm_type or "node", int(osm_id) if osm_id.isdigit() else 0, latitude, longitude, tags
+
+def _read_overpass(data):
+    """Elements of an Overpass JSON response; ways and relations need `out center`."""
+    for element in data.get("elements", []):
+        tags = element.get("tags", {})
+        if not _wanted(tags):
+            continue
+        center = element.get("center", element)
+        if "lat" in center and "lon" in center:
+            yield element.get("type", "node"), element.get("id", 0), center["lat"], center["lon"], tags
+
+def _read_osm_file(path):
+    """Elements of a PBF or XML extract, read with the optional osmium package."""
+    try:
+        import osmium
+    except ImportError:
+        raise ValueError("Reading PBF/XML extracts needs the osmium package (pip install osmium); "
+                         "or convert the extract with `osmium export -f geojson`")
+
+    elements = []
+
+    class Handler(osmium.SimpleHandler):
+        def node(self, node):
+            if "name" in node.tags and node.location.valid():
+                tags = {tag.k: tag.v for tag in node.tags}
+                if _wanted(tags):
+                    elements.append(("node", node.id, node.location.lat, node.location.lon, tags))
+
+        def way(self, way):
+            if "name" in way.tags:
+                tags = {tag.k: tag.v for tag in way.tags}
+                if _wanted(tags):
+                    latitude, longitude = _centroid(
+                        (ref.location.lat, ref.location.lon) for ref in way.nodes if ref.location.valid()
+                    )
+                    if latitude is not None:
+                        elements.append(("way", way.id, latitude, longitude, tags))
+
+    # Node locations are kept so buildings mapped as ways get a centroid
+    Handler().apply_file(path, locations=True)
+    return elements
+
+def read_extract(path):
+    """
+    Read the shops and cafés of an OSM extract.
+
+    Supports PBF and XML extracts (with osmium installed), GeoJSON and saved
+    Overpass JSON responses.
+
+    Returns:
+        iterable: (osm_type, osm_id, latitude, longitude, tags) per element.
+    """
+    if path.endswith((".pbf", ".osm", ".osm.bz2", ".osm.gz")):
+        return _read_osm_file(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if "elements" in data:
+        return _read_overpass(data)
+    return _read_geojson(data)
+
+def import_extract(source, path=OSM_STORE_PATH, force=False):
+    """
+    Build the store index from an extract, replacing the current one.
+
+    The index is written to a temporary file and swapped in, so searches in
+    running processes keep working during a refresh. Unless forced, an
+    extract that has not changed since the last import is skipped.
+
+    Returns:
+        int: Number of stores indexed, or None if the import was skipped.
+    """
+    source_mtime = str(int(os.stat(source).st_mtime))
+    current = _meta(path)
+    if not force and current.get("source") == os.path.abspath(source) and current.get("source_mtime") == source_mtime:
+        return None
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.executescript(SCHEMA)
+        rows = []
+        count = 0
+        for osm_type, osm_id, latitude, longitude, tags in read_extract(source):
+            store = store_from_tags(tags, latitude, longitude)
+            rows.append((
+                count, osm_type, osm_id, store["name"], latitude, longitude, store["address"],
+                store["type"], tags.get("shop"), tags.get("amenity"), " ".join(sorted(tags))
+            ))
+            count += 1
+            if len(rows) >= IMPORT_BATCH_SIZE:
+                _insert(conn, rows)
+                rows = []
+        _insert(conn, rows)
+        with conn:
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+                ("source", os.path.abspath(source)),
+                ("source_mtime", source_mtime),
+                ("imported_at", datetime.now().isoformat(timespec="seconds")),
+                ("stores", str(count))
+            ])
+        conn.execute("VACUUM")
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+    return count
+
+def _insert(conn, rows):
+    with conn:
+        conn.executemany("INSERT INTO stores VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.executemany(
+            "INSERT INTO store_index VALUES (?, ?, ?, ?, ?)",
+            [(row[0], row[4], row[4], row[5], row[5]) for row in rows]
+        )
+
+def _meta(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return {}
+
+_local = threading.local()
+
+def _connection(path):
+    """This thread's read-only connection, reopened when an import replaced the file."""
+    stat = os.stat(path)
+    signature = (path, stat.st_ino, stat.st_mtime_ns)
+    if getattr(_local, "signature", None) != signature:
+        if getattr(_local, "conn", None) is not None:
+            _local.conn.close()
+        _local.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        _local.signature = signature
+    return _local.conn
+
+def _distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371008.8 * math.asin(math.sqrt(a))
+
+def search_stores(latitude, longitude, keywords, radius=STORE_SEARCH_RADIUS, path=OSM_STORE_PATH):
+    """
+    Find stores around a point in the local index.
+
+    Matches what the Overpass query asks for: elements with a tag key
+    containing one of the keywords, shops of maps.SHOP_TYPES and cafés, within
+    `radius` metres. Shops mapped as buildings are included at their centroid.
+
+    Returns:
+        list: Stores in the same form as maps.find_nearby_stores, or None if
+        the index could not be read.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    lat_span = radius / METRES_PER_DEGREE
+    lon_span = radius / (METRES_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    keywords = sorted(set(keywords))
+    with provider_call("osm_extract", "find_stores") as call:
+        try:
+            rows = _connection(path).execute(
+                "SELECT s.name, s.latitude, s.longitude, s.address, s.type, s.shop, s.amenity, s.tag_keys "
+                "FROM store_index i JOIN stores s ON s.id = i.id "
+                "WHERE i.min_lat <= ? AND i.max_lat >= ? AND i.min_lon <= ? AND i.max_lon >= ? "
+                "ORDER BY s.osm_type = 'node' DESC, s.osm_type, s.osm_id",
+                (latitude + lat_span, latitude - lat_span, longitude + lon_span, longitude - lon_span)
+            ).fetchall()
+        except (OSError, sqlite3.Error) as e:
+            call.fail()
+            print(f"OSM store index error ({path}): {e}")
+            return None
+
+    stores = []
+    for name, store_lat, store_lon, address, store_type, shop, amenity, tag_keys in rows:
+        if not (shop in SHOP_TYPES or amenity == "cafe" or
+                any(keyword in key for key in tag_keys.split() for keyword in keywords)):
+            continue
+        if _distance(latitude, longitude, store_lat, store_lon) > radius:
+            continue
+        stores.append({
+            "name": name,
+            "latitude": store_lat,
+            "longitude": store_lon,
+            "address": address,
+            "type": store_type
+        })
+    return rank_stores(stores)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and query the offline OSM store index")
+    parser.add_argument("extract", nargs="?", help="OSM extract to import (.osm.pbf, .geojson or Overpass .json)")
+    parser.add_argument("--force", action="store_true", help="re-import even if the extract is unchanged")
+    parser.add_argument("--near", help="LAT,LON to search around after importing")
+    parser.add_argument("--ingredients", default="", help="comma-separated ingredients for --near")
+    args = parser.parse_args()
+
+    if args.extract:
+        began = time.perf_counter()
+        try:
+            count = import_extract(args.extract, force=args.force)
+        except (OSError, ValueError) as e:
+            print(f"Import failed: {e}", file=sys.stderr)
+            sys.exit(1)
+        if count is None:
+            print(f"{args.extract} unchanged since the last import; use --force to re-import")
+        else:
+            print(f"Indexed {count} stores from {args.extract} in {time.perf_counter() - began:.2f}s")
+    if args.near:
+        lat, lon = (float(value) for value in args.near.split(","))
+        keywords = _store_keywords([item.strip() for item in args.ingredients.split(",") if item.strip()])
+        began = time.perf_counter()
+        stores = search_stores(lat, lon, keywords)
+        elapsed = (time.perf_counter() - began) * 1000
+        for store in stores:
+            print(f"{store['type']:<14} {store['name']}  ({store['address']})")
+        print(f"{len(stores)} stores in {elapsed:.1f}ms")
+    if not args.extract and not args.near:
+        meta = _meta(OSM_STORE_PATH)
+        print(json.dumps(meta, indent=2) if meta else f"No index at {OSM_STORE_PATH}")
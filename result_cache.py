@@ -0,0 +1,111 @@
+# result_cache.py
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from metrics import record_cache
+from catalog import get_catalog
+from dietary import diet_mask
+
+# Decimal places kept when bucketing coordinates (2 places is roughly 1 km)
+LOCATION_PRECISION = 2
+
+# Lifetime and size of the process-wide result cache
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", 30 * 60))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 512))
+
+# Number of results remembered per browser session
+SESSION_CACHE_SIZE = 8
+
+def normalize_input(user_input):
+    """Normalize free text so trivially different inputs share a cache entry."""
+    return re.sub(r'\s+', ' ', (user_input or '').strip().lower())
+
+def location_cell(latitude, longitude, precision=LOCATION_PRECISION):
+    """Bucket a coordinate pair into a grid cell, or None without a location."""
+    if not latitude or not longitude:
+        return None
+    return (round(float(latitude), precision), round(float(longitude), precision))
+
+def make_result_key(user_input, drink_type, latitude, longitude, language, dietary_restrictions=None):
+    """
+    Build the memoization key for a rendered recommendation bundle.
+
+    The catalog version is part of the key, so a catalog reload invalidates
+    earlier results.
+    """
+    return (
+        normalize_input(user_input),
+        drink_type,
+        location_cell(latitude, longitude),
+        language,
+        diet_mask(dietary_restrictions),
+        get_catalog().version
+    )
+
+class ResultCache:
+    """Thread-safe LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# Shared by every session served by this process
+result_cache = ResultCache()
+
+def recall_result(session_state, key):
+    """
+    Look up a rendered bundle, first in the session and then in the process cache.
+
+    Bundles are shared between sessions and must be treated as read-only.
+    """
+    session_results = session_state.setdefault('results', OrderedDict())
+    bundle = session_results.get(key)
+    if bundle is None:
+        bundle = result_cache.get(key)
+        record_cache("results", bundle is not None)
+        if bundle is None:
+            return None
+        session_results[key] = bundle
+    session_results.move_to_end(key)
+    return bundle
+
+def remember_result(session_state, key, bundle, shared=True):
+    """Store a rendered bundle in the session cache, and in the process cache if shared."""
+    session_results = session_state.setdefault('results', OrderedDict())
+    session_results[key] = bundle
+    session_results.move_to_end(key)
+    while len(session_results) > SESSION_CACHE_SIZE:
+        session_results.popitem(last=False)
+    if shared:
+        result_cache.set(key, bundle)
@@ -0,0 +1,291 @@
+# semantic_matcher.py
+
+import argparse
+import glob
+import json
+import os
+import re
+import zlib
+import numpy as np
+from metrics import registry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Hashed feature space; the matrix holds one float32 row of this width per name or synonym
+MATCHER_DIM = int(os.getenv("MATCHER_DIM", 1024))
+
+# Character n-gram sizes, taken within padded words
+NGRAM_SIZES = (2, 3, 4)
+
+# Scores at or above ACCEPT_SCORE are trusted without Gemini, as are scores at
+# or above AMBIGUOUS_SCORE whose lead over the runner-up is at least ACCEPT_MARGIN.
+# Below REJECT_SCORE the input matches no ailment.
+ACCEPT_SCORE = float(os.getenv("MATCHER_ACCEPT_SCORE", 0.6))
+ACCEPT_MARGIN = float(os.getenv("MATCHER_ACCEPT_MARGIN", 0.12))
+AMBIGUOUS_SCORE = float(os.getenv("MATCHER_AMBIGUOUS_SCORE", 0.4))
+REJECT_SCORE = float(os.getenv("MATCHER_REJECT_SCORE", 0.28))
+
+# Labelled phrases used by --evaluate
+PHRASES_PATH = os.path.join(BASE_DIR, "data", "ailment_phrases.jsonl")
+
+MATCHER_CACHE_DIR = os.getenv("CATALOG_CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+# Bump when normalize_text, _features, NGRAM_SIZES or STOPWORDS change so
+# vectors saved by earlier code are rebuilt instead of loaded
+MATCHER_FORMAT = 1
+
+registry.describe("sipsync_matcher_decisions_total", "counter", "Semantic matcher outcomes (match, ambiguous, none)")
+
+# Words that say nothing about the ailment
+STOPWORDS = frozenset("""
+a an and am at be been being but by feel feeling felt for from have having i i'm im in is it
+its just lot me my of on really so some that the this to today too very was with
+""".split())
+
+def normalize_text(text):
+    """Lowercase, drop punctuation and stopwords, the same way for catalog terms and queries."""
+    words = re.sub(r"[^a-z\s]", "", str(text).lower()).split()
+    kept = [word for word in words if word not in STOPWORDS]
+    return " ".join(kept or words)
+
+def _features(text, dim=MATCHER_DIM):
+    """Hashed word and character n-gram features of normalized text as {column: count}."""
+    counts = {}
+    for word in text.split():
+        tokens = [f"w:{word}"]
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            tokens.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        for token in tokens:
+            column = zlib.crc32(token.encode("utf-8")) % dim
+            counts[column] = counts.get(column, 0) + 1
+    return counts
+
+class SemanticMatcher:
+    """
+    TF-IDF vectors over hashed character n-grams for every ailment name and
+    synonym, stored as one contiguous, L2-normalized float32 matrix.
+
+    Cosine similarity is a single matrix product, so any number of queries
+    is scored in one batch.
+    """
+
+    def __init__(self, matrix, idf, row_ailments, ailments, version=None):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.idf = idf.astype(np.float32)
+        self.row_ailments = row_ailments
+        self.ailments = ailments
+        self.version = version
+
+    @classmethod
+    def build(cls, catalog, dim=MATCHER_DIM):
+        """Vectorize every name and synonym of a catalog."""
+        texts, row_ailments = [], []
+        for index, name in enumerate(catalog.names):
+            for term in (name,) + tuple(catalog.columns["synonyms"][index]):
+                texts.append(normalize_text(term))
+                row_ailments.append(index)
+
+        counts = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, count in _features(text, dim).items():
+                counts[row, column] = count
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1.0
+
+        matrix = np.log1p(counts) * idf
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-9)
+        return cls(matrix, idf, np.asarray(row_ailments, dtype=np.int32), list(catalog.names), catalog.version)
+
+    @classmethod
+    def load_or_build(cls, catalog, dim=MATCHER_DIM):
+        """Reuse vectors saved for this catalog version, building and saving them if needed."""
+        path = os.path.join(MATCHER_CACHE_DIR, f"matcher-v{MATCHER_FORMAT}-{catalog.version}-{dim}.npz")
+        try:
+            with np.load(path) as data:
+                return cls(data["matrix"], data["idf"], data["row_ailments"], list(catalog.names), catalog.version)
+        except (OSError, KeyError, ValueError):
+            pass
+
+        matcher = cls.build(catalog, dim)
+        try:
+            os.makedirs(MATCHER_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+            np.savez(tmp_path, matrix=matcher.matrix, idf=matcher.idf, row_ailments=matcher.row_ailments)
+            os.replace(tmp_path, path)
+            # Vectors of earlier catalog versions or formats are never loaded again
+            for stale in glob.glob(os.path.join(MATCHER_CACHE_DIR, "matcher-*.npz")):
+                if stale != path:
+                    os.remove(stale)
+        except OSError as e:
+            print(f"Could not save matcher vectors: {e}")
+        return matcher
+
+    def vectorize(self, texts):
+        dim = self.matrix.shape[1]
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, count in _features(normalize_text(text), dim).items():
+                vectors[row, column] = count
+        vectors = np.log1p(vectors) * self.idf
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+        return vectors
+
+    def top_k_batch(self, texts, k=3):
+        """
+        Score many inputs at once.
+
+        Returns:
+            list: For each input, up to k (ailment, cosine score) pairs, best
+            first, with each ailment scored by its best name or synonym.
+        """
+        if not texts:
+            return []
+        scores = self.vectorize(texts) @ self.matrix.T
+        # Best row per ailment: scatter-max the row scores onto ailment columns
+        per_ailment = np.full((len(texts), len(self.ailments)), -1.0, dtype=np.float32)
+        for i in range(len(texts)):
+            np.maximum.at(per_ailment[i], self.row_ailments, scores[i])
+
+        k = min(k, len(self.ailments))
+        if k == 0:
+            return [[] for _ in texts]
+        top = np.argpartition(-per_ailment, k - 1, axis=1)[:, :k]
+        results = []
+        for i, columns in enumerate(top):
+            ranked = sorted(columns, key=lambda c: -per_ailment[i, c])
+            results.append([(self.ailments[c], float(per_ailment[i, c])) for c in ranked])
+        return results
+
+    def top_k(self, text, k=3):
+        return self.top_k_batch([text], k)[0]
+
+def decide(candidates):
+    """
+    Turn ranked (ailment, score) candidates into a decision.
+
+    Returns:
+        tuple: ("match", ailment) when confident, ("ambiguous", candidates)
+        when an LLM should choose, or ("none", None) when nothing matches.
+    """
+    if not candidates or candidates[0][1] < REJECT_SCORE:
+        return "none", None
+    best, score = candidates[0]
+    runner_up = candidates[1][1] if len(candidates) > 1 else 0.0
+    if score >= ACCEPT_SCORE or (score >= AMBIGUOUS_SCORE and score - runner_up >= ACCEPT_MARGIN):
+        return "match", best
+    return "ambiguous", [c for c in candidates if c[1] >= REJECT_SCORE]
+
+_matcher = None
+
+def get_matcher(catalog):
+    """The matcher for a catalog, rebuilt when the catalog version changes."""
+    global _matcher
+    matcher = _matcher
+    if matcher is None or matcher.version != catalog.version:
+        matcher = _matcher = SemanticMatcher.load_or_build(catalog)
+    return matcher
+
+def _read_phrases(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def evaluate(path=PHRASES_PATH):
+    """
+    Compare the previous fuzzy+Gemini path, over ailment names only, with the
+    semantic matcher on labelled phrases.
+
+    Gemini is treated as an oracle that picks the right candidate whenever it
+    is offered one, which is the best case for both paths; "no LLM" numbers
+    take the top candidate instead. "held_out" repeats the numbers without
+    phrases that are literally a catalog name or synonym, which both paths
+    resolve by exact lookup.
+    """
+    from fuzzywuzzy import process
+    from catalog import get_catalog
+
+    catalog = get_catalog()
+    matcher = get_matcher(catalog)
+    phrases = _read_phrases(path)
+
+    def fuzzy_path(text):
+        # The previous matcher scored ailment names only; synonyms came with this one
+        processed = re.sub(r"[^a-zA-Z\s]", "", text.lower()).strip()
+        matches = process.extractBests(processed, catalog.keys(), score_cutoff=60, limit=3)
+        if not matches:
+            return None, None, False
+        if matches[0][1] > 90:
+            return matches[0][0], matches[0][0], False
+        fallback = matches[0][0] if matches[0][1] > 70 else None
+        return fallback, [m[0] for m in matches], True
+
+    def semantic_path(candidates, text):
+        exact = catalog.lookup(re.sub(r"[^a-zA-Z\s]", "", text.lower()).strip())
+        if exact:
+            return exact, exact, False
+        decision, value = decide(candidates)
+        if decision == "match":
+            return value, value, False
+        if decision == "none":
+            return None, None, False
+        fallback = value[0][0] if value[0][1] >= AMBIGUOUS_SCORE else None
+        return fallback, [c[0] for c in value], True
+
+    def oracle(choice, fallback, label, can_decline):
+        if not isinstance(choice, list):
+            return choice
+        if label in choice or (label is None and can_decline):
+            return label
+        return fallback
+
+    literal_terms = {normalize_text(term) for term in catalog.terms()}
+    held_out = [
+        normalize_text(p["text"]) not in literal_terms
+        and not catalog.lookup(re.sub(r"[^a-zA-Z\s]", "", p["text"].lower()).strip())
+        for p in phrases
+    ]
+
+    def summarize(outcomes):
+        # outcomes: (correct without LLM, correct with oracle, needed LLM) per phrase
+        return {
+            "phrases": len(outcomes),
+            "accuracy_no_llm": round(sum(o[0] for o in outcomes) / max(len(outcomes), 1), 3),
+            "accuracy_with_gemini": round(sum(o[1] for o in outcomes) / max(len(outcomes), 1), 3),
+            "gemini_calls": sum(o[2] for o in outcomes)
+        }
+
+    report = {}
+    candidates = matcher.top_k_batch([p["text"] for p in phrases])
+    # Only the semantic path's prompt lets Gemini answer "none"
+    for name, path_fn, can_decline in (("fuzzy", lambda p, c: fuzzy_path(p["text"]), False),
+                                       ("semantic", lambda p, c: semantic_path(c, p["text"]), True)):
+        outcomes = []
+        misses = []
+        for phrase, cands in zip(phrases, candidates):
+            fallback, choice, needs_llm = path_fn(phrase, cands)
+            label = phrase["ailment"]
+            predicted = oracle(choice, fallback, label, can_decline)
+            outcomes.append((fallback == label, predicted == label, needs_llm))
+            if predicted != label:
+                misses.append(f"{phrase['text']!r}: expected {label}, got {predicted}")
+        report[name] = dict(
+            summarize(outcomes),
+            held_out=summarize([o for o, kept in zip(outcomes, held_out) if kept]),
+            misses=misses
+        )
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Semantic ailment matcher tools")
+    parser.add_argument("--evaluate", action="store_true", help="compare with the fuzzy path on labelled phrases")
+    parser.add_argument("--phrases", default=PHRASES_PATH)
+    parser.add_argument("--query", action="append", help="show top matches for a phrase (repeatable)")
+    args = parser.parse_args()
+
+    if args.query:
+        from catalog import get_catalog
+        matcher = get_matcher(get_catalog())
+        for text, candidates in zip(args.query, matcher.top_k_batch(args.query)):
+            print(f"{text!r}: {decide(candidates)[0]} {[(a, round(s, 3)) for a, s in candidates]}")
+    if args.evaluate or not args.query:
+        print(json.dumps(evaluate(args.phrases), indent=2))
@@ -0,0 +1,251 @@
+# session_memory.py
+
+import os
+import pickle
+import threading
+import time
+import uuid
+import weakref
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.vendor.pympler.asizeof import asizeof
+from metrics import registry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Session state keys that are rebuilt or reloaded on demand, and so may leave memory
+SPILL_KEYS = ("profile", "results")
+
+# Where heavy state of evicted sessions is kept until they come back
+SESSION_SPILL_DIR = os.getenv("SESSION_SPILL_DIR", os.path.join(BASE_DIR, "cache", "sessions"))
+
+# Sessions idle this long are spilled; sessions active more recently than
+# SESSION_MIN_IDLE are never touched, as their script may be running
+SESSION_IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", 10 * 60))
+SESSION_MIN_IDLE = float(os.getenv("SESSION_MIN_IDLE", 30))
+
+# Approximate session state bytes allowed per worker process (0: unlimited).
+# Beyond it, the least recently active sessions are spilled first.
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", 256))
+
+# A session is re-measured at most this often, and idle sessions looked for at most this often
+SESSION_MEASURE_INTERVAL = float(os.getenv("SESSION_MEASURE_INTERVAL", 15))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", 30))
+
+registry.describe("sipsync_session_state_bytes", "gauge", "Approximate session state bytes per key, all sessions")
+registry.describe("sipsync_sessions", "gauge", "Sessions tracked by this process, by state")
+registry.describe("sipsync_session_spills_total", "counter", "Sessions whose heavy state was spilled to disk")
+registry.describe("sipsync_session_restores_total", "counter", "Spilled sessions reloaded on their next rerun")
+
+class _Session:
+    def __init__(self, session_id, state):
+        self.session_id = session_id
+        self.state = weakref.ref(state)
+        self.spill_name = f"{uuid.uuid4().hex}.pickle"
+        self.last_seen = time.monotonic()
+        self.measured_at = 0.0
+        self.key_bytes = {}
+        self.spilled = False
+        self.lock = threading.Lock()
+
+    @property
+    def bytes(self):
+        return sum(self.key_bytes.values())
+
+class SessionMemory:
+    """
+    Per-session memory accounting for one worker process.
+
+    Call touch() at the top of every script run. It restores the session's
+    spilled state, re-measures the session now and then, and spills the
+    SPILL_KEYS of sessions that are idle or push the process over its budget.
+    Spilled values are pickled to SESSION_SPILL_DIR and loaded back the next
+    time their session reruns.
+    """
+
+    def __init__(self, budget_bytes=SESSION_MEMORY_BUDGET_MB * 2 ** 20, spill_dir=SESSION_SPILL_DIR,
+                 idle_seconds=SESSION_IDLE_SECONDS):
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def touch(self):
+        """Account for the current script run's session; a no-op outside Streamlit."""
+        ctx = get_script_run_ctx()
+        if ctx is None:
+            return
+        # Each run wraps the session's lasting SessionState in a new thread-safe
+        # proxy; track the SessionState itself
+        state = ctx.session_state._state
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(id(state))
+            if session is None or session.state() is not state:
+                session = self._sessions[id(state)] = _Session(ctx.session_id, state)
+            session.last_seen = now
+        with session.lock:
+            if session.spilled:
+                self._restore(session, state)
+            if now - session.measured_at >= SESSION_MEASURE_INTERVAL:
+                self._measure(session, state)
+        if now - self._swept_at >= SESSION_SWEEP_INTERVAL or self.over_budget():
+            self._swept_at = now
+            self.sweep()
+
+    def _measure(self, session, state):
+        session.key_bytes = {key: asizeof(value) for key, value in state.filtered_state.items()}
+        session.measured_at = time.monotonic()
+
+    def _spill_path(self, session):
+        return os.path.join(self.spill_dir, session.spill_name)
+
+    def _spill(self, session, reason):
+        state = session.state()
+        if state is None or session.spilled:
+            return
+        heavy = {key: state[key] for key in SPILL_KEYS if key in state}
+        if not heavy:
+            return
+        tmp_path = f"{self._spill_path(session)}.tmp"
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(heavy, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._spill_path(session))
+        except Exception as e:
+            # Unpicklable values raise TypeError and the like; the session
+            # simply stays resident, and the sweep must not fail another
+            # session's script run
+            print(f"Session spill error: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        for key in heavy:
+            del state[key]
+        session.spilled = True
+        for key in heavy:
+            session.key_bytes.pop(key, None)
+        registry.inc("sipsync_session_spills_total", reason=reason)
+
+    def _restore(self, session, state):
+        path = self._spill_path(session)
+        try:
+            with open(path, 'rb') as f:
+                heavy = pickle.load(f)
+            os.remove(path)
+        except (OSError, pickle.UnpicklingError) as e:
+            # Missing keys are rebuilt by the app, e.g. the profile from disk
+            print(f"Session restore error: {e}")
+            heavy = {}
+        for key, value in heavy.items():
+            if key not in state:
+                state[key] = value
+        session.spilled = False
+        session.measured_at = 0.0
+        registry.inc("sipsync_session_restores_total")
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(session.bytes for session in self._sessions.values())
+
+    def over_budget(self):
+        return self.budget_bytes > 0 and self.total_bytes() > self.budget_bytes
+
+    def sweep(self):
+        """
+        Drop closed sessions, spill idle ones, then spill the least recently
+        active until the process is within budget.
+
+        Returns:
+            int: Number of sessions spilled.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for state_id, session in list(self._sessions.items()):
+                if session.state() is None:
+                    del self._sessions[state_id]
+                    try:
+                        os.remove(self._spill_path(session))
+                    except OSError:
+                        pass
+            candidates = sorted(
+                (session for session in self._sessions.values()
+                 if not session.spilled and now - session.last_seen >= SESSION_MIN_IDLE),
+                key=lambda session: session.last_seen
+            )
+
+        spilled = 0
+        for session in candidates:
+            idle = now - session.last_seen >= self.idle_seconds
+            if not idle and not self.over_budget():
+                break
+            # Skip sessions whose script is restoring or measuring right now
+            if session.lock.acquire(blocking=False):
+                try:
+                    self._spill(session, "idle" if idle else "budget")
+                    spilled += session.spilled
+                finally:
+                    session.lock.release()
+        self._publish()
+        return spilled
+
+    def _publish(self):
+        totals = {}
+        with self._lock:
+            sessions = list(self._sessions.values())
+        for session in sessions:
+            for key, size in session.key_bytes.items():
+                totals[key] = totals.get(key, 0) + size
+        for key, size in totals.items():
+            registry.set_gauge("sipsync_session_state_bytes", size, key=key)
+        registry.set_gauge("sipsync_sessions", sum(not s.spilled for s in sessions), state="resident")
+        registry.set_gauge("sipsync_sessions", sum(s.spilled for s in sessions), state="spilled")
+
+    def report(self):
+        """
+        Approximate memory per session and per key, largest sessions first.
+
+        Figures are from each session's latest measurement, at most
+        SESSION_MEASURE_INTERVAL seconds old; objects shared between sessions,
+        such as cached result bundles, are counted in each of them.
+        """
+        now = time.monotonic()
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "total_bytes": sum(session.bytes for session in sessions),
+            "budget_bytes": self.budget_bytes,
+            "sessions": sorted(
+                (
+                    {
+                        "session_id": session.session_id,
+                        "idle_s": round(now - session.last_seen, 1),
+                        "spilled": session.spilled,
+                        "bytes": session.bytes,
+                        "keys": dict(sorted(session.key_bytes.items(), key=lambda item: -item[1]))
+                    }
+                    for session in sessions
+                ),
+                key=lambda entry: -entry["bytes"]
+            )
+        }
+
+    def current(self):
+        """The report entry of the current script run's session, or None."""
+        ctx = get_script_run_ctx()
+        session = ctx and self._sessions.get(id(ctx.session_state._state))
+        if session is None:
+            return None
+        return {
+            "session_id": session.session_id,
+            "spilled": session.spilled,
+            "bytes": session.bytes,
+            "keys": dict(sorted(session.key_bytes.items(), key=lambda item: -item[1]))
+        }
+
+# Shared by every session served by this process
+session_memory = SessionMemory()
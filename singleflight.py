@@ -0,0 +1,80 @@
+# singleflight.py
+
+import copy
+import threading
+from metrics import registry
+
+registry.describe("sipsync_singleflight_calls_total", "counter", "Coalesced calls by call name and role (leader or shared)")
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Coalesce identical in-flight calls.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive with the same key while it runs wait and receive the same result
+    or exception. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, copy_result=copy.deepcopy, **kwargs):
+        """
+        Run func(*args, **kwargs) once per key among concurrent callers.
+
+        Args:
+            key: Hashable tuple whose first item names the call, for metrics.
+            copy_result: Applied to the result for each waiting caller so no
+                two callers share a mutable object; None to share it as is.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        name = key[0] if isinstance(key, tuple) else str(key)
+        if not leader:
+            registry.inc("sipsync_singleflight_calls_total", call=name, role="shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy_result(call.result) if copy_result else call.result
+
+        registry.inc("sipsync_singleflight_calls_total", call=name, role="leader")
+        try:
+            result = func(*args, **kwargs)
+            # Closing the key and reading the waiter count under one lock means
+            # no caller can join after we decide whether to copy
+            with self._lock:
+                del self._calls[key]
+                has_waiters = call.waiters > 0
+            # Snapshot before releasing waiters: the leader's caller may mutate its result
+            call.result = copy_result(result) if copy_result and has_waiters else result
+            return result
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.error = e
+            raise
+        finally:
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+# Process-wide group shared by the pipeline and provider wrappers
+flight = SingleFlight()
@@ -0,0 +1,147 @@
+# speculation.py
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from metrics import registry
+
+# Background workers for speculative work; 0 disables speculation
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", 2))
+
+# Foreground requests in flight at which speculation stops and queued work is cancelled
+SPECULATION_MAX_LOAD = int(os.getenv("SPECULATION_MAX_LOAD", 4))
+
+# Niceness added to speculative worker threads where the OS supports per-thread priority
+SPECULATION_NICENESS = 10
+
+registry.describe("sipsync_speculation_total", "counter",
+                  "Speculative tasks by outcome (submitted, skipped, cancelled, completed, failed)")
+registry.describe("sipsync_foreground_requests", "gauge", "Foreground requests in flight")
+
+def _lower_priority():
+    # On Linux each thread is its own task, so this lowers only the worker thread
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SPECULATION_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+class Speculator:
+    """
+    Run optional work ahead of demand on a small, low-priority pool.
+
+    Foreground requests are counted with foreground(); while that count is at
+    or above max_load, new work is skipped and queued work is cancelled, so
+    speculation only ever uses spare capacity. Each key runs at most once
+    while queued or running.
+    """
+
+    def __init__(self, workers=SPECULATION_WORKERS, max_load=SPECULATION_MAX_LOAD):
+        self.max_load = max_load
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="sipsync-speculate", initializer=_lower_priority
+        ) if workers > 0 else None
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._foreground = 0
+
+    @contextmanager
+    def foreground(self):
+        """Count a user-facing request for the duration of the block."""
+        with self._lock:
+            self._foreground += 1
+            load = self._foreground
+        registry.set_gauge("sipsync_foreground_requests", load)
+        if load >= self.max_load:
+            self.cancel_pending()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground -= 1
+                load = self._foreground
+            registry.set_gauge("sipsync_foreground_requests", load)
+
+    def overloaded(self):
+        return self._foreground >= self.max_load
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) unless speculation is off, the process is
+        busy, or the same key is already queued or running.
+
+        Returns:
+            bool: Whether the work was queued.
+        """
+        if self._executor is None or self.overloaded():
+            registry.inc("sipsync_speculation_total", outcome="skipped")
+            return False
+        with self._lock:
+            if key in self._pending:
+                return False
+            future = self._executor.submit(self._run, key, func, args, kwargs)
+            self._pending[key] = future
+        registry.inc("sipsync_speculation_total", outcome="submitted")
+        return True
+
+    def _run(self, key, func, args, kwargs):
+        try:
+            # Load may have risen while this waited in the queue
+            if self.overloaded():
+                registry.inc("sipsync_speculation_total", outcome="cancelled")
+                return None
+            result = func(*args, **kwargs)
+            registry.inc("sipsync_speculation_total", outcome="completed")
+            return result
+        except Exception as e:
+            registry.inc("sipsync_speculation_total", outcome="failed")
+            print(f"Speculative task {key[0] if isinstance(key, tuple) else key} failed: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def claim(self, key, timeout=None):
+        """
+        Take over speculative work that a foreground request now needs.
+
+        Queued work is cancelled, since the caller will run it anyway; running
+        work is waited for.
+
+        Returns:
+            The speculative result, or None if there was none to take over.
+        """
+        with self._lock:
+            future = self._pending.get(key)
+        if future is None:
+            return None
+        if future.cancel():
+            with self._lock:
+                self._pending.pop(key, None)
+            registry.inc("sipsync_speculation_total", outcome="cancelled")
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def cancel_pending(self):
+        """Cancel queued (not yet running) work."""
+        with self._lock:
+            pending = list(self._pending.items())
+        cancelled = 0
+        for key, future in pending:
+            if future.cancel():
+                cancelled += 1
+                with self._lock:
+                    self._pending.pop(key, None)
+        if cancelled:
+            registry.inc("sipsync_speculation_total", amount=cancelled, outcome="cancelled")
+        return cancelled
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+# Process-wide speculator shared by the pipeline
+speculator = Speculator()
@@ -0,0 +1,217 @@
+# symptom_extractor.py
+
+import re
+import threading
+
+# Severity cues, strongest level first
+SEVERITY_WORDS = {
+    "severe": ["severe", "severely", "terrible", "terribly", "extreme", "extremely", "awful", "unbearable",
+               "excruciating", "killing me", "really bad", "so bad", "worst"],
+    "moderate": ["moderate", "quite", "rather", "pretty", "fairly", "bad"],
+    "mild": ["mild", "slight", "slightly", "a bit", "a little", "a little bit", "kind of", "kinda"]
+}
+SEVERITY_RANK = {"mild": 0, "moderate": 1, "severe": 2}
+
+# Negation cues; apostrophes are stripped before matching ("don't" -> "dont")
+NEGATION_WORDS = ["not", "no", "never", "without", "dont", "doesnt", "isnt", "arent", "wasnt", "im not",
+                  "not really", "free of", "no longer"]
+
+# A negation covers the next symptom at most this many words later, within the same clause
+NEGATION_WINDOW = 3
+
+# Words and punctuation that end a negation's scope
+CLAUSE_BREAKS = [",", ".", ";", "!", "?", "but", "just", "only", "though", "however"]
+
+# Conjunctions and separators that split a compound description into segments
+SEGMENT_BREAKS = re.compile(r"\s*(?:[,;&+/]|\b(?:and|with|plus|also|as well as|but|or)\b)\s*")
+
+BODY_PARTS = [
+    "head", "temple", "temples", "forehead", "eyes", "sinus", "sinuses", "nose", "throat", "neck",
+    "chest", "lungs", "stomach", "tummy", "belly", "gut", "back", "muscles", "joints", "skin"
+]
+
+_NUMBER = r"(?:\d+|a|an|one|two|three|four|five|six|seven|eight|nine|ten|few|a few|several|couple of|a couple of)"
+_UNIT = r"(?:minutes?|mins?|hours?|hrs?|days?|nights?|weeks?|months?|years?)"
+DURATION_PATTERNS = [
+    rf"(?:for|over|in)\s+(?:the\s+)?(?:past\s+|last\s+)?{_NUMBER}\s*{_UNIT}",
+    rf"{_NUMBER}\s*{_UNIT}\s+(?:now|already|straight)",
+    r"since\s+(?:yesterday|last\s+night|last\s+week|this\s+morning|this\s+afternoon|the\s+morning|"
+    r"monday|tuesday|wednesday|thursday|friday|saturday|sunday|\d{1,2}\s*(?:am|pm))",
+    r"all\s+(?:day|night|week|morning|afternoon)(?:\s+long)?",
+    r"for\s+(?:ages|a\s+while|a\s+long\s+time)",
+    r"chronic(?:ally)?|constantly|on\s+and\s+off"
+]
+
+def _trie_pattern(phrases):
+    """
+    Compile phrases into one regex alternation shaped like a trie.
+
+    Shared prefixes are matched once, so the pattern stays fast with
+    thousands of phrases, and longer phrases win over their prefixes.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node):
+        terminal = "" in node
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return "(?:" + body + ")?"
+        return body
+
+    return emit(trie)
+
+def normalize_for_extraction(text):
+    """Lowercase, drop apostrophes and collapse whitespace; digits and clause punctuation are kept."""
+    text = str(text).lower().replace("’", "'").replace("'", "")
+    text = re.sub(r"[^a-z0-9\s,.;!?]", " ", text)
+    return " ".join(text.split())
+
+def segment_text(text):
+    """Split a description on conjunctions and separators into non-empty segments."""
+    return [segment.strip(" .!?") for segment in SEGMENT_BREAKS.split(text) if segment.strip(" .!?")]
+
+class SymptomIntent:
+    """Structured reading of a free-text symptom description."""
+
+    __slots__ = ("text", "symptoms", "negated", "severity", "duration", "body_parts", "phrases")
+
+    def __init__(self, text):
+        self.text = text
+        self.symptoms = []
+        self.negated = []
+        self.severity = "mild"
+        self.duration = None
+        self.body_parts = []
+        self.phrases = []
+
+    def residual_text(self):
+        """The description with negated symptom phrases removed, for similarity matching."""
+        text = self.text
+        for phrase in self.negated_phrases():
+            text = text.replace(phrase, " ")
+        for word in NEGATION_WORDS:
+            text = re.sub(rf"\b{re.escape(word)}\b", " ", text)
+        return " ".join(re.sub(r"[,.;!?]", " ", text).split())
+
+    def negated_phrases(self):
+        return [phrase for phrase, negated in self.phrases if negated]
+
+    def describe(self):
+        """One line per known fact, for LLM prompts."""
+        lines = [f"- Severity: {self.severity}"]
+        if self.symptoms:
+            lines.append(f"- Reported symptoms: {', '.join(self.symptoms)}")
+        if self.negated:
+            lines.append(f"- Explicitly NOT experiencing: {', '.join(self.negated)}")
+        if self.body_parts:
+            lines.append(f"- Body parts mentioned: {', '.join(self.body_parts)}")
+        if self.duration:
+            lines.append(f"- Duration: {self.duration}")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            "symptoms": list(self.symptoms),
+            "negated": list(self.negated),
+            "severity": self.severity,
+            "duration": self.duration,
+            "body_parts": list(self.body_parts)
+        }
+
+class SymptomExtractor:
+    """
+    Extract symptoms, severity, negations, duration and body parts in one pass.
+
+    Every cue is a named group of a single compiled regex, and symptom phrases
+    (catalog names and synonyms) form a trie-shaped alternation, so one
+    finditer over the text finds them all.
+    """
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        # Extraction drops apostrophes, so map its form of every name and synonym back
+        self.phrase_ailments = {}
+        for term in catalog.terms():
+            self.phrase_ailments.setdefault(normalize_for_extraction(term), catalog.lookup(term))
+        self.phrase_ailments.pop("", None)
+        self.severity_of = {
+            normalize_for_extraction(word): level for level, words in SEVERITY_WORDS.items() for word in words
+        }
+
+        def words(values):
+            return r"\b(?:" + _trie_pattern({normalize_for_extraction(v) for v in values}) + r")\b"
+
+        self.pattern = re.compile("|".join([
+            "(?P<duration>" + "|".join(rf"\b{p}\b" for p in DURATION_PATTERNS) + ")",
+            "(?P<symptom>" + words(self.phrase_ailments) + ")",
+            "(?P<negation>" + words(NEGATION_WORDS) + ")",
+            "(?P<severity>" + words(self.severity_of) + ")",
+            "(?P<body>" + words(BODY_PARTS) + ")",
+            "(?P<clause>[,.;!?]|" + words(w for w in CLAUSE_BREAKS if w.isalpha()) + ")"
+        ]))
+
+    def extract(self, text):
+        intent = SymptomIntent(normalize_for_extraction(text))
+        negation_end = None
+
+        for match in self.pattern.finditer(intent.text):
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "negation":
+                negation_end = match.end()
+            elif kind == "clause":
+                negation_end = None
+            elif kind == "severity":
+                level = self.severity_of[value]
+                if SEVERITY_RANK[level] > SEVERITY_RANK[intent.severity]:
+                    intent.severity = level
+            elif kind == "duration":
+                intent.duration = intent.duration or value
+            elif kind == "body":
+                if value not in intent.body_parts:
+                    intent.body_parts.append(value)
+            elif kind == "symptom":
+                ailment = self.phrase_ailments.get(value)
+                negated = (negation_end is not None and
+                           len(intent.text[negation_end:match.start()].split()) <= NEGATION_WINDOW)
+                intent.phrases.append((value, negated))
+                target = intent.negated if negated else intent.symptoms
+                if ailment and ailment not in target:
+                    target.append(ailment)
+                # Body parts inside a symptom phrase ("sore throat") still count
+                for part in BODY_PARTS:
+                    if re.search(rf"\b{part}\b", value) and part not in intent.body_parts:
+                        intent.body_parts.append(part)
+
+        # A symptom both reported and denied ("not stressed, just stressed out") counts as reported
+        intent.negated = [ailment for ailment in intent.negated if ailment not in intent.symptoms]
+        return intent
+
+_extractor = None
+_lock = threading.Lock()
+
+def get_extractor(catalog):
+    """The extractor for a catalog, recompiled when the catalog version changes."""
+    global _extractor
+    extractor = _extractor
+    if extractor is None or extractor.version != catalog.version:
+        with _lock:
+            if _extractor is None or _extractor.version != catalog.version:
+                _extractor = SymptomExtractor(catalog)
+            extractor = _extractor
+    return extractor
+
+def extract_intent(text, catalog=None):
+    """Extract a SymptomIntent from free text using the current catalog."""
+    if catalog is None:
+        from catalog import get_catalog
+        catalog = get_catalog()
+    return get_extractor(catalog).extract(text)
@@ -0,0 +1,131 @@
+import json
+import os
+from datetime import datetime, timezone
+import pytest
+from analytics_store import AnalyticsStore, _profile_time, backfill_profiles
+
+def event(day, hour, ailment="headache", drink="Peppermint Tea", score=4.0, weather=False):
+    return {
+        "ailment": ailment, "drink": drink, "sustainability_score": score, "weather_adjusted": weather
+    }, datetime(2026, 10, day, hour, tzinfo=timezone.utc)
+
+@pytest.fixture
+def store(tmp_path):
+    return AnalyticsStore(str(tmp_path / "analytics"), flush_events=1000, flush_seconds=0)
+
+def record(store, user_id, day, hour, **kwargs):
+    recommendation, timestamp = event(day, hour, **kwargs)
+    store.record(user_id, recommendation, timestamp)
+
+def rollup_rows(store):
+    df = store.rollup("daily")
+    return sorted(df[["ailment", "drink", "weather_adjusted", "events", "sustainability_sum"]]
+                  .itertuples(index=False, name=None))
+
+def test_flush_writes_day_partitions_and_rollups(store):
+    record(store, "alice", 1, 9)
+    record(store, "alice", 1, 22, ailment="stress", drink="Chamomile Tea", weather=True)
+    record(store, "bob", 2, 8, score=2.0)
+
+    assert store.flush() == 3
+    assert sorted(os.listdir(store.events_dir)) == ["date=2026-10-01", "date=2026-10-02"]
+    assert store.summary() == {
+        "total_recommendations": 3,
+        "weather_adjusted_percent": pytest.approx(100 / 3),
+        "avg_sustainability": pytest.approx(10 / 3)
+    }
+    assert store.top("ailment").to_dict("records") == [
+        {"ailment": "headache", "events": 2}, {"ailment": "stress", "events": 1}
+    ]
+    assert len(store.trend(granularity="hourly")) == 3
+
+def test_refresh_is_incremental_and_matches_a_rebuild(store):
+    record(store, "alice", 1, 9)
+    store.flush()
+    record(store, "bob", 1, 10)
+    store.flush()
+
+    assert store.refresh_rollups() == 0
+    before = rollup_rows(store)
+    assert store.rebuild_rollups() >= 1
+    assert rollup_rows(store) == before
+    assert store.summary()["total_recommendations"] == 2
+
+def test_compaction_merges_past_days_without_double_counting(store):
+    for hour in range(3):
+        record(store, "alice", 1, hour)
+        store.flush()
+    store.refresh_rollups()
+    before = rollup_rows(store)
+
+    assert store.compact("2026-10-02") == 1
+    assert len(os.listdir(os.path.join(store.events_dir, "date=2026-10-01"))) == 1
+    store.refresh_rollups()
+    assert rollup_rows(store) == before
+    store.rebuild_rollups()
+    assert rollup_rows(store) == before
+
+def test_failed_write_keeps_events_and_skips_listeners(store, monkeypatch):
+    seen = []
+    store.add_listener(seen.append)
+    record(store, "alice", 1, 9)
+
+    def fail(events):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "write_events", fail)
+    assert store.flush() == 0
+    assert seen == []
+
+    monkeypatch.undo()
+    assert store.flush() == 1
+    assert [e["user_id"] for e in seen[0]] == ["alice"]
+
+def write_profile(directory, user_id, history, daily_rollups=None):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{user_id}.json"), "w") as f:
+        json.dump({"preferences": {}, "history": history, "daily_rollups": daily_rollups or {}}, f)
+
+HISTORY = [
+    {"timestamp": "2026-10-03T09:00:00", "ailment": "headache", "drink": "Peppermint Tea",
+     "sustainability_score": 4, "weather_adjusted": False},
+    {"timestamp": "2026-10-03T18:30:00", "ailment": "stress", "drink": "Chamomile Tea",
+     "sustainability_score": 5, "weather_adjusted": True}
+]
+ROLLUPS = {
+    "2026-09-20": {"count": 3, "ailments": {"headache": 2, "tired": 1},
+                   "drinks": {"Peppermint Tea": 2, "Green Tea": 1}, "sustainability_sum": 12, "weather_adjusted": 1}
+}
+
+def test_backfill_ingests_history_and_rollups_once(store, tmp_path):
+    profiles = str(tmp_path / "profiles")
+    write_profile(profiles, "alice", HISTORY, ROLLUPS)
+
+    assert backfill_profiles(profiles, store) == 5
+    assert backfill_profiles(profiles, store) == 0
+    summary = store.summary()
+    assert summary["total_recommendations"] == 5
+    assert summary["avg_sustainability"] == pytest.approx((4 + 5 + 12) / 5)
+    assert summary["weather_adjusted_percent"] == pytest.approx(40)
+
+def test_backfill_skips_events_recorded_live(store, tmp_path):
+    profiles = str(tmp_path / "profiles")
+    for entry in HISTORY:
+        store.record("alice", entry, _profile_time(entry["timestamp"]))
+    store.flush()
+    # The first entry has since been rolled up into the profile's daily counts
+    rolled = {"2026-10-03": {"count": 1, "ailments": {"headache": 1}, "drinks": {"Peppermint Tea": 1},
+                             "sustainability_sum": 4, "weather_adjusted": 0}}
+    write_profile(profiles, "alice", HISTORY[1:], rolled)
+
+    assert backfill_profiles(profiles, store) == 0
+    assert store.summary()["total_recommendations"] == 2
+
+def test_backfill_notifies_listeners(store, tmp_path):
+    seen = []
+    store.add_listener(seen.extend)
+    profiles = str(tmp_path / "profiles")
+    write_profile(profiles, "alice", HISTORY)
+
+    backfill_profiles(profiles, store)
+    assert sorted(e["drink"] for e in seen) == ["Chamomile Tea", "Peppermint Tea"]
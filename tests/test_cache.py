@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from cache import Cache, MemoryBackend, RedisBackend, SQLiteBackend
+from fake_providers import FakeRedisServer
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryBackend()
+    elif request.param == "sqlite":
+        yield SQLiteBackend(str(tmp_path / "shared.sqlite3"))
+    else:
+        server = FakeRedisServer().start()
+        try:
+            yield RedisBackend(server.url)
+        finally:
+            server.stop()
+
+def test_values_round_trip_as_json(backend):
+    cache = Cache("test", backend=backend)
+    value = {"drink": "Ginger Tea", "stores": [("Shop", 51.5)], "score": 4.5}
+
+    assert cache.set("key", value)
+    loaded = cache.get("key")
+    assert loaded == {"drink": "Ginger Tea", "stores": [["Shop", 51.5]], "score": 4.5}
+    # Every get is a fresh copy
+    loaded["drink"] = "changed"
+    assert cache.get("key")["drink"] == "Ginger Tea"
+
+def test_none_is_a_cached_value_not_a_miss(backend):
+    cache = Cache("test", backend=backend)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return None
+
+    assert cache.get_or_compute("key", compute) is None
+    assert cache.get_or_compute("key", compute) is None
+    assert len(calls) == 1
+    assert cache.get("key", default="missing") is None
+    assert cache.get("other", default="missing") == "missing"
+
+def test_rejected_values_are_not_stored(backend):
+    cache = Cache("test", backend=backend)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return []
+
+    for _ in range(2):
+        assert cache.get_or_compute("key", compute, cache_if=bool) == []
+    assert len(calls) == 2
+
+def test_entries_expire(backend):
+    cache = Cache("test", ttl=0.05, backend=backend)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    time.sleep(0.1)
+    assert cache.get("key") is None
+
+def test_namespaces_and_versions_are_isolated(backend):
+    teas = Cache("teas", backend=backend)
+    coffees = Cache("coffees", backend=backend)
+    teas.set("key", "tea")
+    coffees.set("key", "coffee")
+
+    assert Cache("teas", version=2, backend=backend).get("key") is None
+    teas.clear()
+    assert teas.get("key") is None
+    assert coffees.get("key") == "coffee"
+
+def test_oversized_values_are_not_stored(backend):
+    cache = Cache("test", max_value_bytes=16, backend=backend)
+
+    assert not cache.set("key", "x" * 100)
+    assert cache.get("key") is None
+    assert cache.set("key", "small")
+
+def test_concurrent_misses_compute_once(backend):
+    cache = Cache("test", backend=backend)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"value": 42}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: cache.get_or_compute("key", compute), range(8)))
+
+    assert len(calls) == 1
+    assert results == [{"value": 42}] * 8
+
+def test_shared_backends_wait_for_another_process_to_fill(backend):
+    if not backend.shared:
+        pytest.skip("only shared backends take the cross-process lock")
+    cache = Cache("test", backend=backend)
+    full_key = cache.key("key")
+    # Another process holds the fill lock and stores the value shortly
+    assert backend.add(full_key + ":lock", b"1", 30)
+    timer = threading.Timer(0.2, cache.set, ("key", "theirs"))
+    timer.start()
+    try:
+        assert cache.get_or_compute("key", lambda: "ours") == "theirs"
+    finally:
+        timer.cancel()
+    assert not backend.add(full_key + ":lock", b"1", 30)
+
+def test_fill_lock_is_released(backend):
+    cache = Cache("test", backend=backend)
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute("key", lambda: (_ for _ in ()).throw(RuntimeError("upstream down")))
+    assert cache.get("key", default="missing") == "missing"
+    if backend.shared:
+        assert backend.add(cache.key("key") + ":lock", b"1", 30)
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_bytes=60)
+    for key in ("a", "b", "c"):
+        backend.set(key, b"x" * 19)
+    backend.get("a")
+    backend.set("d", b"x" * 19)
+
+    assert backend.get("b") is None
+    assert backend.get("a") is not None
+    assert backend.stats()["bytes"] <= 60
+
+def test_sqlite_prune_drops_expired_and_least_recently_used(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "shared.sqlite3"), max_bytes=100)
+    backend.set("expired", b"x" * 10, ttl=0.01)
+    for i in range(10):
+        backend.set(f"key{i}", b"x" * 20)
+        time.sleep(0.001)
+    time.sleep(0.02)
+    backend.prune()
+
+    stats = backend.stats()
+    assert stats["bytes"] <= 90
+    assert backend.get("key9") is not None
+    assert backend.get("key0") is None
+
+def test_unreachable_backend_is_a_miss():
+    cache = Cache("test", backend=RedisBackend("redis://127.0.0.1:1/0", timeout=0.2))
+
+    assert cache.get("key", default="missing") == "missing"
+    assert cache.get_or_compute("key", lambda: "computed") == "computed"
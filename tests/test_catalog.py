@@ -0,0 +1,88 @@
+import json
+import pytest
+import catalog
+import dietary
+
+ENTRIES = {
+    "headache": {
+        "tea": "Peppermint Tea", "milkshake": "Mint Chocolate Shake",
+        "ingredients": ["Peppermint leaves", "Honey"], "synonyms": ["migraine", "Head Pain"],
+        "sustainability_score": 4.5
+    },
+    "tired": {"tea": "Green Tea", "coffee": "Espresso", "ingredients": ["Green tea leaves"]}
+}
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    """A small catalog and rules file, compiled into a temporary cache directory."""
+    path = tmp_path / "recommendations.json"
+    path.write_text(json.dumps(ENTRIES))
+    rules = tmp_path / "dietary.json"
+    rules.write_text(json.dumps({"ingredients": {"honey": ["vegan"]}}))
+    monkeypatch.setattr(catalog, "CATALOG_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(catalog, "CATALOG_PATH", str(path))
+    monkeypatch.setattr(catalog, "DIETARY_RULES_PATH", str(rules))
+    monkeypatch.setattr(catalog, "load_rules", lambda: dietary.load_rules(str(rules)))
+    monkeypatch.setattr(catalog, "_catalog", None)
+    monkeypatch.setattr(catalog, "_source_stat", None)
+    monkeypatch.setattr(catalog, "_checked_at", 0.0)
+    return path, rules
+
+def test_lookup_resolves_names_and_synonyms(source):
+    loaded = catalog.load_catalog(str(source[0]))
+
+    assert len(loaded) == 2
+    assert loaded.lookup("  Head   pain ") == "headache"
+    assert loaded.lookup("MIGRAINE") == "headache"
+    assert loaded.lookup("sore throat") is None
+    assert loaded.recommendation("headache")["ingredients"] == ["Peppermint leaves", "Honey"]
+
+def test_compiled_copy_is_reused(source, monkeypatch):
+    first = catalog.load_catalog(str(source[0]))
+
+    def recompile(records):
+        raise AssertionError("the compiled copy should have been used")
+
+    monkeypatch.setattr(catalog, "_compile_records", recompile)
+    second = catalog.load_catalog(str(source[0]))
+    assert second.version == first.version
+    assert second.lookup("migraine") == "headache"
+
+def test_version_changes_with_the_source_and_the_dietary_rules(source):
+    path, rules = source
+    original = catalog.load_catalog(str(path)).version
+
+    entries = dict(ENTRIES, headache=dict(ENTRIES["headache"], synonyms=["migraine", "sinus headache"]))
+    path.write_text(json.dumps(entries))
+    edited = catalog.load_catalog(str(path)).version
+    assert edited != original
+
+    rules.write_text(json.dumps({"ingredients": {"honey": ["vegan"], "espresso": ["vegan"]}}))
+    assert catalog.load_catalog(str(path)).version not in (original, edited)
+
+def test_get_catalog_reloads_a_changed_source(source, monkeypatch):
+    path, _ = source
+    before = catalog.get_catalog()
+    assert catalog.get_catalog() is before
+
+    path.write_text(json.dumps(dict(ENTRIES, stressed={"tea": "Chamomile Tea", "synonyms": ["anxious"]})))
+    monkeypatch.setattr(catalog, "_checked_at", 0.0)
+    after = catalog.get_catalog()
+    assert after.version != before.version
+    assert after.lookup("anxious") == "stressed"
+    # Callers holding the previous catalog keep a consistent view
+    assert before.lookup("anxious") is None
+
+def test_unreadable_source_keeps_the_current_catalog(source, monkeypatch):
+    path, _ = source
+    current = catalog.get_catalog()
+
+    path.write_text("{not json")
+    monkeypatch.setattr(catalog, "_checked_at", 0.0)
+    assert catalog.get_catalog() is current
+
+def test_duplicate_names_are_rejected(tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps([{"name": "Headache"}, {"name": "headache"}]))
+    with pytest.raises(catalog.CatalogError):
+        catalog._compile_records(catalog._read_source(str(path)))
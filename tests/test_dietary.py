@@ -0,0 +1,93 @@
+import pytest
+from catalog import Catalog, _compile_records
+from dietary import ALL_DIETS, DIET_BITS, DietaryRules, compatible, diet_mask, diet_names
+from fake_providers import fake_providers
+from result_cache import make_result_key
+
+RULES = DietaryRules(
+    ingredients={
+        "milk": ["vegan", "dairy-free"],
+        "almond milk": [],
+        "chocolate": ["vegan", "dairy-free"],
+        "dark chocolate": [],
+        "honey": ["vegan"],
+        "egg": ["vegan"],
+        "wheat": ["gluten-free"]
+    },
+    drinks={"Chocolate Milk Surprise": ["vegan", "vegetarian", "gluten-free", "dairy-free"]}
+)
+
+def test_diet_mask_normalizes_names():
+    assert diet_mask(["Vegan", "gluten_free", "Dairy Free"]) == (
+        DIET_BITS["vegan"] | DIET_BITS["gluten-free"] | DIET_BITS["dairy-free"]
+    )
+    assert diet_mask(None) == 0
+    assert diet_names(diet_mask(["vegetarian", "vegan"])) == ["vegan", "vegetarian"]
+    with pytest.raises(ValueError):
+        diet_mask(["paleo"])
+
+def test_compatible_needs_every_required_diet():
+    vegan_only = DIET_BITS["vegan"]
+    assert compatible(ALL_DIETS, diet_mask(["vegan", "gluten-free"]))
+    assert not compatible(vegan_only, diet_mask(["vegan", "gluten-free"]))
+    assert compatible(vegan_only, 0)
+
+def test_longest_phrase_overrides_its_parts():
+    vegan = diet_mask(["vegan"])
+
+    assert not compatible(RULES.mask("Whole Milk"), vegan)
+    assert compatible(RULES.mask("Almond milk"), vegan)
+    assert compatible(RULES.mask("70% dark chocolate"), vegan)
+    assert not compatible(RULES.mask("Milk chocolate"), vegan)
+    assert not compatible(RULES.mask("Free-range eggs"), vegan)
+    assert RULES.mask("Green tea leaves") == ALL_DIETS
+
+def test_explicit_drink_diets_override_the_phrases():
+    assert RULES.mask("chocolate milk surprise") == ALL_DIETS
+
+def test_violating_phrases_lists_each_once_in_order():
+    tip = "Whisk honey into warm milk, then add more honey and a wheat biscuit."
+
+    assert RULES.violating_phrases(tip, diet_mask(["vegan"])) == ["honey", "milk"]
+    assert RULES.violating_phrases(tip, diet_mask(["gluten-free"])) == ["wheat"]
+    assert RULES.violating_phrases(tip, 0) == []
+
+def test_catalog_precompiles_drink_and_ingredient_masks():
+    columns = _compile_records([
+        {"name": "headache", "tea": "Peppermint Tea", "milkshake": "Mint Chocolate Shake",
+         "coffee": "Almond Milk Latte", "ingredients": ["Honey", "Dark chocolate"]},
+        {"name": "tired", "tea": "Green Tea", "milkshake": "Banana Oat Shake"}
+    ])
+    catalog = Catalog(columns, version="test", rules=RULES)
+    vegan = diet_mask(["vegan"])
+
+    masks = catalog.drink_diets(["headache"])
+    assert compatible(masks["tea"], vegan)
+    assert compatible(masks["coffee"], vegan)
+    assert not compatible(masks["milkshake"], vegan)
+    # A merged drink suits only the diets all its parts suit
+    assert not compatible(catalog.drink_diets(["headache", "tired"])["milkshake"], vegan)
+    assert not compatible(catalog.ingredient_diet("honey"), vegan)
+    assert compatible(catalog.ingredient_diet("Dark chocolate"), vegan)
+
+def test_vegan_milkshake_is_swapped_for_a_compatible_drink():
+    import backend
+
+    with fake_providers():
+        plain = backend.resolve_recommendation("I have a headache", "milkshake")
+        vegan = backend.resolve_recommendation("I have a headache", "milkshake", dietary_restrictions=["Vegan"])
+
+    assert plain["drink"] == "Mint Chocolate Shake"
+    assert vegan["drink"] != "Mint Chocolate Shake"
+    assert vegan["drink_type"] != "milkshake"
+    assert vegan["drink"] == vegan[vegan["drink_type"]]
+    assert "Mint Chocolate Shake" in vegan["dietary_note"]
+    assert "Honey" not in vegan["ingredients"]
+    assert "leave out honey" in vegan["brewing_tip"]
+    assert vegan["dietary_restrictions"] == ["vegan"]
+
+def test_restrictions_are_part_of_the_result_key():
+    plain = make_result_key("headache", "milkshake", None, None, "en", None)
+
+    assert make_result_key("headache", "milkshake", None, None, "en", ["vegan"]) != plain
+    assert make_result_key("headache", "milkshake", None, None, "en", []) == plain
@@ -0,0 +1,29 @@
+from fake_providers import FaultProfile, fake_providers
+
+LONDON = (51.5074, -0.1278)
+
+def test_failed_store_search_is_none_and_not_cached():
+    import maps
+
+    with fake_providers({"overpass": FaultProfile(error_rate=1.0)}) as fakes:
+        assert maps.find_nearby_stores(*LONDON, ["Honey"]) is None
+        fakes.profiles["overpass"].error_rate = 0.0
+        assert isinstance(maps.find_nearby_stores(*LONDON, ["Honey"]), list)
+        assert fakes.calls.snapshot()["overpass"] == 2
+
+def test_failed_video_search_is_none_without_a_cached_copy():
+    import youtube
+
+    with fake_providers({"youtube": FaultProfile(error_rate=1.0)}):
+        assert youtube.search_youtube("ginger tea") is None
+
+def test_exhausted_quota_serves_stale_results_or_none(monkeypatch):
+    import youtube
+
+    with fake_providers():
+        videos = youtube.search_youtube("ginger tea")
+        assert videos
+        monkeypatch.setattr(youtube, "YOUTUBE_CACHE_TTL", 0)
+        monkeypatch.setattr(youtube, "YOUTUBE_DAILY_QUOTA", 0)
+        assert youtube.search_youtube("ginger tea") == videos
+        assert youtube.search_youtube("peppermint tea") is None
@@ -0,0 +1,106 @@
+import json
+import os
+import pytest
+from maps import _store_keywords
+from osm_stores import import_extract, read_extract, search_stores
+
+# Search centre; 0.0045 degrees of latitude is about 500 m
+LAT, LON = 51.5, -0.1
+
+def point(osm_id, lat, lon, **tags):
+    return {"type": "Feature", "id": f"node/{osm_id}", "properties": tags,
+            "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+
+FEATURES = [
+    point(1, LAT + 0.0045, LON, name="Leaf & Cup", shop="tea",
+          **{"addr:street": "High Street", "addr:housenumber": "12"}),
+    point(2, LAT - 0.0045, LON, name="Corner Shop", shop="convenience"),
+    point(3, LAT, LON + 0.007, name="Farm Stand", organic="only"),
+    point(4, LAT + 0.045, LON, name="Far Supermarket", shop="supermarket"),
+    # Inside the bounding box of a 3 km search but about 3.04 km away
+    point(5, LAT + 0.02, LON + 0.03, name="Box Corner Market", shop="supermarket"),
+    point(6, LAT, LON - 0.0045, shop="tea"),
+    point(7, LAT, LON - 0.0045, name="Park Bench", amenity="bench"),
+    {"type": "Feature", "id": "way/8", "properties": {"name": "Brew Bar", "amenity": "cafe"},
+     "geometry": {"type": "Polygon", "coordinates": [[
+         [LON + 0.001, LAT + 0.001], [LON + 0.003, LAT + 0.001], [LON + 0.003, LAT + 0.003],
+         [LON + 0.001, LAT + 0.003], [LON + 0.001, LAT + 0.001]
+     ]]}}
+]
+
+def write_extract(path, features):
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return str(path)
+
+@pytest.fixture
+def index(tmp_path):
+    source = write_extract(tmp_path / "extract.geojson", FEATURES)
+    path = str(tmp_path / "index" / "stores.sqlite3")
+    assert import_extract(source, path=path) == 6
+    return source, path
+
+def names(stores):
+    return [store["name"] for store in stores]
+
+def test_unnamed_and_unwanted_elements_are_not_read(tmp_path):
+    source = write_extract(tmp_path / "extract.geojson", FEATURES)
+    elements = {osm_id: (osm_type, lat, lon) for osm_type, osm_id, lat, lon, _ in read_extract(source)}
+
+    assert sorted(elements) == [1, 2, 3, 4, 5, 8]
+    osm_type, lat, lon = elements[8]
+    assert osm_type == "way"
+    # A building is indexed at its centroid
+    assert lat == pytest.approx(LAT + 0.0018)
+    assert lon == pytest.approx(LON + 0.0018)
+
+def test_overpass_responses_are_read(tmp_path):
+    path = tmp_path / "overpass.json"
+    path.write_text(json.dumps({"elements": [
+        {"type": "node", "id": 1, "lat": LAT, "lon": LON, "tags": {"name": "Leaf & Cup", "shop": "tea"}},
+        {"type": "way", "id": 2, "center": {"lat": LAT, "lon": LON}, "tags": {"name": "Brew Bar", "amenity": "cafe"}},
+        {"type": "way", "id": 3, "tags": {"name": "No Centre", "shop": "tea"}}
+    ]}))
+
+    assert [(t, i) for t, i, _, _, _ in read_extract(str(path))] == [("node", 1), ("way", 2)]
+
+def test_search_keeps_stores_within_the_radius(index):
+    _, path = index
+    stores = search_stores(LAT, LON, _store_keywords([]), path=path)
+
+    assert names(stores) == ["Leaf & Cup", "Brew Bar", "Corner Shop"]
+    assert stores[0] == {
+        "name": "Leaf & Cup", "latitude": LAT + 0.0045, "longitude": LON,
+        "address": "12 High Street", "type": "Tea"
+    }
+    assert names(search_stores(LAT, LON, _store_keywords([]), radius=10000, path=path)) == [
+        "Leaf & Cup", "Brew Bar", "Corner Shop", "Far Supermarket", "Box Corner Market"
+    ]
+    assert names(search_stores(LAT, LON, _store_keywords([]), radius=300, path=path)) == ["Brew Bar"]
+
+def test_ingredient_keywords_match_tag_keys(index):
+    _, path = index
+
+    assert "Farm Stand" not in names(search_stores(LAT, LON, _store_keywords(["Ginger"]), path=path))
+    assert "Farm Stand" in names(search_stores(LAT, LON, _store_keywords(["Honey"]), path=path))
+
+def test_unchanged_extract_is_skipped_unless_forced(index):
+    source, path = index
+
+    assert import_extract(source, path=path) is None
+    assert import_extract(source, path=path, force=True) == 6
+
+def test_reimport_is_seen_by_open_connections(index, tmp_path):
+    source, path = index
+    assert "New Tea Room" not in names(search_stores(LAT, LON, ["tea"], path=path))
+
+    write_extract(tmp_path / "extract.geojson", FEATURES + [
+        point(9, LAT, LON + 0.001, name="New Tea Room", shop="tea")
+    ])
+    stat = os.stat(source)
+    os.utime(source, (stat.st_atime, stat.st_mtime + 5))
+    assert import_extract(source, path=path) == 7
+    assert "New Tea Room" in names(search_stores(LAT, LON, ["tea"], path=path))
+    assert not os.path.exists(path + ".tmp")
+
+def test_missing_index_is_a_failed_lookup(tmp_path):
+    assert search_stores(LAT, LON, ["tea"], path=str(tmp_path / "missing.sqlite3")) is None
@@ -0,0 +1,95 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fake_providers import FaultProfile, fake_providers
+from singleflight import SingleFlight
+from speculation import Speculator
+
+CONCURRENCY = 16
+
+@pytest.fixture
+def no_speculation(monkeypatch):
+    # Prefetching other drink types would add Cohere calls of its own
+    import backend
+
+    monkeypatch.setattr(backend, "speculator", Speculator(workers=0))
+
+def test_concurrent_identical_requests_call_each_provider_once(no_speculation):
+    import backend
+    import language_support
+
+    # Slow providers, so every request arrives while the first is in flight
+    profiles = {name: FaultProfile(latency_ms=200) for name in ["cohere", "gemini", "openweather", "googletrans"]}
+    with fake_providers(profiles) as fakes:
+        def request(_):
+            recommendation = backend.generate_response("I feel stressed", "tea", 51.5074, -0.1278)
+            return recommendation, language_support.translate_text(recommendation["personalized_message"], "fr")
+
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            results = list(executor.map(request, range(CONCURRENCY)))
+        calls = fakes.calls.snapshot()
+
+    assert all(recommendation["status"] == "success" for recommendation, _ in results)
+    assert len({translation for _, translation in results}) == 1
+    assert calls and all(count == 1 for count in calls.values()), calls
+
+def test_waiters_share_the_leaders_result():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return {"value": 42}
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+        leader = executor.submit(group.do, "key", slow)
+        started.wait(5)
+        waiters = [executor.submit(group.do, "key", slow) for _ in range(CONCURRENCY - 1)]
+        while group._calls["key"].waiters < CONCURRENCY - 1:
+            time.sleep(0.01)
+        release.set()
+        results = [leader.result()] + [waiter.result() for waiter in waiters]
+
+    assert len(runs) == 1
+    assert all(result == {"value": 42} for result in results)
+    assert group.in_flight() == 0
+
+def test_waiters_receive_the_leaders_error():
+    group = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("upstream down")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        leader = executor.submit(group.do, "key", failing)
+        started.wait(5)
+        waiter = executor.submit(group.do, "key", failing)
+        while group._calls["key"].waiters < 1:
+            time.sleep(0.01)
+        release.set()
+        for future in (leader, waiter):
+            with pytest.raises(RuntimeError, match="upstream down"):
+                future.result()
+    assert group.in_flight() == 0
+
+def test_concurrent_youtube_misses_reserve_quota_once():
+    import youtube
+
+    with fake_providers({"youtube": FaultProfile(latency_ms=200)}) as fakes:
+        with ThreadPoolExecutor(max_workers=CONCURRENCY) as executor:
+            results = list(executor.map(lambda _: youtube.search_youtube("ginger tea"), range(CONCURRENCY)))
+        usage = youtube.get_quota_usage()
+        calls = fakes.calls.snapshot()
+
+    assert all(result == results[0] and result for result in results)
+    assert calls == {"youtube": 1}
+    assert usage["used"] == youtube.SEARCH_COST
@@ -0,0 +1,68 @@
+import re
+import pytest
+from catalog import Catalog, _compile_records
+from symptom_extractor import SymptomExtractor, _trie_pattern, get_extractor, segment_text
+
+RECORDS = [
+    {"name": "headache", "synonyms": ["migraine", "head pain"]},
+    {"name": "stress", "synonyms": ["stressed", "can't sleep"]},
+    {"name": "sore throat", "synonyms": ["scratchy throat"]},
+    {"name": "tired", "synonyms": ["exhausted"]},
+    {"name": "upset stomach", "synonyms": ["stomach ache", "nauseous"]}
+]
+
+@pytest.fixture(scope="module")
+def extractor():
+    return SymptomExtractor(Catalog(_compile_records(RECORDS), version="test"))
+
+def test_negation_covers_only_its_own_clause(extractor):
+    intent = extractor.extract("Not stressed, just can't sleep")
+
+    assert intent.phrases == [("stressed", True), ("cant sleep", False)]
+    # "can't sleep" is a synonym of stress, so stress is reported after all
+    assert intent.symptoms == ["stress"]
+    assert intent.negated == []
+    assert intent.residual_text() == "just cant sleep"
+
+def test_negated_symptom_is_kept_apart(extractor):
+    intent = extractor.extract("not stressed, just exhausted")
+
+    assert intent.symptoms == ["tired"]
+    assert intent.negated == ["stress"]
+    assert "stressed" not in intent.residual_text()
+
+def test_negation_window_is_limited(extractor):
+    assert extractor.extract("no idea why but i feel so exhausted").negated == []
+    assert extractor.extract("i dont have a migraine").negated == ["headache"]
+
+def test_compound_description(extractor):
+    intent = extractor.extract("Severe migraine and a scratchy throat for 3 days, no stomach ache")
+
+    assert intent.symptoms == ["headache", "sore throat"]
+    assert intent.negated == ["upset stomach"]
+    assert intent.severity == "severe"
+    assert intent.duration == "for 3 days"
+    assert intent.body_parts == ["throat", "stomach"]
+
+def test_strongest_severity_wins(extractor):
+    assert extractor.extract("a bit tired").severity == "mild"
+    assert extractor.extract("slightly tired, pretty stressed").severity == "moderate"
+    assert extractor.extract("i feel fine").severity == "mild"
+
+def test_longest_phrase_wins():
+    pattern = re.compile(r"\b(?:" + _trie_pattern(["sore", "sore throat", "sorrow"]) + r")\b")
+
+    assert [m.group() for m in pattern.finditer("sore throat and sorrow")] == ["sore throat", "sorrow"]
+
+def test_segments_split_on_conjunctions():
+    assert segment_text("headache and stress after a long day") == ["headache", "stress after a long day"]
+    assert segment_text("tired, nauseous & stressed.") == ["tired", "nauseous", "stressed"]
+
+def test_extractor_is_rebuilt_for_a_new_catalog_version():
+    first = get_extractor(Catalog(_compile_records(RECORDS), version="v1"))
+    assert get_extractor(Catalog(_compile_records(RECORDS), version="v1")) is first
+
+    records = RECORDS + [{"name": "cold", "synonyms": ["runny nose"]}]
+    second = get_extractor(Catalog(_compile_records(records), version="v2"))
+    assert second is not first
+    assert second.extract("runny nose").symptoms == ["cold"]
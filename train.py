@@ -97,6 +97,12 @@ Instructions:
 Keep your response friendly, informative, and under 150 words. Balance traditional wisdom with scientific backing.
 """
 
+# Appended to the personalized message prompt when several ailments were merged
+COHERE_COMBINED_AILMENTS_NOTE = """
+The person reported several complaints: {ailments}. Address each of them and explain how the
+suggested drinks work together.
+"""
+
 # Weather-based recommendations
 WEATHER_RECOMMENDATIONS = {
     "cold": {
@@ -2,10 +2,25 @@
 
 import json
 import os
-from datetime import datetime
+from collections import Counter
+from datetime import datetime, timezone
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from analytics_store import record_recommendation
+from drink_similarity import similar_drinks
+
+# Raw history entries kept per user; older ones are rolled into daily aggregates
+HISTORY_RAW_ENTRIES = int(os.getenv("HISTORY_RAW_ENTRIES", 100))
+
+def _empty_rollup():
+    return {
+        'count': 0,
+        'ailments': {},
+        'drinks': {},
+        'sustainability_sum': 0,
+        'weather_adjusted': 0
+    }
 
 class UserProfile:
     def __init__(self, user_id):
@@ -18,7 +33,12 @@ class UserProfile:
             'cultural_preferences': []
         }
         self.recommendation_history = []
+        self.daily_rollups = {}
         self.load_profile()
+        self._apply_retention()
+        self.drink_counts = Counter(entry['drink'] for entry in self.recommendation_history)
+        for rollup in self.daily_rollups.values():
+            self.drink_counts.update(rollup['drinks'])
 
     def load_profile(self):
         """Load user profile from file if it exists."""
@@ -32,6 +52,7 @@ class UserProfile:
                     data = json.load(f)
                     self.preferences = data.get('preferences', self.preferences)
                     self.recommendation_history = data.get('history', [])
+                    self.daily_rollups = data.get('daily_rollups', {})
             except:
                 print(f"Error loading profile for user {self.user_id}")
 
@@ -43,7 +64,8 @@ class UserProfile:
         
         data = {
             'preferences': self.preferences,
-            'history': self.recommendation_history
+            'history': self.recommendation_history,
+            'daily_rollups': self.daily_rollups
         }
         
         try:
@@ -59,45 +81,99 @@ class UserProfile:
 
     def add_recommendation(self, recommendation):
         """Add a recommendation to history."""
+        now = datetime.now()
         history_entry = {
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': now.isoformat(),
             'ailment': recommendation['ailment'],
             'drink': recommendation['drink'],
             'sustainability_score': recommendation.get('sustainability_score', 0),
             'weather_adjusted': recommendation.get('weather_adjusted', False)
         }
         self.recommendation_history.append(history_entry)
+        self.drink_counts[history_entry['drink']] += 1
+        self._apply_retention()
         self.save_profile()
+        # Cross-user dashboards read from the shared analytics store; the same
+        # instant as the history entry lets a later backfill recognise the event
+        record_recommendation(self.user_id, history_entry, now.astimezone(timezone.utc))
+
+    def _apply_retention(self):
+        """Roll history entries beyond the newest HISTORY_RAW_ENTRIES into daily aggregates."""
+        excess = len(self.recommendation_history) - HISTORY_RAW_ENTRIES
+        if excess <= 0:
+            return
+        for entry in self.recommendation_history[:excess]:
+            rollup = self.daily_rollups.setdefault(entry['timestamp'][:10], _empty_rollup())
+            rollup['count'] += 1
+            rollup['ailments'][entry['ailment']] = rollup['ailments'].get(entry['ailment'], 0) + 1
+            rollup['drinks'][entry['drink']] = rollup['drinks'].get(entry['drink'], 0) + 1
+            rollup['sustainability_sum'] += entry.get('sustainability_score', 0)
+            rollup['weather_adjusted'] += int(bool(entry.get('weather_adjusted', False)))
+        del self.recommendation_history[:excess]
+
+    def _daily_totals(self):
+        """Per-day aggregates over the rolled-up and raw history combined."""
+        days = {day: {**rollup, 'ailments': dict(rollup['ailments'])} for day, rollup in self.daily_rollups.items()}
+        for entry in self.recommendation_history:
+            day = days.setdefault(entry['timestamp'][:10], _empty_rollup())
+            day['count'] += 1
+            day['ailments'][entry['ailment']] = day['ailments'].get(entry['ailment'], 0) + 1
+            day['sustainability_sum'] += entry.get('sustainability_score', 0)
+            day['weather_adjusted'] += int(bool(entry.get('weather_adjusted', False)))
+        return days
 
     def get_recommendation_stats(self):
         """Get statistics about user's recommendations."""
-        if not self.recommendation_history:
+        if not self.recommendation_history and not self.daily_rollups:
             return None
             
-        df = pd.DataFrame(self.recommendation_history)
+        days = self._daily_totals().values()
+        total = sum(day['count'] for day in days)
+        ailments = Counter()
+        for day in days:
+            ailments.update(day['ailments'])
         
         stats = {
-            'total_recommendations': len(df),
-            'unique_ailments': len(df['ailment'].unique()),
-            'avg_sustainability': df['sustainability_score'].mean(),
-            'most_common_ailment': df['ailment'].mode().iloc[0] if not df.empty else None,
-            'weather_adjusted_percent': (df['weather_adjusted'].sum() / len(df)) * 100
+            'total_recommendations': total,
+            'unique_ailments': len(ailments),
+            'avg_sustainability': sum(day['sustainability_sum'] for day in days) / total,
+            'most_common_ailment': ailments.most_common(1)[0][0] if ailments else None,
+            'weather_adjusted_percent': (sum(day['weather_adjusted'] for day in days) / total) * 100
         }
         
         return stats
 
     def generate_insights_visualizations(self):
-        """Generate visualization of user's recommendation history."""
-        if not self.recommendation_history:
+        """
+        Generate visualization of user's recommendation history.
+
+        Rolled-up days appear as one point at their average sustainability score.
+        """
+        if not self.recommendation_history and not self.daily_rollups:
             return None
             
-        df = pd.DataFrame(self.recommendation_history)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        days = self._daily_totals()
+        ailments = Counter()
+        for day in days.values():
+            ailments.update(day['ailments'])
+        total = sum(day['count'] for day in days.values())
+        weather_adjusted = sum(day['weather_adjusted'] for day in days.values())
+        
+        df = pd.DataFrame(
+            [
+                {'timestamp': day, 'sustainability_score': rollup['sustainability_sum'] / rollup['count']}
+                for day, rollup in sorted(self.daily_rollups.items())
+            ] + [
+                {'timestamp': entry['timestamp'], 'sustainability_score': entry.get('sustainability_score', 0)}
+                for entry in self.recommendation_history
+            ]
+        )
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
         
         # Ailment distribution pie chart
         ailment_dist = px.pie(
-            df, 
-            names='ailment',
+            names=list(ailments), 
+            values=list(ailments.values()),
             title='Distribution of Ailments'
         )
         
@@ -114,8 +190,8 @@ class UserProfile:
             go.Bar(
                 x=['Weather-Adjusted', 'Standard'],
                 y=[
-                    df['weather_adjusted'].sum(),
-                    len(df) - df['weather_adjusted'].sum()
+                    weather_adjusted,
+                    total - weather_adjusted
                 ]
             )
         ])
@@ -128,22 +204,37 @@ class UserProfile:
         }
 
     def get_personalized_suggestions(self):
-        """Generate personalized suggestions based on user history."""
-        if not self.recommendation_history:
+        """
+        Generate personalized suggestions based on user history.
+
+        The user's favourite drinks come first, followed by untried drinks that
+        other users were recommended alongside them, from the precomputed
+        drink similarity index.
+        """
+        if not self.drink_counts:
             return []
             
-        df = pd.DataFrame(self.recommendation_history)
-        
         # Find most effective remedies
-        effectiveness_score = df.groupby('drink').size()
-        top_drinks = effectiveness_score.nlargest(3)
+        top_drinks = self.drink_counts.most_common(3)
         
         suggestions = []
-        for drink, count in top_drinks.items():
+        for drink, count in top_drinks:
             suggestions.append({
                 'drink': drink,
                 'times_used': int(count),
                 'message': f"You've found {drink} helpful {count} times."
             })
+        
+        # Drinks similar to the favourites that the user hasn't tried yet
+        suggested = set(self.drink_counts)
+        for drink, _ in top_drinks:
+            for other, score in similar_drinks(drink, k=1, exclude=suggested):
+                suggested.add(other)
+                suggestions.append({
+                    'drink': other,
+                    'similar_to': drink,
+                    'similarity': round(score, 3),
+                    'message': f"People who found {drink} helpful also liked {other}."
+                })
             
-        return suggestions 
+        return suggestions
@@ -2,15 +2,206 @@
 
 import requests
 import os
+import json
+import sqlite3
+import time
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
+from metrics import provider_call, record_cache
+from cache import Cache, SQLiteBackend, get_backend
+from singleflight import flight
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Load API key from .env
 load_dotenv()
 YOUTUBE_API_KEY = os.getenv("GOOGLE_CLOUD_API_KEY")
+YOUTUBE_API_URL = os.getenv("YOUTUBE_API_URL", "https://www.googleapis.com/youtube/v3")
+
+# Quota ledger, shared by all worker processes on the host, and the search
+# results whenever the shared cache is the per-process memory backend
+YOUTUBE_CACHE_PATH = os.getenv("YOUTUBE_CACHE_PATH", os.path.join(BASE_DIR, "cache", "youtube.sqlite3"))
+
+# Search results are fresh for YOUTUBE_CACHE_TTL seconds and kept for
+# YOUTUBE_STALE_TTL, to be served when the quota runs out or the API fails
+YOUTUBE_CACHE_TTL = int(os.getenv("YOUTUBE_CACHE_TTL", 7 * 24 * 60 * 60))
+YOUTUBE_STALE_TTL = int(os.getenv("YOUTUBE_STALE_TTL", 30 * 24 * 60 * 60))
+
+# Daily Data API quota, the cost of one search call, and the units held back
+# for other API consumers. Quota resets at midnight Pacific time.
+YOUTUBE_DAILY_QUOTA = int(os.getenv("YOUTUBE_DAILY_QUOTA", 10000))
+YOUTUBE_QUOTA_RESERVE = int(os.getenv("YOUTUBE_QUOTA_RESERVE", 500))
+SEARCH_COST = 100
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles")
 
-def search_youtube(query, max_results=3):
+# Partial response projection: only the fields search_youtube reads
+SEARCH_FIELDS = "items(id/videoId,snippet/title,snippet/thumbnails/high/url)"
+
+def _connect():
+    directory = os.path.dirname(YOUTUBE_CACHE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(YOUTUBE_CACHE_PATH, timeout=5)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS quota_ledger ("
+        "day TEXT PRIMARY KEY, units INTEGER NOT NULL)"
+    )
+    return conn
+
+@contextmanager
+def _open_cache():
+    """Open the ledger database, committing on success and always closing."""
+    conn = _connect()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+_local_backend = None
+
+def _search_cache():
+    """
+    The search result cache: the shared cache if it outlives the process,
+    otherwise SQLite at YOUTUBE_CACHE_PATH, as results cost quota to refetch.
+    """
+    global _local_backend
+    backend = get_backend()
+    if not backend.shared:
+        if _local_backend is None or _local_backend.path != YOUTUBE_CACHE_PATH:
+            _local_backend = SQLiteBackend(YOUTUBE_CACHE_PATH)
+        backend = _local_backend
+    return Cache("youtube_search", ttl=YOUTUBE_STALE_TTL, backend=backend)
+
+def _cache_key(query, max_results):
+    return f"{max_results}|{' '.join(query.lower().split())}"
+
+def _quota_day():
+    return datetime.now(QUOTA_TIMEZONE).date().isoformat()
+
+def _get_cached(query, max_results):
+    """Return (videos, fetched_at) for a cached search, or (None, None)."""
+    entry = _search_cache().get(_cache_key(query, max_results))
+    if entry:
+        return entry["videos"], entry["fetched_at"]
+    return None, None
+
+def _set_cached(query, max_results, videos):
+    _search_cache().set(_cache_key(query, max_results), {"videos": videos, "fetched_at": time.time()})
+
+def reserve_quota(units=SEARCH_COST):
+    """
+    Atomically reserve quota units for today's API calls.
+
+    Returns:
+        bool: False if the reservation would dip into the held-back reserve.
+    """
+    try:
+        conn = _connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            day = _quota_day()
+            row = conn.execute("SELECT units FROM quota_ledger WHERE day = ?", (day,)).fetchone()
+            used = row[0] if row else 0
+            if used + units > YOUTUBE_DAILY_QUOTA - YOUTUBE_QUOTA_RESERVE:
+                conn.rollback()
+                return False
+            conn.execute(
+                "INSERT INTO quota_ledger (day, units) VALUES (?, ?) "
+                "ON CONFLICT(day) DO UPDATE SET units = units + excluded.units",
+                (day, units)
+            )
+            conn.commit()
+            return True
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"YouTube quota ledger error: {e}")
+        return True
+
+def _mark_quota_exhausted():
+    """Record that the API reported the daily quota as exceeded."""
+    try:
+        with _open_cache() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO quota_ledger (day, units) VALUES (?, ?)",
+                (_quota_day(), YOUTUBE_DAILY_QUOTA)
+            )
+    except sqlite3.Error as e:
+        print(f"YouTube quota ledger error: {e}")
+
+def get_quota_usage():
+    """
+    Get today's quota usage from the ledger.
+    """
+    try:
+        with _open_cache() as conn:
+            row = conn.execute(
+                "SELECT units FROM quota_ledger WHERE day = ?", (_quota_day(),)
+            ).fetchone()
+        used = row[0] if row else 0
+    except sqlite3.Error as e:
+        print(f"YouTube quota ledger error: {e}")
+        used = 0
+    return {
+        "day": _quota_day(),
+        "used": used,
+        "limit": YOUTUBE_DAILY_QUOTA,
+        "remaining": max(YOUTUBE_DAILY_QUOTA - used, 0)
+    }
+
+def _fetch_videos(query, max_results):
+    """
+    Call the YouTube search endpoint.
+
+    Returns:
+        list: Videos on success, or None if the call failed.
+    """
+    url = f"{YOUTUBE_API_URL}/search"
+    params = {
+        "part": "snippet",
+        "q": query,
+        "type": "video",
+        "maxResults": max_results,
+        "fields": SEARCH_FIELDS,
+        "key": YOUTUBE_API_KEY
+    }
+    with provider_call("youtube", "search") as call:
+        response = requests.get(url, params=params, timeout=10)
+        if response.status_code != 200:
+            call.fail()
+    if response.status_code == 200:
+        data = response.json()
+        videos = []
+        for item in data.get("items", []):
+            video = {
+                "title": item["snippet"]["title"],
+                "url": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
+                "thumbnail": item["snippet"]["thumbnails"]["high"]["url"]
+            }
+            videos.append(video)
+        return videos
+
+    if response.status_code == 403 and "quotaExceeded" in response.text:
+        print("YouTube API quota exceeded; serving cached results until reset.")
+        _mark_quota_exhausted()
+    else:
+        print(f"YouTube API error: HTTP {response.status_code}")
+    return None
+
+def search_youtube(query, max_results=3, force_refresh=False):
     """
     Search YouTube for videos related to the query.
+
+    Results are cached across workers for YOUTUBE_CACHE_TTL seconds. Once the daily
+    quota is close to exhausted, stale cached results are served instead of
+    calling the API.
+
+    Returns:
+        list: Videos, or None if the search failed and nothing was cached.
     """
     if not YOUTUBE_API_KEY:
         print("Warning: YouTube API key not found. Using mock data.")
@@ -27,30 +218,72 @@ def search_youtube(query, max_results=3):
                 "thumbnail": "https://via.placeholder.com/480x360"
             }
         ]
-    
+
+    cached, fetched_at = _get_cached(query, max_results)
+    fresh = cached is not None and time.time() - fetched_at < YOUTUBE_CACHE_TTL
+    if not force_refresh:
+        record_cache("youtube", fresh)
+        if fresh:
+            return cached
+
+    # Concurrent misses for one query share a single quota reservation and call
+    return flight.do(
+        ("youtube_search", _cache_key(query, max_results), force_refresh),
+        _refresh, query, max_results, force_refresh
+    )
+
+def _refresh(query, max_results, force_refresh):
+    cached, fetched_at = _get_cached(query, max_results)
+    # A caller that missed just before the previous refresh stored its results lands here
+    if not force_refresh and cached is not None and time.time() - fetched_at < YOUTUBE_CACHE_TTL:
+        return cached
+
+    if not reserve_quota(SEARCH_COST):
+        print("YouTube quota nearly exhausted; serving cached results.")
+        return cached
+
     try:
-        url = "https://www.googleapis.com/youtube/v3/search"
-        params = {
-            "part": "snippet",
-            "q": query,
-            "type": "video",
-            "maxResults": max_results,
-            "key": YOUTUBE_API_KEY
-        }
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            videos = []
-            for item in data.get("items", []):
-                video = {
-                    "title": item["snippet"]["title"],
-                    "url": f"https://www.youtube.com/watch?v={item['id']['videoId']}",
-                    "thumbnail": item["snippet"]["thumbnails"]["high"]["url"]
-                }
-                videos.append(video)
+        videos = _fetch_videos(query, max_results)
+        if videos is not None:
+            _set_cached(query, max_results, videos)
             return videos
     except Exception as e:
         print(f"YouTube API error: {e}")
-    
-    # Return empty list if there was an error
-    return []
+
+    # Serve stale results rather than nothing if the API call failed
+    return cached
+
+def prewarm_cache(keywords=None, max_results=3, force=False):
+    """
+    Fill the search cache for every catalog keyword.
+
+    Args:
+        keywords (list): Queries to warm; defaults to every catalog youtube_keywords.
+        max_results (int): Result count, matching the callers' max_results.
+        force (bool): Refresh entries that are still fresh.
+
+    Returns:
+        int: Number of queries that now have cached results.
+    """
+    if keywords is None:
+        from catalog import get_catalog
+        keywords = sorted(set(get_catalog().columns["youtube_keywords"]) - {""})
+
+    warmed = 0
+    for keyword in keywords:
+        search_youtube(keyword, max_results=max_results, force_refresh=force)
+        if _get_cached(keyword, max_results)[0] is not None:
+            warmed += 1
+    return warmed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="YouTube search cache maintenance")
+    parser.add_argument("--prewarm", action="store_true", help="cache results for every catalog keyword")
+    parser.add_argument("--force", action="store_true", help="refresh entries that are still fresh")
+    parser.add_argument("--max-results", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.prewarm:
+        warmed = prewarm_cache(max_results=args.max_results, force=args.force)
+        print(f"Cached results for {warmed} keywords")
+    print(json.dumps(get_quota_usage()))